@@ -0,0 +1,46 @@
+"""Measure throughput of the Consumer stage for different numbers of workers.
+Queue A is filled before workers start, so only resizing and filtering is measured.
+
+Run from the repository root:
+
+    python -m benchmarks.consumer_scaling --frames 200 --workers 1 2 4 8
+"""
+import argparse
+import os
+import queue
+import time
+from src.source import Source
+from src.consumerpool import ConsumerPool
+
+
+def run(frame_count, workers, picture_shape):
+    """Process frame_count frames with the pool and return frames per second."""
+    source = Source((*picture_shape, 3))
+    queue_a = queue.Queue()
+    queue_b = queue.Queue()
+    for _ in range(frame_count):
+        queue_a.put(source.get_data())
+    pool = ConsumerPool(
+        target=(queue_a, queue_b),
+        sigkill=queue.Queue(),
+        workers=workers,
+        frame_count=frame_count,
+    )
+    start = time.perf_counter()
+    pool.start()
+    pool.join()
+    return frame_count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument("--shape", type=int, nargs=2, default=(768, 1024))
+    args = parser.parse_args()
+
+    base = None
+    for workers in args.workers:
+        fps = run(args.frames, workers, tuple(args.shape))
+        base = base or fps
+        print(f"workers: {workers:3d}  {fps:8.1f} fps  speedup: {fps / base:.2f}x")
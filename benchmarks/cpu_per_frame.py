@@ -0,0 +1,66 @@
+"""Measure CPU time spent per frame by the whole Producer -> Consumer -> SavePicture
+pipeline. Frames are produced at a fixed rate (``--delay``), so any CPU time above
+the cost of the real work is time wasted by threads waiting for data.
+
+Run from the repository root:
+
+    python -m benchmarks.cpu_per_frame --frames 100 --delay 0.05
+"""
+import argparse
+import queue
+import shutil
+import tempfile
+import time
+from src.producer import ProducerThread
+from src.consumer import ConsumerThread
+from src.savepicture import SavePictureThread
+
+
+def run(frame_count, delay_frame, picture_shape):
+    """Run the pipeline once and return (wall time, CPU time) in seconds."""
+    path = tempfile.mkdtemp() + "/"
+    queue_errors = queue.Queue()
+    queue_a = queue.Queue(maxsize=102)
+    queue_b = queue.Queue(maxsize=102)
+    threads = [
+        ProducerThread(
+            target=queue_a,
+            sigkill=queue_errors,
+            frame_count=frame_count,
+            picture_shape=picture_shape,
+            delay_frame=delay_frame,
+        ),
+        ConsumerThread(
+            target=(queue_a, queue_b),
+            sigkill=queue_errors,
+            frame_count=frame_count,
+        ),
+        SavePictureThread(
+            target=queue_b,
+            sigkill=queue_errors,
+            path=path,
+            frame_count=frame_count,
+        ),
+    ]
+    wall, cpu = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    shutil.rmtree(path)
+    return wall, cpu
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--shape", type=int, nargs=2, default=(768, 1024))
+    args = parser.parse_args()
+
+    wall, cpu = run(args.frames, args.delay, tuple(args.shape))
+    print(f"frames:            {args.frames}")
+    print(f"wall time:         {wall:.3f} s")
+    print(f"CPU time:          {cpu:.3f} s")
+    print(f"CPU time / frame:  {1000 * cpu / args.frames:.2f} ms")
@@ -0,0 +1,238 @@
+"""Reproducible benchmark suite for the Producer -> Consumer -> SavePicture pipeline.
+
+Every combination of parameters is run in a fresh process, so peak RSS of one run
+does not depend on the others. For each run, throughput of every stage in isolation
+(Source, Consumer, SavePicture) and of the whole pipeline is measured, together with
+peak RSS and CPU utilisation. SavePicture is measured also with a Journal, to show
+the cost of checkpoints. Frames are generated by Source, so no data are needed.
+With --source-modes ring (or generator, bytes), the fast synthetic Source is used, so
+fps of the pipeline is not limited by generating random frames.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --output results.json --baseline benchmarks/baseline.json
+
+With --baseline, runs in which fps of any stage dropped by more than --tolerance
+are reported and the script exits with status 1. benchmarks/baseline.json holds
+results of the default configuration; compare only with results of the same machine.
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from src.source import Source
+from src.producer import ProducerThread
+from src.consumerpool import ConsumerPool
+from src.savepicture import SavePictureThread
+from src.journal import Journal
+
+
+def _consume(frames, config):
+    queue_a, queue_b = queue.Queue(), queue.Queue()
+    for frame in frames:
+        queue_a.put(frame)
+    pool = ConsumerPool(
+        target=(queue_a, queue_b),
+        sigkill=queue.Queue(),
+        workers=config["workers"],
+        frame_count=len(frames),
+        resize_ratio=config["resize_ratio"],
+        kernel=config["kernel"],
+    )
+    start = time.perf_counter()
+    pool.start()
+    pool.join()
+    return time.perf_counter() - start, [queue_b.get() for _ in range(queue_b.qsize())]
+
+
+def _save(frames, path, journal=False):
+    queue_b = queue.Queue()
+    for frame in frames:
+        queue_b.put(frame)
+    save_pic = SavePictureThread(
+        target=queue_b,
+        sigkill=queue.Queue(),
+        path=path,
+        frame_count=len(frames),
+        journal=Journal(os.path.join(path, "journal.txt")) if journal else None,
+    )
+    start = time.perf_counter()
+    save_pic.start()
+    save_pic.join()
+    if journal:
+        save_pic.journal.close()
+    return time.perf_counter() - start
+
+
+def _pipeline(config, path):
+    queue_errors = queue.Queue()
+    queue_a = queue.Queue(maxsize=config["maxsize"])
+    queue_b = queue.Queue(maxsize=config["maxsize"])
+    threads = [
+        ProducerThread(
+            target=queue_a,
+            sigkill=queue_errors,
+            frame_count=config["frames"],
+            picture_shape=tuple(config["shape"]),
+            delay_frame=0,
+            source=Source((*config["shape"], 3), mode=config["source"]),
+        ),
+        ConsumerPool(
+            target=(queue_a, queue_b),
+            sigkill=queue_errors,
+            workers=config["workers"],
+            frame_count=config["frames"],
+            resize_ratio=config["resize_ratio"],
+            kernel=config["kernel"],
+        ),
+        SavePictureThread(
+            target=queue_b, sigkill=queue_errors, path=path, frame_count=config["frames"]
+        ),
+    ]
+    wall, cpu = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def run(config: dict) -> dict:
+    """Run one configuration. It is called in a fresh process.
+
+    Args:
+        config (dict): Parameters of the run.
+
+    Returns:
+        dict: Measured values.
+    """
+    count = config["frames"]
+    frame_bytes = config["shape"][0] * config["shape"][1] * 3
+    root = tempfile.mkdtemp()
+    try:
+        source = Source((*config["shape"], 3), mode=config["source"])
+        start = time.perf_counter()
+        frames = [source.get_data() for _ in range(count)]
+        source_time = time.perf_counter() - start
+        consumer_time, processed = _consume(frames, config)
+        del frames
+        save_time = _save(processed, os.path.join(root, "save", ""))
+        journal_time = _save(processed, os.path.join(root, "journal", ""), journal=True)
+        del processed
+        wall, cpu = _pipeline(config, os.path.join(root, "pipeline", ""))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    stage = lambda seconds: {"fps": count / seconds, "MB/s": count * frame_bytes / seconds / 1e6}
+    return {
+        "source": stage(source_time),
+        "consumer": stage(consumer_time),
+        "save": stage(save_time),
+        "save_journal": stage(journal_time),
+        "journal_overhead": journal_time / save_time - 1,
+        "pipeline": stage(wall),
+        "cpu_utilisation": cpu / wall,
+        "peak_rss_MB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def key(config: dict) -> str:
+    return json.dumps(config, sort_keys=True)
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Find runs whose end-to-end fps is lower than in baseline by more than tolerance.
+
+    Returns:
+        list: Messages describing regressions.
+    """
+    previous = {key(run["config"]): run["results"] for run in baseline}
+    regressions = []
+    for run in results:
+        old = previous.get(key(run["config"]))
+        if old is None:
+            continue
+        for name in ("source", "consumer", "save", "pipeline"):
+            fps, old_fps = run["results"][name]["fps"], old[name]["fps"]
+            if fps < (1 - tolerance) * old_fps:
+                regressions.append(
+                    f"{name} {old_fps:.1f} -> {fps:.1f} fps for {key(run['config'])}"
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", nargs="+", default=["768x1024", "100x50"],
+                        help="frame shapes, ROWSxCOLS")
+    parser.add_argument("--frames", type=int, nargs="+", default=[100])
+    parser.add_argument("--resize-ratios", type=float, nargs="+", default=[2])
+    parser.add_argument("--kernels", type=int, nargs="+", default=[5])
+    parser.add_argument("--maxsizes", type=int, nargs="+", default=[102])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()])
+    parser.add_argument("--source-modes", nargs="+", default=["random"],
+                        help="modes of Source: random, generator, ring or bytes")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results of previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative drop of fps, defaults to 0.1")
+    args = parser.parse_args(argv)
+
+    configs = [
+        {
+            "shape": [int(size) for size in shape.split("x")],
+            "frames": frames,
+            "resize_ratio": resize_ratio,
+            "kernel": kernel,
+            "maxsize": maxsize,
+            "workers": workers,
+            "source": source,
+        }
+        for shape, frames, resize_ratio, kernel, maxsize, workers, source in itertools.product(
+            args.shapes, args.frames, args.resize_ratios, args.kernels, args.maxsizes,
+            sorted(set(args.workers)), args.source_modes,
+        )
+    ]
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+            measured = executor.submit(run, config).result()
+        results.append({"config": config, "results": measured})
+        print(
+            f"{key(config)}: source {measured['source']['fps']:.1f} fps, pipeline {measured['pipeline']['fps']:.1f} fps "
+            f"({measured['pipeline']['MB/s']:.1f} MB/s), consumer {measured['consumer']['fps']:.1f} fps, "
+            f"save {measured['save']['fps']:.1f} fps (journal {100 * measured['journal_overhead']:+.1f}%), CPU {100 * measured['cpu_utilisation']:.0f}%, "
+            f"peak RSS {measured['peak_rss_MB']:.0f} MB"
+        )
+    with open(args.output, "w") as file:
+        machine = {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        }
+        json.dump({"machine": machine, "runs": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["machine"] != machine:
+            print(f"WARNING: baseline comes from other machine: {baseline['machine']}")
+        regressions = compare(results, baseline["runs"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
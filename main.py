@@ -1,53 +1,9 @@
-import threading
-import logging
-import queue
-from src.source import Source
-from src.consumer import ConsumerThread
-from src.producer import ProducerThread
-from src.savepicture import SavePictureThread
+"""Run the pipeline from the repository, the same as the producer-consumer script:
 
-# Global config for logs. Uncomment if logging.
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(levelname)s: %(threadName)s at %(asctime)s:  %(message)s",
-)
+    python main.py --help
+"""
+import sys
+from src.cli import cli
 
 if __name__ == "__main__":
-    queue_errors = queue.Queue() # helper variable, allow for basic communication between threads
-    path = "./processed/"
-    frame_count = 100
-    delay_frame = 0.05
-    resize = 2
-    kernel_filter = 5
-    queue_a = queue.Queue(maxsize=102) # Maxsize is set to avoid memory errors in case of large dataset. 
-    queue_b = queue.Queue(maxsize=102)
-    
-    # set and start thread that put data to queue A.
-    p = ProducerThread(
-        target=queue_a,
-        frame_count=frame_count,
-        sigkill=queue_errors,
-        delay_frame=delay_frame
-    )
-    p.start()
-    # set and start thread that take data from queue A, process and put to queue B.
-    c = ConsumerThread(
-        target=(queue_a, queue_b),
-        frame_count=frame_count,
-        sigkill=queue_errors,
-        kernel=kernel_filter,
-        resize_ratio=resize
-    )
-    c.start()
-    # set and start thread that take data from queue B and save to *.png file.
-    c1 = SavePictureThread(
-        target=queue_b,
-        frame_count=frame_count,
-        path=path,
-        sigkill=queue_errors,
-    )
-    c1.start()
-    p.join()
-    c.join()
-    c1.join()
-    logging.debug("finished")
+    sys.exit(cli())
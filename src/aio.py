@@ -0,0 +1,170 @@
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import os
+import cv2
+from .stream import EOS
+
+
+def process_picture(picture, resize_ratio: float = 2, kernel: int = 5):
+    """Reduce size of picture and apply median filter on it, the same work as
+    ConsumerThread does. It is a module level function, so it can be sent to
+    a process executor.
+
+    Args:
+        picture (np.ndarray): Picture.
+        resize_ratio (float, optional): Determine how many times picture should be resized. Defaults to 2.
+        kernel (int, optional): Define kernel of median filter. Defaults to 5.
+
+    Returns:
+        np.ndarray: Processed picture.
+    """
+    new_dim = (int(picture.shape[1] / resize_ratio), int(picture.shape[0] / resize_ratio))
+    return cv2.medianBlur(cv2.resize(picture, new_dim), ksize=kernel)
+
+
+def write_picture(filename: str, picture):
+    assert cv2.imwrite(filename, picture), f"Picture is not saved to {filename}"
+
+
+async def source_frames(source, frame_count: int = None, delay_frame: float = 0.0):
+    """Async generator of pictures taken from source.
+
+    Args:
+        source: Object with get_data() method, e.g. Source. It returns None when it is exhausted.
+        get_data() runs in default executor of the loop, so it does not block other pipelines.
+        frame_count (int, optional): How many times data are taken from source.
+        Defaults to None, until source is exhausted.
+        delay_frame (float, optional): Delay between frames in seconds. Defaults to 0.
+    """
+    loop = asyncio.get_running_loop()
+    frames = range(frame_count) if frame_count is not None else itertools.count()
+    for _ in frames:
+        picture = await loop.run_in_executor(None, source.get_data)
+        if picture is None:
+            return
+        yield picture
+        await asyncio.sleep(delay_frame)
+
+
+async def queue_items(q: asyncio.Queue):
+    """Async generator of items taken from queue until EOS."""
+    while True:
+        item = await q.get()
+        if item is EOS:
+            return
+        yield item
+
+
+async def save_frames(frames, path: str, executor: concurrent.futures.Executor = None):
+    """Async generator that saves pictures to png files, named by their index in source,
+    and yields index of every saved picture. Pictures can come in any order, e.g. from
+    several Consumers.
+
+    Args:
+        frames: Async iterable of pairs (index, picture).
+        path (str): Place, where files are saved.
+        executor (concurrent.futures.Executor, optional): Executor writing files.
+        Defaults to None, default executor of the loop.
+    """
+    loop = asyncio.get_running_loop()
+    os.makedirs(path, exist_ok=True) # files can be overwritten
+    async for idx, picture in frames:
+        await loop.run_in_executor(executor, write_picture, os.path.join(path, f"{idx}.png"), picture)
+        yield idx
+
+
+class AsyncPipeline:
+    def __init__(
+        self,
+        frames,
+        path: str = "./processed/",
+        resize_ratio: float = 2,
+        kernel: int = 5,
+        workers: int = 2,
+        maxsize: int = 8,
+        executor: concurrent.futures.Executor = None,
+        name: str = "AsyncPipeline",
+    ):
+        """Producer, Consumer and SavePicture roles as tasks of an event loop,
+        connected by bounded asyncio queues. Image kernels run in the executor, so
+        many pipelines can share one loop and one executor instead of having their
+        own threads. Pictures are passed through queues with their index in source,
+        so files are named by it also when several Consumers change order of pictures.
+        End of data is passed by EOS, and error in any task cancels the other tasks
+        of the pipeline.
+
+        Args:
+            frames: Async iterable of pictures, e.g. source_frames(Source(shape)).
+            path (str, optional): Place, where files are saved. Defaults to "./processed/".
+            resize_ratio (float, optional): Determine how many times picture should be resized. Defaults to 2.
+            kernel (int, optional): Define kernel of median filter. Defaults to 5.
+            workers (int, optional): Number of Consumer tasks, i.e. pictures of this
+            pipeline processed at once. Defaults to 2.
+            maxsize (int, optional): Capacity of queues. Defaults to 8.
+            executor (concurrent.futures.Executor, optional): Thread or process executor
+            running resize, median filter and writing of files. Defaults to None,
+            default executor of the loop.
+            name (str, optional): Name of the pipeline, used in logs. Defaults to "AsyncPipeline".
+        """
+        self.frames = frames
+        self.path = path
+        self.resize_ratio = resize_ratio
+        self.kernel = kernel
+        self.workers = workers
+        assert (isinstance(self.workers, int) and self.workers > 0
+        ), "Number of workers must be natural number bigger than 0"
+        self.maxsize = maxsize
+        assert (isinstance(self.maxsize, int) and self.maxsize > 0
+        ), "Capacity of queues must be natural number bigger than 0"
+        self.executor = executor
+        self.name = name
+        self.produced = 0 # pictures put to queue A
+        self.saved = 0 # pictures saved to files
+        return
+
+    async def run(self) -> int:
+        """Process all pictures.
+
+        Returns:
+            int: Number of saved pictures.
+        """
+        queue_a = asyncio.Queue(maxsize=self.maxsize)
+        queue_b = asyncio.Queue(maxsize=self.maxsize)
+        tasks = [
+            asyncio.create_task(self.produce(queue_a)),
+            asyncio.create_task(self.consume_all(queue_a, queue_b)),
+            asyncio.create_task(self.save(queue_b)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException: # tasks waiting on full or empty queues would never finish
+            logging.error(f"{self.name} failed")
+            for task in tasks:
+                task.cancel()
+            raise
+        return self.saved
+
+    async def produce(self, queue_a: asyncio.Queue):
+        async for picture in self.frames:
+            await queue_a.put((self.produced, picture))
+            self.produced += 1
+        await queue_a.put(EOS)
+
+    async def consume_all(self, queue_a: asyncio.Queue, queue_b: asyncio.Queue):
+        await asyncio.gather(*[self.consume(queue_a, queue_b) for _ in range(self.workers)])
+        await queue_b.put(EOS) # all Consumers are finished
+
+    async def consume(self, queue_a: asyncio.Queue, queue_b: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        async for idx, picture in queue_items(queue_a):
+            picture = await loop.run_in_executor(
+                self.executor, process_picture, picture, self.resize_ratio, self.kernel
+            )
+            await queue_b.put((idx, picture))
+        await queue_a.put(EOS) # leave EOS for other Consumers
+
+    async def save(self, queue_b: asyncio.Queue):
+        async for _ in save_frames(queue_items(queue_b), self.path, self.executor):
+            self.saved += 1
@@ -0,0 +1,314 @@
+import threading
+import logging
+import queue
+import json
+import os
+import sys
+import time
+import numpy as np
+import cv2
+from .framepool import FramePool
+from .metrics import Metrics
+from .stream import EOS
+from .delta import FrameRef, References
+from .journal import Journal
+from .sequence import Sequence
+
+MAGIC = b"PCFRAMES"
+HEADER_SIZE = 4096 # bytes, records start at multiple of it
+
+
+class FrameArchive:
+    def __init__(self, path: str, mode: str = "r"):
+        """Single file with frames of the same shape, written one after another.
+        The file has a small header, an index and preallocated records:
+
+            header (json) | index (int64 per frame) | records (uint8 frames)
+
+        index[idx] is the number of record with frame idx, or -1 if frame is missing.
+        Records are accessed through np.memmap, so reading a frame does not copy it.
+        Use FrameArchive.create to make a new archive.
+
+        Args:
+            path (str): Path of archive file.
+            mode (str, optional): "r" for reading, "r+" for writing. Defaults to "r".
+        """
+        self.path = path
+        self.mode = mode
+        with open(self.path, "rb") as file:
+            header = file.read(HEADER_SIZE)
+        assert header.startswith(MAGIC), f"{path} is not a frame archive"
+        header = json.loads(header[len(MAGIC):].rstrip(b"\0"))
+        self.shape = tuple(header["shape"])
+        self.dtype = np.dtype(header["dtype"])
+        self.capacity = header["capacity"]
+        self.index = np.memmap(
+            self.path, dtype=np.int64, mode=mode, offset=HEADER_SIZE, shape=(self.capacity,)
+        )
+        self.records = np.memmap(
+            self.path,
+            dtype=self.dtype,
+            mode=mode,
+            offset=header["records_offset"],
+            shape=(self.capacity, *self.shape),
+        )
+        self.count = int(self.index.max()) + 1 if self.capacity else 0 # records written
+        self._free = [] # records before count that no frame uses, written again first
+        return
+
+    @classmethod
+    def create(cls, path: str, capacity: int, shape: tuple, dtype: type = np.uint8):
+        """Make new archive with space for capacity frames. Existing file is overwritten.
+
+        Args:
+            path (str): Path of archive file.
+            capacity (int): Number of frames.
+            shape (tuple): Shape of one frame.
+            dtype (type, optional): Type of frame data. Defaults to np.uint8.
+
+        Returns:
+            FrameArchive: Archive opened for writing.
+        """
+        index_size = 8 * capacity
+        records_offset = -(-(HEADER_SIZE + index_size) // HEADER_SIZE) * HEADER_SIZE
+        frame_size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        header = MAGIC + json.dumps({
+            "version": 1,
+            "shape": list(shape),
+            "dtype": np.dtype(dtype).str,
+            "capacity": capacity,
+            "records_offset": records_offset,
+        }).encode()
+        assert len(header) <= HEADER_SIZE, "Header of archive is too long"
+        with open(path, "wb") as file:
+            file.write(header.ljust(HEADER_SIZE, b"\0"))
+            file.write(np.full(capacity, -1, dtype=np.int64).tobytes())
+            file.truncate(records_offset + capacity * frame_size) # preallocate records
+        return cls(path, mode="r+")
+
+    def __len__(self) -> int:
+        return self.capacity
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        """Frame idx, as a view of the file.
+
+        Raises:
+            KeyError: Frame idx is not in archive.
+        """
+        record = self.index[idx]
+        if record < 0:
+            raise KeyError(idx)
+        return self.records[record]
+
+    def append(self, frame: np.ndarray, idx: int) -> int:
+        """Write frame to the first free record.
+
+        Args:
+            frame (np.ndarray): Frame of shape given when archive was created.
+            idx (int): Index of frame.
+
+        Returns:
+            int: Number of record.
+        """
+        if self._free:
+            record = self._free.pop(0)
+        else:
+            assert self.count < self.capacity, "Archive is full"
+            record = self.count
+            self.count += 1
+        self.records[record] = frame
+        self.index[idx] = record
+        return record
+
+    def reference(self, idx: int, reference: int):
+        """Make frame idx the same as frame reference, without writing new record.
+
+        Args:
+            idx (int): Index of frame.
+            reference (int): Index of frame already in archive.
+        """
+        assert self.index[reference] >= 0, f"Frame {reference} is not in archive"
+        self.index[idx] = self.index[reference]
+
+    def truncate(self, idx: int):
+        """Remove frames idx and later, e.g. before earlier run is resumed from idx.
+        Their records are written again, also records before the last remaining one,
+        which are there when frames were written out of order.
+
+        Args:
+            idx (int): Index of the first removed frame.
+        """
+        self.index[idx:] = -1
+        self.count = int(self.index.max()) + 1 if self.capacity else 0
+        self._free = sorted(set(range(self.count)) - set(self.index[self.index >= 0].tolist()))
+
+    def flush(self):
+        self.records.flush()
+        self.index.flush()
+
+    def to_png(self, path: str):
+        """Save all frames of archive to png files {idx}.png.
+
+        Args:
+            path (str): Directory for files.
+        """
+        os.makedirs(path, exist_ok=True)
+        for idx in np.flatnonzero(self.index >= 0):
+            cv2.imwrite(os.path.join(path, f"{idx}.png"), self[idx])
+
+
+class SaveArchiveThread(threading.Thread):
+    def __init__(
+        self,
+        target: queue,
+        sigkill: queue,
+        name: str = "SaveArchive",
+        path: str = "./processed/",
+        frame_count: int = 100,
+        timeout: float = 0.1,
+        pool: FramePool = None,
+        filename: str = "frames.archive",
+        metrics: Metrics = None,
+        capacity: int = None,
+        start_index: int = 0,
+        journal: Journal = None,
+        sequence: Sequence = None,
+    ):
+        """Thread that can be used in place of SavePicture. Instead of a png file
+        for every frame, frames are written to one FrameArchive. The archive is
+        created when the first frame arrives, with space for capacity frames.
+        This thread will overwrite the archive.
+
+        Args:
+            target (queue): queue B share data between threads.
+            sigkill (queue):  queue that is shared between all the threads.
+            It keeps track whether any of them is interrupted.
+            In such case, the rest should be stopped.
+            name (str, optional):  Name of the thread. Defaults to "SaveArchive".
+            path (str, optional): Directory of the archive.
+            Defaults to "./processed/".
+            frame_count (int, optional): How many times data are taken from Source.
+            None means streaming mode, thread stops on EOS. Defaults to 100.
+            timeout (float, optional): How long (in seconds) thread blocks on empty queue B
+            before it checks whether other threads are interrupted. Defaults to 0.1.
+            pool (FramePool, optional): Pool to which pictures are returned after saving.
+            Defaults to None.
+            filename (str, optional): Name of the archive file. Defaults to "frames.archive".
+            metrics (Metrics, optional): Metrics of the pipeline. Defaults to None, nothing is measured.
+            capacity (int, optional): Maximal number of frames in the archive, required in
+            streaming mode. Defaults to frame_count.
+            start_index (int, optional): Index of the first frame, the same as start_index
+            of Producer. If it is not 0, existing archive is opened and frames from start_index
+            on are replaced. Defaults to 0.
+            journal (Journal, optional): Journal to which indices of saved frames are committed.
+            Defaults to None.
+            sequence (Sequence, optional): Sequence of the pipeline, from which indices of frames
+            in order of Producer are taken. Archive index and journal use them, and references
+            are resolved to their own keyframes. Defaults to None, frames are indexed in order
+            of queue B, which is the order of Producer only with one Consumer.
+        """
+        super(SaveArchiveThread, self).__init__()
+        self.target_B = target
+        assert isinstance(self.target_B, queue.Queue)
+        self.sigkill = sigkill
+        assert isinstance(self.sigkill, queue.Queue)
+        self.name = name
+        self.path = path
+        self.frame_count = frame_count
+        assert (self.frame_count is None or isinstance(self.frame_count, int) and self.frame_count > 0
+        ), "Number of data must be natural number bigger than 0"
+        self.capacity = capacity if capacity is not None else frame_count
+        assert (isinstance(self.capacity, int) and self.capacity > 0
+        ), "Capacity of archive must be natural number bigger than 0"
+        self.timeout = timeout
+        self.pool = pool
+        self.filename = os.path.join(self.path, filename)
+        self.start_index = start_index
+        self.journal = journal
+        self.sequence = sequence
+        self.saved = 0 # frames written by run, unchanged frames included
+        self.dropped = 0 # unchanged frames dropped with their keyframes
+        self.archive = None
+        self.references = References() # frames referenced by unchanged pictures
+        self.metrics = metrics
+        self.stats = metrics.stage("SavePicture") if metrics is not None else None
+        os.makedirs(self.path, exist_ok=True)
+        return
+
+    def run(self):
+        idx = self.start_index # index of the next frame in order of arrival
+        if self.start_index and os.path.exists(self.filename): # resume earlier run
+            self.archive = FrameArchive(self.filename, mode="r+")
+            self.archive.truncate(self.start_index)
+        # stop thread when all data are processed
+        while self.frame_count is None or idx < self.frame_count:
+            try: # block until data arrive instead of polling the queue
+                item = self.target_B.get(timeout=self.timeout)
+            except queue.Empty:
+                if not self.sigkill.empty(): # stop thread if error occur in other threads
+                    break
+                continue
+            if item is EOS: # no more data, e.g. source is exhausted
+                break
+            try:
+                if self.metrics is not None:
+                    start = time.perf_counter()
+                    born = self.metrics.unstamp(item, self.stats)
+                # batch of pictures from Consumer
+                pictures = item if isinstance(item, np.ndarray) and item.ndim == 4 else (item,)
+                # frames are indexed in order of Producer
+                indices = self.sequence.take(item) if self.sequence is not None else None
+                if indices is None: # frames arrive in order of Producer
+                    indices = list(range(idx, idx + len(pictures)))
+                idx += len(pictures)
+                if self.sequence is not None and self.sequence.dropped: # keyframes dropped by queues
+                    self.dropped += self.references.drop(self.sequence.dropped)
+                if isinstance(item, FrameRef): # index points to record of unchanged picture
+                    for pair in self.references.reference(item, indices[0]):
+                        self.write_reference(*pair)
+                    continue
+                if self.archive is None:
+                    self.archive = FrameArchive.create(
+                        self.filename, self.capacity, pictures[0].shape, pictures[0].dtype
+                    )
+                for picture, i in zip(pictures, indices):
+                    self.archive.append(picture, i)
+                    self.commit(i)
+                    self.saved += 1
+                    for pair in self.references.keyframe(i, i):
+                        self.write_reference(*pair)
+                if self.pool is not None:
+                    self.pool.release(item)
+                if self.metrics is not None:
+                    end = time.perf_counter()
+                    self.stats.record("write", end - start)
+                    self.stats.count(len(pictures))
+                    if born is not None:
+                        self.stats.record("latency", end - born)
+                if logging.root.isEnabledFor(logging.DEBUG): # qsize takes lock of queue
+                    logging.debug(f"{self.target_B.qsize()} items in queue b")
+            except: # send info to other threads that error occur here, and thread is stopped.
+                logging.error("thread dead!")
+                self.sigkill.put(self.name)
+                break
+        if self.archive is not None:
+            self.archive.flush()
+        if self.journal is not None:
+            self.journal.flush()
+        if self.sequence is not None:
+            self.dropped += self.references.drop(self.sequence.dropped)
+        return
+
+    def write_reference(self, idx, reference):
+        self.archive.reference(idx, reference)
+        self.commit(idx)
+        self.saved += 1
+
+    def commit(self, idx):
+        if self.journal is not None:
+            self.journal.commit(idx)
+
+
+if __name__ == "__main__":
+    # convert archive to png files: python -m src.archive ARCHIVE DIRECTORY
+    FrameArchive(sys.argv[1]).to_png(sys.argv[2])
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import platform
+import threading
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import cv2
+
+BACKENDS = ("opencv", "numpy")
+# results of micro-benchmark, valid only for the machine that measured them
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "producer_consumer", "backends.json")
+
+_lock = threading.Lock()
+_choices = {}
+
+
+def resize_opencv(picture, shape, interpolation=cv2.INTER_LINEAR, dst=None):
+    return cv2.resize(picture, (shape[1], shape[0]), dst=dst, interpolation=interpolation)
+
+
+def resize_numpy(picture, shape, resize_ratio, dst=None):
+    """Nearest-neighbor downscale by integer ratio as strided view of picture,
+    the same as cv2.resize with INTER_NEAREST. Nothing is copied unless dst is given.
+    """
+    step = int(resize_ratio)
+    view = picture[:shape[0] * step:step, :shape[1] * step:step]
+    if dst is None:
+        return view
+    np.copyto(dst, view)
+    return dst
+
+
+def median_opencv(picture, kernel, dst=None):
+    return cv2.medianBlur(picture, ksize=kernel, dst=dst)
+
+
+def median_numpy(picture, kernel, dst=None, rows=32):
+    """Median filter of any type of data, the same as cv2.medianBlur, which replicates
+    pixels at borders. Windows of pixels are views of padded picture; they are
+    partitioned rows by rows, so memory used at once is bounded.
+    """
+    half = kernel // 2
+    padded = np.pad(picture, [(half, half), (half, half)] + [(0, 0)] * (picture.ndim - 2), mode="edge")
+    if dst is None:
+        dst = np.empty_like(picture)
+    middle = kernel * kernel // 2
+    for top in range(0, picture.shape[0], rows):
+        bottom = min(top + rows, picture.shape[0])
+        windows = sliding_window_view(padded[top:bottom + 2 * half], (kernel, kernel), axis=(0, 1))
+        windows = windows.reshape(*windows.shape[:-2], kernel * kernel)
+        dst[top:bottom] = np.partition(windows, middle, axis=-1)[..., middle]
+    return dst
+
+
+def supports(backend: str, step: str, shape, resize_ratio: float, kernel: int, dtype, interpolation: int) -> bool:
+    """Check whether backend can do step ("resize" or "median") with given parameters."""
+    if step == "resize":
+        # numpy resize is the same as OpenCV only for nearest-neighbor and integer ratio
+        # that divides dimensions, otherwise OpenCV scale is not exactly the ratio
+        return backend == "opencv" or (
+            interpolation == cv2.INTER_NEAREST
+            and float(resize_ratio).is_integer()
+            and resize_ratio >= 1
+            and shape[0] % resize_ratio == 0
+            and shape[1] % resize_ratio == 0
+        )
+    if backend == "opencv": # other types than uint8 only for small kernels
+        return np.dtype(dtype) == np.uint8 or (kernel in (3, 5) and np.dtype(dtype) in (np.uint16, np.float32))
+    return True
+
+
+def available(step: str, shape, resize_ratio: float, kernel: int, dtype, interpolation: int) -> list:
+    """Backends that can do step with given parameters."""
+    return [
+        backend for backend in BACKENDS
+        if supports(backend, step, shape, resize_ratio, kernel, dtype, interpolation)
+    ]
+
+
+def run(backend: str, step: str, picture, resize_ratio, kernel, interpolation, dst=None):
+    """Do step ("resize" or "median") of processing with backend.
+
+    Returns:
+        np.ndarray: Resized or filtered picture. Resize by numpy backend is a view of picture.
+    """
+    if step == "resize":
+        shape = (int(picture.shape[0] / resize_ratio), int(picture.shape[1] / resize_ratio))
+        if backend == "numpy":
+            return resize_numpy(picture, shape, resize_ratio, dst)
+        return resize_opencv(picture, shape, interpolation, dst)
+    if backend == "numpy":
+        return median_numpy(picture, kernel, dst)
+    return median_opencv(picture, kernel, dst)
+
+
+def machine() -> dict:
+    return {
+        "node": platform.node(),
+        "processor": platform.machine(),
+        "cpus": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def benchmark(step, shape, dtype, resize_ratio, kernel, interpolation, repeat: int = 3) -> dict:
+    """Measure every backend that can do step, on random picture of given shape and type.
+    Result of resize is made contiguous, as the median filter needs it anyway.
+
+    Returns:
+        dict: Best time in seconds by backend.
+    """
+    rng = np.random.default_rng(0)
+    picture = (rng.random(shape) * 255).astype(dtype)
+    seconds = {}
+    for backend in available(step, shape, resize_ratio, kernel, dtype, interpolation):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            np.ascontiguousarray(run(backend, step, picture, resize_ratio, kernel, interpolation))
+            times.append(time.perf_counter() - start)
+        seconds[backend] = min(times)
+    return seconds
+
+
+def select(step, shape, dtype, resize_ratio, kernel, interpolation, path: str = None) -> str:
+    """Choose the fastest backend for step of processing with given parameters.
+    When more than one backend can do it, they are measured by micro-benchmark,
+    once per machine: choices are kept in memory and in json file at path.
+
+    Args:
+        step (str): "resize" or "median".
+        shape (tuple): Shape of input picture of the step.
+        dtype: Type of data.
+        resize_ratio (float): Ratio of resize.
+        kernel (int): Kernel of median filter.
+        interpolation (int): Interpolation of resize.
+        path (str, optional): File with choices. Defaults to CACHE_PATH.
+
+    Returns:
+        str: Name of backend.
+    """
+    candidates = available(step, shape, resize_ratio, kernel, dtype, interpolation)
+    if len(candidates) == 1:
+        return candidates[0]
+    path = path or CACHE_PATH
+    key = json.dumps([step, list(shape), np.dtype(dtype).str, resize_ratio, kernel, interpolation])
+    with _lock:
+        if (path, key) in _choices:
+            return _choices[(path, key)]
+        stored = {}
+        try:
+            with open(path) as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            pass
+        if stored.get("machine") != machine(): # choices of other machine are not valid
+            stored = {"machine": machine(), "choices": {}}
+        if key not in stored["choices"]:
+            seconds = benchmark(step, shape, dtype, resize_ratio, kernel, interpolation)
+            stored["choices"][key] = min(seconds, key=seconds.get)
+            logging.debug(f"backends for {key}: {seconds}")
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "w") as file:
+                    json.dump(stored, file, indent=2)
+            except OSError:
+                logging.warning(f"Choice of backends can not be saved to {path}")
+        _choices[(path, key)] = stored["choices"][key]
+        return _choices[(path, key)]
@@ -0,0 +1,138 @@
+import collections
+import hashlib
+import logging
+import os
+import threading
+import numpy as np
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = 256 * 2**20, path: str = None):
+        """Content-addressed cache of processed pictures, shared by Consumer threads.
+        Key is made of hash of the bytes of input picture and parameters of processing,
+        so the same picture processed with the same parameters is computed only once,
+        also across runs if path is set.
+
+        Pictures are kept in memory in LRU order, up to max_bytes. If path is set,
+        every stored picture is also written to a .npy file in that directory; a picture
+        missing in memory is then loaded from the file as np.memmap, without reading it
+        whole, and put back to memory.
+
+        Args:
+            max_bytes (int, optional): Maximal size of pictures kept in memory.
+            Defaults to 256 MiB.
+            path (str, optional): Directory of on-disk tier. Defaults to None, memory only.
+        """
+        self.max_bytes = max_bytes
+        assert (isinstance(self.max_bytes, int) and self.max_bytes >= 0
+        ), "Size of cache must be natural number or 0"
+        self.path = path
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+        self.bytes = 0 # size of pictures in memory
+        self.hits = 0 # pictures found in memory
+        self.disk_hits = 0 # pictures found on disk
+        self.misses = 0
+        self.evictions = 0 # pictures removed from memory to keep max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        return
+
+    @staticmethod
+    def key(picture: np.ndarray, *params) -> str:
+        """Key of result of processing picture with params, e.g. resize ratio and kernel.
+        sha256 is used because it is hardware accelerated on most CPUs, and it is
+        the fastest of hashlib algorithms for large pictures.
+
+        Args:
+            picture (np.ndarray): Input picture.
+            *params: Parameters of processing that change the result.
+
+        Returns:
+            str: Hexadecimal key.
+        """
+        digest = hashlib.sha256(np.ascontiguousarray(picture))
+        digest.update(repr((picture.shape, picture.dtype.str, params)).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> np.ndarray:
+        """Cached picture, or None if it is not in cache. The picture must not be modified.
+
+        Args:
+            key (str): Key made by ResultCache.key.
+
+        Returns:
+            np.ndarray: Picture.
+        """
+        with self._lock:
+            picture = self._entries.get(key)
+            if picture is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return picture
+        filename = self._filename(key)
+        if filename is not None and os.path.exists(filename):
+            try:
+                picture = np.load(filename, mmap_mode="r")
+            except (OSError, ValueError): # file is being written by other thread
+                picture = None
+            if picture is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, picture)
+                return picture
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, picture: np.ndarray):
+        """Store copy of picture.
+
+        Args:
+            key (str): Key made by ResultCache.key.
+            picture (np.ndarray): Processed picture.
+        """
+        picture = np.array(picture) # buffers of pictures are reused by pool
+        picture.flags.writeable = False
+        with self._lock:
+            self._store(key, picture)
+        filename = self._filename(key)
+        if filename is not None and not os.path.exists(filename):
+            temporary = f"{filename}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as file:
+                np.save(file, picture)
+            os.replace(temporary, filename) # readers never see incomplete file
+
+    def _store(self, key, picture):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        if picture.nbytes > self.max_bytes:
+            return
+        self._entries[key] = picture
+        self.bytes += picture.nbytes
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _filename(self, key):
+        return os.path.join(self.path, f"{key}.npy") if self.path is not None else None
+
+    def stats(self) -> dict:
+        """Counters of the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        requests = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        ratio = (stats["hits"] + stats["disk_hits"]) / requests if requests else 0.0
+        logging.debug(f"result cache: {stats}, hit ratio {ratio:.2f}")
@@ -0,0 +1,517 @@
+"""Producer -> Consumer -> SavePicture pipeline of pictures.
+
+Options are given in the command line or in a JSON config file, e.g.
+
+    python main.py --frames 500 --resize 4 --workers 8 --sink archive
+    producer-consumer --config run.json --log-level debug
+
+main.py runs it from the repository, producer-consumer is the console script
+of the installed producer_consumer package.
+
+Heavy modules (OpenCV, numpy and the pipeline) are imported by runners,
+so --help and --dry-run start instantly.
+"""
+import argparse
+import logging
+import queue
+import multiprocessing
+import json
+import os
+import concurrent.futures
+import time
+
+LOG_FORMAT = "%(levelname)s: %(threadName)s at %(asctime)s:  %(message)s"
+BACKENDS = ("thread", "process", "pipeline", "asyncio")
+# names of --interpolation, cv2.INTER_ constants without the prefix
+INTERPOLATIONS = ("nearest", "linear", "cubic", "area", "lanczos4")
+
+
+def run_threads(
+    path, frame_count, delay_frame, resize, kernel_filter, workers, picture_shape, pool_size=None,
+    mode="separate", batch_size=1, writers=0, fmt="png", compression=None, sink="png",
+    metrics_path=None, report_interval=1.0, memory_budget=None, capacity=None, source=None,
+    variants=None, cache=None, delta=None, queue_policy="block", lifetime=None, journal=None,
+    profile_path=None, profile_interval=0.01, maxsize=102, kernels="opencv", interpolation="linear",
+    tile_size=(256, None),
+):
+    import cv2
+    from .consumerpool import ConsumerPool
+    from .producer import ProducerThread
+    from .savepicture import SavePictureThread
+    from .framepool import FramePool
+    from .archive import SaveArchiveThread
+    from .metrics import Metrics, MetricsReporter
+    from .controller import AdaptiveController
+    from .deadline import DeadlineQueue
+    from .profiler import SamplingProfiler
+    from .sequence import Sequence
+    from .pipeline import PipelineError
+
+    # frames saved by earlier run are skipped
+    start_index = journal.resume_index() if journal is not None else 0
+    if frame_count is not None and start_index >= frame_count:
+        logging.debug("all frames are already saved")
+        journal.close()
+        return 0
+    queue_errors = queue.Queue() # helper variable, allow for basic communication between threads
+    # recycled buffers for frames, pool_size bounds number of frames of each shape in memory
+    pool = FramePool(size=pool_size) if pool_size else None
+    # metrics are collected only if they are saved at the end
+    metrics = Metrics() if metrics_path else None
+    # frames keep their index when several Consumers change their order
+    sequence = Sequence()
+    # in fused and tiled modes stripes or tiles of one frame are processed in parallel
+    executor = (
+        concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="ConsumerExecutor")
+        if mode in ("fused", "tiled") else None
+    )
+    if queue_policy == "block" and lifetime is None:
+        queue_a = queue.Queue(maxsize=maxsize) # Maxsize is set to avoid memory errors in case of large dataset. 
+        queue_b = queue.Queue(maxsize=maxsize)
+    else: # frames can be dropped, buffers of dropped frames go back to the pool
+
+        def on_drop(item):
+            if pool is not None:
+                pool.release(item)
+            if metrics is not None:
+                metrics.forget(item)
+            sequence.drop(item) # references to dropped picture are dropped by sink
+
+        queue_a, queue_b = (
+            DeadlineQueue(maxsize=maxsize, policy=queue_policy, lifetime=lifetime, on_drop=on_drop)
+            for _ in range(2)
+        )
+    # set thread that put data to queue A.
+    p = ProducerThread(
+        target=queue_a,
+        frame_count=frame_count,
+        sigkill=queue_errors,
+        picture_shape=picture_shape,
+        delay_frame=delay_frame,
+        pool=pool,
+        metrics=metrics,
+        source=source,
+        delta=delta,
+        start_index=start_index,
+        sequence=sequence,
+    )
+    # set threads that take data from queue A, process and put to queue B.
+    c = ConsumerPool(
+        target=(queue_a, queue_b),
+        frame_count=frame_count - start_index if frame_count is not None else None,
+        sigkill=queue_errors,
+        workers=workers,
+        kernel=kernel_filter,
+        resize_ratio=resize,
+        pool=pool,
+        mode=mode,
+        executor=executor,
+        batch_size=batch_size,
+        metrics=metrics,
+        variants=variants,
+        cache=cache,
+        backend=kernels,
+        sequence=sequence,
+        interpolation=getattr(cv2, f"INTER_{interpolation.upper()}"),
+        tile_size=tile_size,
+    )
+    # set thread that take data from queue B and save to files or to one archive.
+    if sink == "archive":
+        c1 = SaveArchiveThread(
+            target=queue_b,
+            frame_count=frame_count,
+            path=path,
+            sigkill=queue_errors,
+            pool=pool,
+            metrics=metrics,
+            capacity=capacity,
+            start_index=start_index,
+            journal=journal,
+            sequence=sequence,
+        )
+    else:
+        c1 = SavePictureThread(
+            target=queue_b,
+            frame_count=frame_count,
+            path=path,
+            sigkill=queue_errors,
+            pool=pool,
+            writers=writers,
+            fmt=fmt,
+            compression=compression,
+            metrics=metrics,
+            start_index=start_index,
+            journal=journal,
+            sequence=sequence,
+        )
+    # all stages are set before any thread starts, so wrong options stop nothing halfway
+    if metrics is not None:
+        metrics.add_queue("a", queue_a)
+        metrics.add_queue("b", queue_b)
+        reporter = MetricsReporter(metrics, interval=report_interval)
+        reporter.start()
+    # stacks of threads are sampled only if they are saved at the end
+    if profile_path:
+        profiler = SamplingProfiler(path=profile_path, interval=profile_interval)
+        profiler.start()
+    p.start()
+    c.start()
+    c1.start()
+    if memory_budget: # tune queues, Consumer threads and Producer rate while running
+        controller = AdaptiveController(
+            producer=p, consumers=c, queues=(queue_a, queue_b), memory_budget=memory_budget,
+            max_workers=workers,
+        )
+        c.resize(1)
+        p.delay_frame = 0 # controller throttles Producer when needed
+        controller.start()
+    try:
+        p.join()
+    except KeyboardInterrupt: # stop streaming, frames already taken are still saved
+        p.stop()
+        p.join()
+    c.join()
+    c1.join()
+    if memory_budget:
+        controller.stop()
+    if executor is not None:
+        executor.shutdown()
+    if cache is not None:
+        cache.log_stats()
+    if journal is not None:
+        journal.close()
+    if profile_path:
+        profiler.stop()
+        profiler.save()
+        logging.debug(f"profile: {profiler.summary()}")
+    if metrics is not None:
+        reporter.stop()
+        reporter.report()
+        metrics.to_json(metrics_path)
+    if isinstance(queue_a, DeadlineQueue): # dropped frames are missing in output, tell how many and why
+        for name, q in (("a", queue_a), ("b", queue_b)):
+            drops = ", ".join(f"{count} {reason}" for reason, count in q.drops.items()) or "no frames"
+            logging.log(logging.WARNING if q.drops else logging.INFO, f"queue {name}: dropped {drops}")
+        if c1.dropped:
+            logging.warning(f"{c1.dropped} unchanged frames dropped with their keyframes")
+    if not queue_errors.empty():
+        raise PipelineError(f"{', '.join(queue_errors.queue)} failed, {c1.saved} frames saved")
+    return c1.saved
+
+
+def run_processes(path, frame_count, delay_frame, resize, kernel_filter, workers, picture_shape, pool_size=8):
+    from .multiprocess import FrameRing, ProducerProcess, ConsumerProcess, SavePictureProcess
+    from .pipeline import PipelineError
+
+    queue_errors = multiprocessing.Queue() # helper variable, allow for basic communication between processes
+    queue_a = multiprocessing.Queue() # only indices of slots are sent, rings limit memory usage
+    queue_b = multiprocessing.Queue()
+    slots = pool_size or 8 # processes always use preallocated slots
+    ring_a = FrameRing((*picture_shape, 3), slots=slots)
+    ring_b = FrameRing(
+        (int(picture_shape[0] / resize), int(picture_shape[1] / resize), 3), slots=slots
+    )
+    counter = multiprocessing.Value("i", 0) # processed frames, shared between Consumers
+
+    processes = [
+        ProducerProcess(
+            target=queue_a,
+            ring=ring_a,
+            frame_count=frame_count,
+            sigkill=queue_errors,
+            delay_frame=delay_frame
+        ),
+        *[
+            ConsumerProcess(
+                target=(queue_a, queue_b),
+                ring=(ring_a, ring_b),
+                name=f"Consumer-{i}",
+                frame_count=frame_count,
+                sigkill=queue_errors,
+                kernel=kernel_filter,
+                resize_ratio=resize,
+                counter=counter,
+            )
+            for i in range(workers)
+        ],
+        SavePictureProcess(
+            target=queue_b,
+            ring=ring_b,
+            frame_count=frame_count,
+            path=path,
+            sigkill=queue_errors,
+        ),
+    ]
+    try:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    finally: # shared memory outlives processes, so it must be released explicitly
+        for ring in (ring_a, ring_b):
+            ring.close()
+            ring.unlink()
+    saved = processes[-1].saved.value
+    failed = [process.name for process in processes if process.exitcode != 0]
+    while True: # names of processes that stopped on error
+        try:
+            failed.append(queue_errors.get(timeout=0.1))
+        except queue.Empty:
+            break
+    if failed:
+        raise PipelineError(f"{', '.join(sorted(set(failed)))} failed, {saved} frames saved")
+    return saved
+
+
+def run_pipeline(path, frame_count, delay_frame, resize, kernel_filter, workers, picture_shape, pool_size=None):
+    import cv2
+    from .source import Source
+    from .pipeline import Pipeline, Stage
+
+    os.makedirs(path, exist_ok=True) # files can be overwritten
+    source = Source((*picture_shape, 3))
+    new_dim = (int(picture_shape[1] / resize), int(picture_shape[0] / resize))
+
+    def produce():
+        time.sleep(delay_frame)
+        return source.get_data()
+
+    # steps can be added or reordered here, e.g. a denoise stage before resize
+    stages = [
+        Stage("Producer", produce),
+        Stage("resize", lambda picture: cv2.resize(picture, new_dim), workers=workers, maxsize=102),
+        Stage("median", lambda picture: cv2.medianBlur(picture, kernel_filter), fuse=True),
+        Stage(
+            "SavePicture",
+            lambda idx, picture: cv2.imwrite(f"{path}{idx}.png", picture),
+            maxsize=102,
+            indexed=True,
+        ),
+    ]
+    stats = Pipeline(stages, frame_count=frame_count).run()
+    logging.debug(stats)
+    return stats["stages"]["SavePicture"]["frames"]
+
+
+def run_asyncio(path, frame_count, delay_frame, resize, kernel_filter, workers, picture_shape, pool_size=None):
+    import asyncio
+    from .source import Source
+    from .aio import AsyncPipeline, source_frames
+    from .pipeline import PipelineError
+
+    # image kernels run in executor shared by all pipelines of the loop,
+    # a ProcessPoolExecutor can be used instead
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        pipeline = AsyncPipeline(
+            source_frames(Source((*picture_shape, 3)), frame_count, delay_frame),
+            path=path,
+            resize_ratio=resize,
+            kernel=kernel_filter,
+            workers=workers,
+            executor=executor,
+        )
+        try:
+            saved = asyncio.run(pipeline.run())
+        except Exception as error:
+            raise PipelineError(f"{pipeline.name} failed, {pipeline.saved} frames saved") from error
+    logging.debug(f"{saved} frames saved")
+    return saved
+
+
+
+
+RUNNERS = {
+    "thread": run_threads,
+    "process": run_processes,
+    "pipeline": run_pipeline,
+    "asyncio": run_asyncio,
+}
+# options supported only by thread backend
+THREAD_OPTIONS = (
+    "maxsize", "mode", "kernels", "interpolation", "tile_size", "batch_size", "writers", "fmt", "compression",
+    "sink", "capacity", "source", "variants", "cache_size", "cache_path", "delta", "queue_policy", "lifetime",
+    "journal", "metrics_path", "report_interval", "memory_budget", "profile_path", "profile_interval",
+)
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="producer-consumer",
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--config", help="JSON file with options, keys are names of options with _ "
+                        "instead of -, e.g. frame_count; command line overrides them")
+    parser.add_argument("--log-level", default="warning",
+                        choices=("debug", "info", "warning", "error", "critical"))
+    parser.add_argument("--dry-run", action="store_true", help="print options and exit")
+
+    pipeline = parser.add_argument_group("pipeline")
+    pipeline.add_argument("--backend", default="thread", choices=BACKENDS,
+                          help="process is not limited by the GIL, pipeline is the generic Pipeline engine")
+    pipeline.add_argument("--path", default="./processed/", help="directory of saved pictures")
+    pipeline.add_argument("--frames", dest="frame_count", type=int, default=100,
+                          help="number of frames, 0 streams until source is exhausted or Ctrl+C (thread backend)")
+    pipeline.add_argument("--delay", dest="delay_frame", type=float, default=0.05,
+                          help="seconds between frames of Producer")
+    pipeline.add_argument("--shape", dest="picture_shape", default="768x1024", help="frame shape, ROWSxCOLS")
+    pipeline.add_argument("--resize", type=float, default=2, help="resize ratio")
+    pipeline.add_argument("--kernel", dest="kernel_filter", type=int, default=5, help="kernel of median filter")
+    pipeline.add_argument("--workers", type=int, default=os.cpu_count(),
+                          help="Consumer threads or processes")
+    pipeline.add_argument("--pool-size", type=int,
+                          help="frames of each shape kept in memory, 0 allocates every frame; "
+                          "defaults to 2 * workers + 2")
+
+    threads = parser.add_argument_group("thread backend")
+    threads.add_argument("--maxsize", type=int, default=102, help="capacity of queues")
+    threads.add_argument("--mode", default="separate", choices=("separate", "fused", "tiled"),
+                         help="fused: nearest-neighbor resize and filter in cache-sized stripes, "
+                         "tiled: filter tiles of large frames in parallel")
+    threads.add_argument("--kernels", default="opencv", choices=("opencv", "numpy", "auto"),
+                         help="implementation of resize and median filter")
+    threads.add_argument("--interpolation", default="linear", choices=INTERPOLATIONS,
+                         help="interpolation of resize in separate and tiled modes; nearest enables "
+                         "the numpy strided resize and exact resize of variants from each other")
+    threads.add_argument("--tile-size", default="256x0",
+                         help="tile of tiled mode, ROWSxCOLS, 0 is whole height or width")
+    threads.add_argument("--batch-size", type=int, default=1, help="frames processed at once by Consumer")
+    threads.add_argument("--source", default="random",
+                         help="random, generator, ring or bytes (synthetic frames), "
+                         "a directory of pictures, a .raw file or a video file")
+    threads.add_argument("--variants", nargs="+", metavar="RESIZE:KERNEL",
+                         help="variants made from one read, e.g. 2:5 4:3, saved to path/r2_k5/ etc.")
+    threads.add_argument("--cache-size", type=int, default=0, help="MiB of processed frames kept in memory")
+    threads.add_argument("--cache-path", help="directory of processed frames kept on disk")
+    threads.add_argument("--delta", type=float, metavar="THRESHOLD",
+                         help="save unchanged frames as references, e.g. 2.0")
+    threads.add_argument("--queue-policy", default="block", choices=("block", "drop-oldest", "drop-late"))
+    threads.add_argument("--lifetime", type=float, help="seconds from reading a frame to taking it from queue B, for drop-late")
+    threads.add_argument("--journal", help="journal file, e.g. ./processed/journal.txt; "
+                         "the next run resumes from the first frame not saved")
+    threads.add_argument("--memory-budget", type=int,
+                         help="bytes; adapts queues, workers and Producer rate while running")
+
+    sinks = parser.add_argument_group("sink")
+    sinks.add_argument("--sink", default="png", choices=("png", "archive"),
+                       help="archive writes all frames to path/frames.archive")
+    sinks.add_argument("--format", dest="fmt", default="png", choices=("png", "webp", "tiff", "npy"))
+    sinks.add_argument("--compression", type=int, help="PNG compression level 0-9")
+    sinks.add_argument("--writers", type=int, default=0, help="threads writing files in parallel")
+    sinks.add_argument("--capacity", type=int, help="frames in archive, required when streaming")
+
+    measure = parser.add_argument_group("measurement")
+    measure.add_argument("--metrics", dest="metrics_path", help="file of metrics, e.g. ./metrics.json")
+    measure.add_argument("--report-interval", type=float, default=1.0, help="seconds between metrics reports")
+    measure.add_argument("--profile", dest="profile_path", help="directory of flame graph stacks and summary")
+    measure.add_argument("--profile-interval", type=float, default=0.01, help="seconds between samples of stacks")
+    return parser
+
+
+def parse_args(argv: list = None) -> dict:
+    """Options from config file and command line.
+
+    Args:
+        argv (list, optional): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        dict: Options, keys are destinations of arguments.
+    """
+    parser = make_parser()
+    config = parser.parse_args(argv).config
+    if config is not None:
+        with open(config) as file:
+            defaults = json.load(file)
+        known = {action.dest for action in parser._actions}
+        unknown = set(defaults) - known
+        if unknown:
+            parser.error(f"unknown options in {config}: {', '.join(sorted(unknown))}")
+        parser.set_defaults(**defaults)
+    options = vars(parser.parse_args(argv))
+    del options["config"]
+    if options["frame_count"] == 0 and options["backend"] != "thread":
+        parser.error("streaming (--frames 0) is supported only by thread backend")
+    ignored = [
+        name for name in THREAD_OPTIONS
+        if options["backend"] != "thread" and options[name] != parser.get_default(name)
+    ]
+    if ignored:
+        parser.error(f"options {', '.join(ignored)} are supported only by thread backend")
+    if options["sink"] == "archive":
+        if options["capacity"] is None and options["frame_count"] == 0:
+            parser.error("archive sink needs --capacity when streaming (--frames 0)")
+        if options["capacity"] is not None and options["capacity"] <= 0:
+            parser.error("--capacity must be natural number bigger than 0")
+        if options["variants"]: # archive holds frames of one shape
+            parser.error("--variants are saved only by png sink")
+    return options
+
+
+def make_source(name: str, picture_shape: tuple):
+    from .source import Source, SOURCE_MODES, VideoSource, DirectorySource, RawSource
+
+    if name in SOURCE_MODES:
+        return Source((*picture_shape, 3), mode=name)
+    if os.path.isdir(name):
+        return DirectorySource(name)
+    if name.endswith(".raw"):
+        return RawSource(name, (*picture_shape, 3))
+    return VideoSource(name)
+
+
+def runner_options(options: dict) -> dict:
+    """Arguments of runner of backend made from options, e.g. Source of --source."""
+    options = dict(options)
+    options["frame_count"] = options["frame_count"] or None
+    options["picture_shape"] = tuple(int(size) for size in options["picture_shape"].split("x"))
+    if options["pool_size"] is None:
+        options["pool_size"] = 2 * options["workers"] + 2
+    if options.pop("backend") != "thread":
+        return {name: value for name, value in options.items() if name not in THREAD_OPTIONS}
+    from .cache import ResultCache
+    from .delta import DeltaDetector
+    from .journal import Journal
+
+    options["source"] = make_source(options["source"], options["picture_shape"])
+    options["tile_size"] = tuple(int(size) or None for size in options["tile_size"].split("x"))
+    if options["variants"]:
+        options["variants"] = [
+            (float(resize), int(kernel)) for resize, kernel in (variant.split(":") for variant in options["variants"])
+        ]
+    cache_size, cache_path = options.pop("cache_size"), options.pop("cache_path")
+    if cache_size or cache_path:
+        options["cache"] = ResultCache(max_bytes=cache_size * 2**20, path=cache_path)
+    if options["delta"] is not None:
+        options["delta"] = DeltaDetector(threshold=options["delta"])
+    if options["journal"] is not None:
+        options["journal"] = Journal(options["journal"])
+    return options
+
+
+def cli(argv: list = None) -> int:
+    """Entry point of producer-consumer console script."""
+    options = parse_args(argv)
+    # logging is off the hot path unless asked for
+    logging.basicConfig(level=options.pop("log_level").upper(), format=LOG_FORMAT)
+    if options.pop("dry_run"):
+        print(json.dumps(options, indent=2))
+        return 0
+    backend = options["backend"]
+    arguments = runner_options(options)
+    from .pipeline import PipelineError
+
+    wall, cpu = time.perf_counter(), os.times()
+    try:
+        saved = RUNNERS[backend](**arguments)
+    except PipelineError as error: # some stage stopped on error, other stages stopped after it
+        logging.error(error)
+        return 1
+    wall, end = time.perf_counter() - wall, os.times()
+    cpu = sum(end[:4]) - sum(cpu[:4]) # processes of process backend are children
+    # frames of file source can differ from --shape
+    rows, cols = (getattr(arguments.get("source"), "shape", None) or arguments["picture_shape"])[:2]
+    print(
+        f"{saved} frames in {wall:.2f} s: {saved / wall:.1f} fps, "
+        f"{saved * rows * cols * 3 / wall / 1e6:.1f} MB/s of input, CPU {100 * cpu / wall:.0f}%"
+    )
+    return 0
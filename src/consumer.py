@@ -1,11 +1,22 @@
 import threading
+import concurrent.futures
 import queue
 import logging
+import time
 import numpy as np
 import cv2
+from .counter import FrameCounter
+from .framepool import FramePool, acquire_or_stop
+from .processing import FrameProcessor
+from .metrics import Metrics
+from .stream import EOS
+from .cache import ResultCache
+from .delta import FrameRef
+from .sequence import Sequence
+from .deadline import put_or_stop
 
 
-class ConsumerThread(threading.Thread):
+class ConsumerThread(FrameProcessor, threading.Thread):
     def __init__(
         self,
         target: (queue, queue),
@@ -14,6 +25,19 @@ class ConsumerThread(threading.Thread):
         resize_ratio: float = 2,
         kernel: int = 5,
         frame_count: int = 100,
+        timeout: float = 0.1,
+        counter: FrameCounter = None,
+        pool: FramePool = None,
+        interpolation: int = cv2.INTER_LINEAR,
+        mode: str = "separate",
+        executor: concurrent.futures.Executor = None,
+        batch_size: int = 1,
+        metrics: Metrics = None,
+        variants: list = None,
+        cache: ResultCache = None,
+        tile_size: tuple = (256, None),
+        backend: str = "opencv",
+        sequence: Sequence = None,
     ):
         """Thread that recieve data from Producer via queue A, process and the send to queue B.
         Median filter and reduction of size is applied on the data.
@@ -27,7 +51,40 @@ class ConsumerThread(threading.Thread):
             name (str, optional): Name of the thread. Defaults to Consumer.
             resize_ratio (float, optional): Determine how many times picture should be resized. Defaults to 2.
             kernel (int, optional): Define kernel of median filter. Defaults to 5.
-            frame_count (int, optional): How many times data are taken from Source. Defaults to 100.
+            frame_count (int, optional): How many times data are taken from Source.
+            None means streaming mode, thread stops on EOS. Defaults to 100.
+            timeout (float, optional): How long (in seconds) thread blocks on empty queue A
+            before it checks whether other threads are interrupted. Defaults to 0.1.
+            counter (FrameCounter, optional): Counter of processed frames shared between
+            consumers that take data from the same queue A. Defaults to counter owned by the thread.
+            pool (FramePool, optional): Pool of buffers. Processed pictures are written to buffers
+            from the pool and input pictures are returned to it. Defaults to None.
+            interpolation (int, optional): Interpolation used by reduce_size. Defaults to cv2.INTER_LINEAR.
+            mode (str, optional): "separate" resizes whole picture and then filters it.
+            "fused" resizes with nearest-neighbor interpolation and filters picture stripe by stripe,
+            see src.fused.resize_median. "tiled" resizes whole picture and filters it tile by tile,
+            with the same result as "separate", see src.tiled.median_tiled. Defaults to "separate".
+            executor (concurrent.futures.Executor, optional): In "fused" and "tiled" modes, stripes
+            or tiles of one picture are processed in parallel by the executor. Defaults to None.
+            batch_size (int, optional): Maximal number of pictures taken from queue A at once.
+            If bigger than 1, pictures waiting in queue A are processed together and put to
+            queue B as one array of shape (N, height, width, channels). Defaults to 1.
+            metrics (Metrics, optional): Metrics of the pipeline. Defaults to None, nothing is measured.
+            variants (list, optional): Pairs (resize_ratio, kernel). If set, every picture is
+            processed with all of them and a dict {(resize_ratio, kernel): picture} is put to
+            queue B instead of one picture. Only "separate" mode without batches is supported.
+            Defaults to None, picture is processed with resize_ratio and kernel.
+            cache (ResultCache, optional): Cache of processed pictures. Picture found in
+            the cache is not processed again. Defaults to None.
+            tile_size (tuple, optional): Rows and columns of tile in "tiled" mode, None means
+            whole height or width. Defaults to (256, None).
+            backend (str, optional): Implementation of resize and median filter in "separate" mode:
+            "opencv", "numpy" (strided view for nearest-neighbor resize by integer ratio, median
+            of any type of data), or "auto", the fastest one measured by src.backends.select.
+            Steps that backend can not do are done by the other one. Defaults to "opencv".
+            sequence (Sequence, optional): Sequence of the pipeline. Indices and deadline of
+            input pictures are moved to the output, so sinks know them and frames keep
+            deadline set by Producer in queue B. Defaults to None.
         """
         super(ConsumerThread, self).__init__()
         self.target, self.target_B = target
@@ -36,60 +93,221 @@ class ConsumerThread(threading.Thread):
         self.sigkill = sigkill
         assert isinstance(self.sigkill, queue.Queue)
         self.name = name
-        self.resize_ratio = resize_ratio
-        self.kernel = kernel
+        self.init_processing(resize_ratio, kernel, interpolation, mode, executor, tile_size, backend)
         self.frame_count = frame_count
-        assert (isinstance(self.frame_count, int) and self.frame_count > 0
+        assert (self.frame_count is None or isinstance(self.frame_count, int) and self.frame_count > 0
         ), "Number of data must be natural number bigger than 0"
-        
+        self.timeout = timeout
+        self.counter = counter if counter is not None else FrameCounter(frame_count)
+        assert isinstance(self.counter, FrameCounter)
+        self.counter.add_worker()
+        self.pool = pool
+        self.batch_size = batch_size
+        assert (isinstance(self.batch_size, int) and self.batch_size > 0
+        ), "Size of batch must be natural number bigger than 0"
+        self._pending = None # picture taken from queue A that did not fit in last batch
+        # smaller ratios first, so resized picture can be computed from the previous one
+        self.variants = sorted(set(variants)) if variants else None
+        assert self.variants is None or (self.mode == "separate" and self.batch_size == 1
+        ), "Variants are supported only in separate mode without batches"
+        self.cache = cache
+        self.metrics = metrics
+        self.stats = metrics.stage("Consumer") if metrics is not None else None
+        self.sequence = sequence
+        self._stop_requested = threading.Event()
+        self.busy_time = 0.0 # seconds spent on processing, used to estimate service time
         return
 
+    def stop(self):
+        """Ask thread to stop after the current picture. Other consumers sharing
+        the counter process the remaining data."""
+        self._stop_requested.set()
+
     def run(self):
-        idx = 0
-        while True:
-            if not self.target.empty():
-                try:
-                    item = self.target.get()
-                    item = self.reduce_size(item)
-                    item = self.apply_filter(item)
-                    self.target_B.put(item)
-                    logging.debug(str(self.target.qsize()) + " items in queue a")
-                    logging.debug(str(self.target_B.qsize()) + " items in queue b")
-                    idx += 1
-                except: # send info to other threads that error occur here, and thread is stopped.
-                    logging.error("thread dead!")
-                    self.sigkill.put(self.name)
+        item = self.consume()
+        # the last consumer passes EOS to queue B, others leave it in queue A for the rest.
+        # If queue B can drop frames, SavePicture can not count them, so EOS is always passed.
+        if self.counter.remove_worker(ended=item is EOS or getattr(self.target_B, "lossy", False)):
+            put_or_stop(self.target_B, EOS, self.sigkill, timeout=self.timeout)
+        elif item is EOS:
+            put_or_stop(self.target, EOS, self.sigkill, timeout=self.timeout)
+        return
+
+    def consume(self):
+        """Process data until all of them are processed, EOS is taken from queue A,
+        stop is requested or other thread is interrupted.
+
+        Returns:
+            EOS if thread is stopped by it, None otherwise.
+        """
+        # stop thread when all data are processed or stop is requested
+        while not self.counter.finished() and not self._stop_requested.is_set():
+            if self._pending is not None:
+                item, self._pending = self._pending, None
+            else:
+                try: # block until data arrive instead of polling the queue
+                    item = self.target.get(timeout=self.timeout)
+                except queue.Empty:
+                    if not self.sigkill.empty(): # stop thread if error occur in other threads
+                        break
+                    continue
+            if item is EOS:
+                return EOS
+            if isinstance(item, FrameRef): # unchanged picture, its keyframe is processed
+                deadline = self.sequence.deadline(item) if self.sequence is not None else None
+                if not put_or_stop(self.target_B, item, self.sigkill, deadline, self.timeout):
+                    break # stop thread if error occur in other threads
+                self.counter.increment()
+                continue
+            try:
+                batch = self.next_batch(item) if self.batch_size > 1 else (item,)
+                start = time.perf_counter()
+                if self.metrics is not None:
+                    born = self.metrics.unstamp_batch(batch, self.stats)
+                # taken before processing, which returns pictures to the pool
+                indices = deadline = None
+                if self.sequence is not None:
+                    deadline = self.sequence.deadline(*batch)
+                    indices = self.sequence.take_batch(batch)
+                if self.batch_size > 1:
+                    item = self.process_batch(batch)
+                elif self.variants:
+                    item = self.process_variants(item)
+                else:
+                    item = self.process(item)
+                if item is None: # stop thread if error occur in other threads
                     break
-            elif not self.sigkill.empty(): # stop thread if error occur in other threads
-                return
-            if idx == self.frame_count: # stop thread when all data are processed
+                elapsed = time.perf_counter() - start
+                self.busy_time += elapsed
+                if self.metrics is not None:
+                    self.stats.record("process", elapsed)
+                    self.stats.count(len(batch))
+                    self.metrics.stamp(item, born)
+                if indices is not None:
+                    self.sequence.tag(item, indices, deadline)
+                if not put_or_stop(self.target_B, item, self.sigkill, deadline, self.timeout):
+                    break # stop thread if error occur in other threads
+                if logging.root.isEnabledFor(logging.DEBUG): # qsize takes lock of queue
+                    logging.debug(f"{self.target.qsize()} items in queue a")
+                    logging.debug(f"{self.target_B.qsize()} items in queue b")
+                self.counter.increment(len(batch))
+            except: # send info to other threads that error occur here, and thread is stopped.
+                logging.error("thread dead!")
+                self.sigkill.put(self.name)
                 break
-        return
+        if self._pending is not None: # picture of the next batch is left for other consumers
+            item, self._pending = self._pending, None
+            put_or_stop(self.target, item, self.sigkill, timeout=self.timeout)
+        return None
+
+    def next_batch(self, picture):
+        """Take pictures that are already waiting in queue A, without blocking.
+        All pictures of the batch have the same shape as the first one.
+
+        Args:
+            picture (np.ndarray): First picture of the batch.
+
+        Returns:
+            list: At most batch_size pictures.
+        """
+        batch = [picture]
+        while len(batch) < self.batch_size:
+            try:
+                item = self.target.get_nowait()
+            except queue.Empty:
+                break
+            if item is EOS or isinstance(item, FrameRef) or item.shape != picture.shape:
+                # start next batch with it
+                self._pending = item
+                break
+            batch.append(item)
+        return batch
 
-    def apply_filter(self, picture):
-        """Apply median filter on picture. It uses opencv implementation.
-        Kernel size is defined in constructor of the class, defaults to 5.
+    def process_batch(self, pictures):
+        """Process pictures of the same shape and stack results into one array.
+
+        Args:
+            pictures (list): Pictures.
+
+        Returns:
+            np.ndarray: Processed pictures of shape (N, height, width, channels), or None
+            if other thread is interrupted while waiting for buffer from the pool.
+        """
+        shape = (len(pictures), *self.resized_shape(pictures[0].shape))
+        if self.pool is None:
+            out = np.empty(shape, dtype=pictures[0].dtype)
+        else:
+            out = acquire_or_stop(self.pool, shape, self.sigkill, self.timeout)
+            if out is None:
+                return None
+        for picture, dst in zip(pictures, out):
+            self.process(picture, dst=dst)
+        return out
+
+    def process_variants(self, picture):
+        """Reduce size of picture and apply median filter on it with every pair
+        (resize_ratio, kernel) of variants. Pictures of the same size are resized
+        only once. A smaller size is computed from the previous, bigger one only when
+        it gives the same picture as resizing of the original one: nearest neighbour
+        interpolation with integer ratios that divide the picture and each other.
+        Otherwise it is resized from the original picture.
 
         Args:
             picture (np.ndarray): Picture.
 
         Returns:
-            np.ndarray: Picture.
+            dict: Processed pictures by (resize_ratio, kernel).
         """
-        return cv2.medianBlur(picture, ksize=self.kernel)
+        results = {}
+        level, level_ratio = picture, 1
+        for resize_ratio, kernel in self.variants:
+            if resize_ratio != level_ratio:
+                height, width = self.resized_shape(picture.shape, resize_ratio)[:2]
+                exact = (
+                    self.interpolation == cv2.INTER_NEAREST
+                    and resize_ratio % level_ratio == 0
+                    and picture.shape[0] % resize_ratio == 0
+                    and picture.shape[1] % resize_ratio == 0
+                )
+                level = cv2.resize(
+                    level if exact else picture, (width, height), interpolation=self.interpolation
+                )
+                level_ratio = resize_ratio
+            results[(resize_ratio, kernel)] = cv2.medianBlur(level, ksize=kernel)
+        if self.pool is not None:
+            self.pool.release(picture)
+        return results
 
-    def reduce_size(self, picture):
-        """Reduce size of picture. It uses default nearest-neighbor
-        interpolation. Dimensions are changed accordingly to resize_ratio
-        set in class constructor. It preserves aspect ratio.
+    def process(self, picture, dst=None):
+        """Reduce size of picture and apply median filter on it.
+        If pool is set, no memory is allocated: result is written to buffer
+        from the pool and input picture is returned to the pool.
 
         Args:
-            picture (np.ndarray): _description_
+            picture (np.ndarray): Picture.
+            dst (np.ndarray, optional): Array for the result. Defaults to buffer from the pool,
+            or new array if pool is not set.
 
         Returns:
-            np.ndarray: Resized picture.
+            np.ndarray: Processed picture, or None if other thread is interrupted
+            while waiting for buffer from the pool.
         """
-        width = int(picture.shape[1] / self.resize_ratio)
-        height = int(picture.shape[0] / self.resize_ratio)
-        new_dim = (width, height)
-        return cv2.resize(picture, new_dim)
+        if self.cache is not None:
+            key = self.cache.key(picture, self.resize_ratio, self.kernel, self.mode, self.interpolation)
+            cached = self.cache.get(key)
+            if cached is not None: # no buffer from the pool is needed
+                if dst is not None:
+                    np.copyto(dst, cached)
+                if self.pool is not None:
+                    self.pool.release(picture)
+                return dst if dst is not None else cached[...] # new view, so items are distinct
+        if dst is None and self.pool is not None:
+            dst = acquire_or_stop(self.pool, self.resized_shape(picture.shape), self.sigkill, self.timeout)
+            if dst is None:
+                return None
+        dst = self.transform(picture, dst)
+        if self.cache is not None:
+            self.cache.put(key, dst)
+        if self.pool is not None:
+            self.pool.release(picture)
+        return dst
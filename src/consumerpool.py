@@ -0,0 +1,111 @@
+import os
+import threading
+import queue
+from .consumer import ConsumerThread
+from .counter import FrameCounter
+from .framepool import FramePool
+
+
+class ConsumerPool:
+    def __init__(
+        self,
+        target: (queue, queue),
+        sigkill: queue,
+        name: str = "Consumer",
+        workers: int = None,
+        resize_ratio: float = 2,
+        kernel: int = 5,
+        frame_count: int = 100,
+        timeout: float = 0.1,
+        pool: FramePool = None,
+        **kwargs,
+    ):
+        """Group of Consumer threads that take data from the same queue A
+        and put processed data to the same queue B. OpenCV releases the GIL
+        while resizing and filtering, so workers run in parallel.
+        Workers share one counter of processed frames, so the whole pool
+        stops when frame_count frames are processed.
+        Order of data in queue B is not guaranteed for more than one worker.
+
+        Args:
+            target (queue, queue): queue share data between threads.
+            sigkill (queue): queue that is shared between all the threads.
+            It keeps track whether any of them is interrupted.
+            In such case, the rest should be stopped.
+            name (str, optional): Prefix of names of the threads. Defaults to Consumer.
+            workers (int, optional): Number of threads. Defaults to number of CPUs.
+            resize_ratio (float, optional): Determine how many times picture should be resized. Defaults to 2.
+            kernel (int, optional): Define kernel of median filter. Defaults to 5.
+            frame_count (int, optional): How many times data are taken from Source.
+            None means streaming mode, workers stop on EOS. Defaults to 100.
+            timeout (float, optional): How long (in seconds) workers block on empty queue A
+            before they check whether other threads are interrupted. Defaults to 0.1.
+            pool (FramePool, optional): Pool of buffers shared by workers. Defaults to None.
+            **kwargs: Other arguments of ConsumerThread, e.g. mode or executor.
+        """
+        self.name = name
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        assert (isinstance(self.workers, int) and self.workers > 0
+        ), "Number of workers must be natural number bigger than 0"
+        self.counter = FrameCounter(frame_count)
+        self.frame_count = frame_count
+        self._options = dict(
+            target=target,
+            sigkill=sigkill,
+            resize_ratio=resize_ratio,
+            kernel=kernel,
+            frame_count=frame_count,
+            timeout=timeout,
+            counter=self.counter,
+            pool=pool,
+            **kwargs,
+        )
+        self.threads = [self._new_worker(i) for i in range(self.workers)]
+        self.active = list(self.threads) # workers that are not asked to stop
+        self._started = False
+        self._lock = threading.Lock()
+        return
+
+    def _new_worker(self, i):
+        return ConsumerThread(name=f"{self.name}-{i}", **self._options)
+
+    def start(self):
+        self._started = True
+        for thread in self.threads:
+            thread.start()
+
+    def resize(self, workers: int):
+        """Change number of working threads. New threads start at once, removed
+        threads finish the picture they are processing.
+
+        Args:
+            workers (int): Number of threads.
+        """
+        assert (isinstance(workers, int) and workers > 0
+        ), "Number of workers must be natural number bigger than 0"
+        with self._lock:
+            while len(self.active) < workers:
+                thread = self._new_worker(len(self.threads))
+                self.threads.append(thread)
+                self.active.append(thread)
+                if self._started:
+                    thread.start()
+            while len(self.active) > workers:
+                self.active.pop().stop()
+            self.workers = workers
+
+    def join(self, timeout: float = None):
+        joined = 0
+        while joined < len(self.threads): # threads can be added while waiting
+            with self._lock:
+                threads = self.threads[joined:]
+            for thread in threads:
+                thread.join(timeout)
+            joined += len(threads)
+
+    def busy_time(self) -> float:
+        """Seconds spent on processing by all threads."""
+        return sum(thread.busy_time for thread in self.threads)
+
+    def is_alive(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
@@ -0,0 +1,135 @@
+import threading
+import os
+import logging
+import queue
+import math
+import numpy as np
+from .producer import ProducerThread
+from .consumerpool import ConsumerPool
+
+
+def set_maxsize(target: queue.Queue, maxsize: int):
+    """Change capacity of queue at runtime. Items above new capacity are not removed,
+    but no new item is accepted until queue is below it.
+
+    Args:
+        target (queue.Queue): Queue.
+        maxsize (int): New capacity.
+    """
+    with target.mutex:
+        target.maxsize = maxsize
+        target.not_full.notify_all() # wake up threads waiting for bigger queue
+
+
+class AdaptiveController(threading.Thread):
+    def __init__(
+        self,
+        producer: ProducerThread,
+        consumers: ConsumerPool,
+        queues: (queue.Queue, queue.Queue),
+        memory_budget: int = 256 * 2 ** 20,
+        interval: float = 0.2,
+        min_workers: int = 1,
+        max_workers: int = None,
+        high_watermark: float = 0.5,
+        max_delay: float = 0.1,
+        name: str = "Controller",
+    ):
+        """Thread that tunes the pipeline while it runs. Every interval it:
+
+        - sets capacity of queues A and B so that frames in queues and in Consumer
+          threads fit in memory_budget,
+        - adds Consumer threads when queue A fills up and removes them when queue A
+          stays empty, using measured service time of Consumer to decide how many are needed,
+        - throttles Producer when queue A is above high_watermark, and removes the
+          delay again when Consumer catches up.
+
+        Args:
+            producer (ProducerThread): Thread putting data to queue A.
+            consumers (ConsumerPool): Threads taking data from queue A.
+            queues (queue.Queue, queue.Queue): Queues A and B.
+            memory_budget (int, optional): Bytes for frames waiting in queues or being processed.
+            Defaults to 256 MiB.
+            interval (float, optional): Seconds between adjustments. Defaults to 0.2.
+            min_workers (int, optional): Minimal number of Consumer threads. Defaults to 1.
+            max_workers (int, optional): Maximal number of Consumer threads.
+            Defaults to number of CPUs.
+            high_watermark (float, optional): Fill level of queue A (fraction of capacity)
+            above which Consumer is considered too slow. Defaults to 0.5.
+            max_delay (float, optional): Maximal delay between frames of Producer in seconds.
+            Defaults to 0.1.
+            name (str, optional): Name of the thread. Defaults to "Controller".
+        """
+        super(AdaptiveController, self).__init__(daemon=True)
+        self.producer = producer
+        assert isinstance(self.producer, ProducerThread)
+        self.consumers = consumers
+        assert isinstance(self.consumers, ConsumerPool)
+        self.queue_a, self.queue_b = queues
+        assert isinstance(self.queue_a, queue.Queue)
+        assert isinstance(self.queue_b, queue.Queue)
+        self.memory_budget = memory_budget
+        self.interval = interval
+        self.min_workers = min_workers
+        self.max_workers = max_workers or os.cpu_count() or 1
+        assert 0 < self.min_workers <= self.max_workers
+        self.high_watermark = high_watermark
+        self.max_delay = max_delay
+        self.name = name
+        shape = (*producer.picture_shape, 3)
+        consumer = consumers.threads[0]
+        self.frame_bytes = int(np.prod(shape)) + int(np.prod(consumer.resized_shape(shape)))
+        self._stop_requested = threading.Event()
+        self.headroom = 1.2 # workers for 20% more frames than arrive
+        self._previous = None # (produced, consumed, busy time) at previous step
+        return
+
+    def run(self):
+        while not self._stop_requested.wait(self.interval):
+            if not (self.producer.is_alive() or self.consumers.is_alive()):
+                break
+            self.step(self.interval)
+        return
+
+    def stop(self):
+        self._stop_requested.set()
+
+    def step(self, elapsed: float):
+        """Adjust the pipeline once.
+
+        Args:
+            elapsed (float): Seconds since previous step.
+        """
+        workers = self.consumers.workers
+        depth = self.queue_a.qsize()
+        capacity = self.queue_a.maxsize or math.inf
+
+        # Producer: multiplicative increase of delay when queue A fills up, decrease when it drains
+        if depth >= self.high_watermark * capacity:
+            self.producer.delay_frame = min(self.max_delay, max(2 * self.producer.delay_frame, 0.001))
+        elif depth <= 1:
+            self.producer.delay_frame = self.producer.delay_frame / 2 if self.producer.delay_frame > 0.001 else 0
+
+        # Consumer: workers needed to serve frames at rate they arrive
+        produced, consumed = self.producer.produced, self.consumers.counter.count
+        busy = self.consumers.busy_time()
+        if self._previous is not None and elapsed > 0:
+            arrival = (produced - self._previous[0]) / elapsed
+            frames, busy_time = consumed - self._previous[1], busy - self._previous[2]
+            needed = workers
+            if frames > 0 and busy_time > 0:
+                service_time = busy_time / frames # seconds of one worker per frame
+                needed = math.ceil(self.headroom * arrival * service_time)
+            if depth >= self.high_watermark * capacity:
+                needed = max(needed, workers + 1)
+            needed = min(self.max_workers, max(self.min_workers, needed))
+            if needed != workers:
+                logging.debug(f"{workers} -> {needed} Consumer threads")
+                self.consumers.resize(needed)
+                workers = needed
+        self._previous = (produced, consumed, busy)
+
+        # queues: frames in both queues and in Consumer threads fit in memory budget
+        maxsize = max(1, self.memory_budget // self.frame_bytes - workers)
+        set_maxsize(self.queue_a, maxsize)
+        set_maxsize(self.queue_b, maxsize)
@@ -0,0 +1,66 @@
+import threading
+
+
+class FrameCounter:
+    def __init__(self, frame_count: int = 100):
+        """Thread-safe counter of processed frames. It is shared between
+        workers of one stage, so the stage is finished when all of them
+        together processed frame_count frames. It also counts workers,
+        so in streaming mode the last worker knows it has to pass EOS on.
+
+        Args:
+            frame_count (int, optional): How many times data are taken from Source.
+            None means streaming mode, the stage is finished by EOS. Defaults to 100.
+        """
+        self.frame_count = frame_count
+        assert (self.frame_count is None or isinstance(self.frame_count, int) and self.frame_count > 0
+        ), "Number of data must be natural number bigger than 0"
+        self._count = 0
+        self._workers = 0
+        self._ended = False
+        self._lock = threading.Lock()
+        return
+
+    def increment(self, n: int = 1) -> int:
+        """Mark n frames as processed.
+
+        Args:
+            n (int, optional): Number of processed frames. Defaults to 1.
+
+        Returns:
+            int: Number of frames processed so far.
+        """
+        with self._lock:
+            self._count += n
+            return self._count
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def finished(self) -> bool:
+        """Check whether all frames are processed.
+
+        Returns:
+            bool: True if frame_count frames are processed.
+        """
+        return self.frame_count is not None and self._count >= self.frame_count
+
+    def add_worker(self):
+        with self._lock:
+            self._workers += 1
+
+    def remove_worker(self, ended: bool = False) -> bool:
+        """Mark worker as stopped.
+
+        Args:
+            ended (bool, optional): Worker stopped because it got EOS. Defaults to False.
+
+        Returns:
+            bool: True if it was the last working worker and EOS was seen by any worker,
+            so EOS must be passed to the next stage.
+        """
+        with self._lock:
+            self._workers -= 1
+            self._ended = self._ended or ended
+            return self._workers == 0 and self._ended
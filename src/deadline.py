@@ -0,0 +1,152 @@
+import collections
+import heapq
+import itertools
+import math
+import queue
+import time
+from .stream import EOS
+
+POLICIES = ("block", "drop-oldest", "drop-late")
+
+
+class DeadlineQueue(queue.Queue):
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: str = "block",
+        lifetime: float = None,
+        on_drop=None,
+    ):
+        """Queue between stages, in which frames have priorities and deadlines.
+        Frames with higher priority are taken first, frames with the same priority
+        in order of arrival. EOS is never dropped and it is always taken last.
+        What happens to frames depends on policy:
+
+        - "block": no frame is dropped, put() waits for free slot, like queue.Queue;
+        - "drop-oldest": put() to full queue drops the oldest frame;
+        - "drop-late": frames whose deadline passed are dropped before they are taken,
+          so no work is spent on them, and put() to full queue waits only if no frame is late.
+
+        Args:
+            maxsize (int, optional): Capacity of the queue. Defaults to 0, unbounded.
+            policy (str, optional): "block", "drop-oldest" or "drop-late". Defaults to "block".
+            lifetime (float, optional): Default deadline of frames, in seconds after put(),
+            used by "drop-late" policy. Producer stamps frames with deadline once, see expiry,
+            and Consumer carries it to the next queue. Defaults to None, frames without
+            deadline never expire.
+            on_drop (callable, optional): Called with every dropped frame, e.g. FramePool.release.
+            It is called with lock of the queue held. Defaults to None.
+        """
+        super(DeadlineQueue, self).__init__(maxsize)
+        self.policy = policy
+        assert self.policy in POLICIES, f"Policy must be one of {POLICIES}"
+        self.lifetime = lifetime
+        self.on_drop = on_drop
+        self.drops = collections.Counter() # dropped frames by reason
+        return
+
+    @property
+    def lossy(self) -> bool:
+        """Whether frames can be dropped, so stages must not wait for a fixed number of them."""
+        return self.policy != "block"
+
+    def expiry(self) -> float:
+        """Deadline of frame that is created now, lifetime seconds from now."""
+        return time.monotonic() + self.lifetime if self.lifetime is not None else math.inf
+
+    def _init(self, maxsize):
+        self.queue = [] # heap of (rank, sequence number, deadline, item)
+        self._sequence = itertools.count()
+
+    def _qsize(self):
+        # late frames are not counted, they are dropped whenever size is checked
+        now = time.monotonic()
+        if self.policy == "drop-late" and any(deadline < now for _, _, deadline, _ in self.queue):
+            self._drop([entry for entry in self.queue if entry[2] < now], "late")
+        return len(self.queue)
+
+    def _put(self, entry):
+        heapq.heappush(self.queue, entry)
+
+    def _get(self):
+        return heapq.heappop(self.queue)[3]
+
+    def _drop(self, entries, reason):
+        dropped = {id(entry) for entry in entries}
+        self.queue[:] = [entry for entry in self.queue if id(entry) not in dropped]
+        heapq.heapify(self.queue)
+        self.drops[reason] += len(entries)
+        self.unfinished_tasks -= len(entries)
+        if self.unfinished_tasks <= 0:
+            self.all_tasks_done.notify_all()
+        self.not_full.notify(len(entries))
+        if self.on_drop is not None:
+            for entry in entries:
+                self.on_drop(entry[3])
+
+    def put(self, item, block=True, timeout=None, priority: float = 0, deadline: float = None):
+        """Put item into the queue. Arguments block and timeout work as in queue.Queue.
+
+        Args:
+            item: Frame or EOS.
+            priority (float, optional): Priority of frame, higher is taken first. Defaults to 0.
+            deadline (float, optional): Time (time.monotonic) after which frame is dropped.
+            Defaults to lifetime seconds from now.
+        """
+        if item is EOS:
+            rank, deadline = math.inf, math.inf
+        else:
+            rank = -priority
+            if deadline is None:
+                deadline = self.expiry()
+        with self.not_full:
+            if self.maxsize > 0 and self._qsize() >= self.maxsize and self.policy == "drop-oldest":
+                frames = [entry for entry in self.queue if entry[0] != math.inf]
+                if frames:
+                    self._drop([min(frames, key=lambda entry: entry[1])], "oldest")
+            if self.maxsize > 0:
+                if not block:
+                    if self._qsize() >= self.maxsize:
+                        raise queue.Full
+                else:
+                    endtime = None if timeout is None else time.monotonic() + timeout
+                    while self._qsize() >= self.maxsize:
+                        remaining = None if endtime is None else endtime - time.monotonic()
+                        if remaining is not None and remaining <= 0.0:
+                            raise queue.Full
+                        if self.policy == "drop-late": # wake up when the first frame is late
+                            first = min(entry[2] for entry in self.queue) - time.monotonic()
+                            remaining = first if remaining is None else min(remaining, first)
+                            remaining = None if remaining == math.inf else max(remaining, 0.001)
+                        self.not_full.wait(remaining)
+            self._put((rank, next(self._sequence), deadline, item))
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+def put_or_stop(
+    target: queue.Queue, item, sigkill: queue.Queue, deadline: float = None, timeout: float = 0.1
+) -> bool:
+    """Put item to queue between stages, checking every timeout seconds whether
+    any thread is interrupted, so stages do not wait forever for full queue of
+    stage that is dead. Deadline is passed only to DeadlineQueue, other queues
+    do not drop frames.
+
+    Args:
+        target (queue.Queue): Queue.
+        item: Frame or EOS.
+        sigkill (queue.Queue): queue that is shared between all the threads.
+        deadline (float, optional): Deadline of frame, see DeadlineQueue.put.
+        timeout (float, optional): How often sigkill is checked. Defaults to 0.1.
+
+    Returns:
+        bool: True if item is put, False if other thread is interrupted.
+    """
+    options = {"deadline": deadline} if deadline is not None and isinstance(target, DeadlineQueue) else {}
+    while True:
+        try:
+            target.put(item, timeout=timeout, **options)
+            return True
+        except queue.Full:
+            if not sigkill.empty():
+                return False
@@ -0,0 +1,121 @@
+import collections
+import numpy as np
+
+
+class FrameRef:
+    def __init__(self, keyframe: int):
+        """Put to queues in place of a picture that did not change since the last
+        changed picture (keyframe). Consumer passes it on without processing,
+        and sinks record it as a reference to the output of the keyframe.
+
+        Args:
+            keyframe (int): Index of the keyframe in order of Producer, the same index
+            as Producer gives to it in Sequence.
+        """
+        self.keyframe = keyframe
+
+    def __repr__(self):
+        return f"FrameRef({self.keyframe})"
+
+
+class DeltaDetector:
+    def __init__(self, threshold: float = 2.0, step: int = 8):
+        """Cheap detection of changes between consecutive pictures. Pictures are
+        downsampled by taking every step-th pixel in both directions, and mean absolute
+        difference to the last keyframe is compared with threshold. Comparing with the
+        keyframe instead of the previous picture avoids drift of slow changes.
+
+        Args:
+            threshold (float, optional): Mean absolute difference of pixel values above
+            which picture is changed. Defaults to 2.0.
+            step (int, optional): Step of downsampling. Defaults to 8.
+        """
+        self.threshold = threshold
+        self.step = step
+        assert (isinstance(self.step, int) and self.step > 0
+        ), "Step must be natural number bigger than 0"
+        self.keyframes = 0 # changed pictures seen so far
+        self.skipped = 0 # unchanged pictures seen so far
+        self._sample = None
+        self._keyframe = None # index of the last keyframe
+        return
+
+    def check(self, picture: np.ndarray, idx: int = None):
+        """Compare picture with the last keyframe.
+
+        Args:
+            picture (np.ndarray): Picture.
+            idx (int, optional): Index of picture in order of Producer. Defaults to number
+            of pictures checked before it.
+
+        Returns:
+            FrameRef to the last keyframe if picture did not change, None if it is a new keyframe.
+        """
+        idx = idx if idx is not None else self.keyframes + self.skipped
+        sample = picture[::self.step, ::self.step].astype(np.int16)
+        if (
+            self._sample is not None
+            and self._sample.shape == sample.shape
+            and np.abs(sample - self._sample).mean() <= self.threshold
+        ):
+            self.skipped += 1
+            return FrameRef(self._keyframe)
+        self._sample = sample
+        self._keyframe = idx
+        self.keyframes += 1
+        return None
+
+
+class References:
+    def __init__(self):
+        """Index of outputs of keyframes in a sink. It resolves FrameRef to index of
+        output in the sink. Keyframes are known by their index in order of Producer,
+        not by order of arrival, which several Consumers change;
+        FrameRef that arrives before its keyframe waits for it.
+        """
+        self.keyframes = {} # index of output by index of keyframe in order of Producer
+        self._waiting = collections.defaultdict(list)
+
+    def keyframe(self, keyframe: int, idx: int) -> list:
+        """Record output of keyframe.
+
+        Args:
+            keyframe (int): Index of keyframe in order of Producer.
+            idx (int): Index of output in the sink.
+
+        Returns:
+            list: Pairs (index, index of referenced output) resolved by this keyframe.
+        """
+        self.keyframes[keyframe] = idx
+        return [(ref_idx, idx) for ref_idx in self._waiting.pop(keyframe, [])]
+
+    def reference(self, ref: FrameRef, idx: int) -> list:
+        """Record reference.
+
+        Args:
+            ref (FrameRef): Reference taken from queue.
+            idx (int): Index of reference in the sink.
+
+        Returns:
+            list: Pair (index, index of referenced output), or nothing if keyframe has not arrived yet.
+        """
+        if ref.keyframe in self.keyframes:
+            return [(idx, self.keyframes[ref.keyframe])]
+        self._waiting[ref.keyframe].append(idx)
+        return []
+
+    def drop(self, keyframes) -> int:
+        """Drop references waiting for keyframes that will not arrive, e.g. dropped by queue.
+
+        Args:
+            keyframes (set): Indices of keyframes, e.g. Sequence.dropped.
+
+        Returns:
+            int: Number of dropped references.
+        """
+        dropped = [keyframe for keyframe in self._waiting if keyframe in keyframes]
+        return sum(len(self._waiting.pop(keyframe)) for keyframe in dropped)
+
+    def waiting(self) -> int:
+        """Number of references whose keyframe has not arrived."""
+        return sum(len(refs) for refs in self._waiting.values())
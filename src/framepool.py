@@ -0,0 +1,92 @@
+import threading
+import queue
+import numpy as np
+
+
+class FramePool:
+    def __init__(self, size: int = 8):
+        """Bounded pool of numpy buffers shared by all threads of the pipeline.
+        Buffers are grouped by shape and type. A buffer is allocated only when
+        no buffer of the same shape is free and fewer than size buffers of that
+        shape exist, so in steady state frames are not allocated at all.
+        When all buffers are in use, acquire() blocks until one is released.
+
+        Args:
+            size (int, optional): Maximal number of buffers of one shape and type.
+            Defaults to 8.
+        """
+        self.size = size
+        assert (isinstance(self.size, int) and self.size > 0
+        ), "Size of pool must be natural number bigger than 0"
+        self.allocations = 0 # number of allocated buffers, constant in steady state
+        self._free = {}
+        self._owned = {}
+        self._count = {}
+        self._lock = threading.Condition()
+        return
+
+    @staticmethod
+    def _key(shape, dtype):
+        return tuple(shape), np.dtype(dtype).str
+
+    def acquire(self, shape: tuple, dtype: type = np.uint8, timeout: float = None) -> np.ndarray:
+        """Take buffer of given shape and type. Content of the buffer is undefined.
+
+        Args:
+            shape (tuple): Shape of buffer.
+            dtype (type, optional): Type of buffer. Defaults to np.uint8.
+            timeout (float, optional): How long to wait for released buffer. Defaults to None.
+
+        Raises:
+            queue.Empty: No buffer was released in timeout.
+
+        Returns:
+            np.ndarray: Buffer.
+        """
+        key = self._key(shape, dtype)
+        with self._lock:
+            while True:
+                free = self._free.setdefault(key, [])
+                if free:
+                    return free.pop()
+                if self._count.get(key, 0) < self.size:
+                    buffer = np.empty(shape, dtype=dtype)
+                    self._owned[id(buffer)] = buffer
+                    self._count[key] = self._count.get(key, 0) + 1
+                    self.allocations += 1
+                    return buffer
+                if not self._lock.wait(timeout):
+                    raise queue.Empty
+
+    def release(self, buffer: np.ndarray):
+        """Give buffer back to the pool. Arrays that do not come from the pool are ignored.
+
+        Args:
+            buffer (np.ndarray): Buffer taken by acquire().
+        """
+        if self._owned.get(id(buffer)) is not buffer:
+            return
+        with self._lock:
+            self._free[self._key(buffer.shape, buffer.dtype)].append(buffer)
+            self._lock.notify_all()
+
+
+def acquire_or_stop(pool: FramePool, shape: tuple, sigkill: queue.Queue, timeout: float = 0.1):
+    """Wait for buffer from the pool, checking every timeout seconds whether
+    any thread is interrupted.
+
+    Args:
+        pool (FramePool): Pool of buffers.
+        shape (tuple): Shape of buffer.
+        sigkill (queue.Queue): queue that is shared between all the threads.
+        timeout (float, optional): How often sigkill is checked. Defaults to 0.1.
+
+    Returns:
+        np.ndarray: Buffer, or None if other thread is interrupted.
+    """
+    while True:
+        try:
+            return pool.acquire(shape, timeout=timeout)
+        except queue.Empty:
+            if not sigkill.empty():
+                return None
@@ -0,0 +1,89 @@
+import functools
+import concurrent.futures
+import numpy as np
+import cv2
+
+L2_CACHE_SIZE = 256 * 1024 # bytes, working set of one stripe should fit in it
+
+
+@functools.lru_cache(maxsize=32)
+def _row_map(src_rows: int, dst_rows: int) -> np.ndarray:
+    """Rows of source picked by nearest-neighbor cv2.resize for each row of result.
+    Mapping is computed by OpenCV itself, so it is exactly the same as in cv2.resize.
+    """
+    rows = np.arange(src_rows, dtype=np.int32).reshape(-1, 1)
+    return cv2.resize(rows, (1, dst_rows), interpolation=cv2.INTER_NEAREST)[:, 0]
+
+
+def stripe_rows(shape: tuple, new_shape: tuple, kernel: int) -> int:
+    """Number of rows of result in one stripe, such that source rows,
+    resized rows and filtered rows of the stripe fit in L2 cache.
+
+    Args:
+        shape (tuple): Shape of picture.
+        new_shape (tuple): Shape of resized picture.
+        kernel (int): Kernel of median filter.
+
+    Returns:
+        int: Number of rows.
+    """
+    row_bytes = int(np.prod(shape[1:])) + 2 * int(np.prod(new_shape[1:]))
+    return max(kernel, L2_CACHE_SIZE // row_bytes - kernel + 1)
+
+
+def _process_stripe(picture, dst, row_map, start, stop, kernel):
+    half = kernel // 2
+    # stripe is extended by half of kernel, so median is exact at its borders
+    first, last = max(0, start - half), min(len(row_map), stop + half)
+    rows = np.take(picture, row_map[first:last], axis=0)
+    resized = cv2.resize(rows, (dst.shape[1], last - first), interpolation=cv2.INTER_NEAREST)
+    filtered = cv2.medianBlur(resized, ksize=kernel)
+    dst[start:stop] = filtered[start - first:stop - first]
+
+
+def resize_median(
+    picture: np.ndarray,
+    resize_ratio: float = 2,
+    kernel: int = 5,
+    rows: int = None,
+    executor: concurrent.futures.Executor = None,
+    dst: np.ndarray = None,
+) -> np.ndarray:
+    """Reduce size of picture with nearest-neighbor interpolation and apply median filter
+    in one pass. Picture is processed in horizontal stripes: each stripe is resized and
+    filtered before the next one, so intermediate data stay in cache and full resized
+    picture is never created. Result is the same as cv2.resize with cv2.INTER_NEAREST
+    followed by cv2.medianBlur.
+
+    Args:
+        picture (np.ndarray): Picture.
+        resize_ratio (float, optional): Determine how many times picture should be resized. Defaults to 2.
+        kernel (int, optional): Define kernel of median filter. Defaults to 5.
+        rows (int, optional): Number of rows of result in one stripe. Defaults to size fitting L2 cache.
+        executor (concurrent.futures.Executor, optional): Stripes are processed in parallel by
+        the executor. Defaults to None, stripes are processed one by one.
+        dst (np.ndarray, optional): Array for the result. Defaults to None.
+
+    Returns:
+        np.ndarray: Resized and filtered picture.
+    """
+    height = int(picture.shape[0] / resize_ratio)
+    width = int(picture.shape[1] / resize_ratio)
+    new_shape = (height, width, *picture.shape[2:])
+    if dst is None:
+        dst = np.empty(new_shape, dtype=picture.dtype)
+    assert dst.shape == new_shape, "Shape of dst must match resized picture"
+    rows = rows or stripe_rows(picture.shape, new_shape, kernel)
+    row_map = _row_map(picture.shape[0], height)
+    stripes = [(start, min(start + rows, height)) for start in range(0, height, rows)]
+    if executor is None:
+        for start, stop in stripes:
+            _process_stripe(picture, dst, row_map, start, stop, kernel)
+    else:
+        futures = [
+            executor.submit(_process_stripe, picture, dst, row_map, start, stop, kernel)
+            for start, stop in stripes
+        ]
+        for future in futures:
+            future.result() # raise errors from workers
+    return dst
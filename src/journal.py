@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+
+class Journal:
+    def __init__(self, path: str, batch: int = 64, interval: float = 1.0, sync: bool = False):
+        """Append-only file of indices of frames that are saved, one index per line.
+        Sinks commit index after the output of frame is written, and the journal writes
+        indices in batches, so the cost per frame is an append to a list. After a crash,
+        indices committed in the last batch are lost and these frames are saved again.
+
+        Indices saved by earlier runs are read when the journal is opened;
+        resume_index tells from which frame the next run starts.
+
+        Args:
+            path (str): Path of journal file. It is created, with its directory, if it does not exist.
+            batch (int, optional): Number of indices written at once. Defaults to 64.
+            interval (float, optional): Maximal time in seconds between commit of index and
+            its write, so slow runs also make progress. Defaults to 1.0.
+            sync (bool, optional): Call os.fsync after every write, so the journal survives
+            also power loss, not only crash of the process. Outputs of frames are not synced
+            by sinks. Defaults to False.
+        """
+        self.path = path
+        self.batch = batch
+        assert (isinstance(self.batch, int) and self.batch > 0
+        ), "Size of batch must be natural number bigger than 0"
+        self.interval = interval
+        self.sync = sync
+        self.saved = self.load(path) # indices saved by earlier runs
+        self.writes = 0 # batches written to file
+        self._pending = []
+        self._last_write = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a")
+        return
+
+    @staticmethod
+    def load(path: str) -> set:
+        """Indices in journal file. Incomplete last line, written when process died,
+        is ignored.
+
+        Args:
+            path (str): Path of journal file.
+
+        Returns:
+            set: Indices of saved frames, empty if file does not exist.
+        """
+        try:
+            with open(path) as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return set()
+        return {int(line) for line in lines if line.endswith("\n") and line.strip().isdigit()}
+
+    def resume_index(self) -> int:
+        """Index of the first frame that is not saved. Frames before it are skipped by
+        the next run; frames after it are saved again, even if some of them are in the journal.
+        """
+        idx = 0
+        while idx in self.saved:
+            idx += 1
+        return idx
+
+    def commit(self, idx: int, count: int = 1):
+        """Record that frames idx, ..., idx + count - 1 are saved. It can be called by
+        many threads, e.g. writers of SavePicture.
+
+        Args:
+            idx (int): Index of (first) frame.
+            count (int, optional): Number of frames, e.g. in batch. Defaults to 1.
+        """
+        with self._lock:
+            self._pending.extend(range(idx, idx + count))
+            if len(self._pending) >= self.batch or time.monotonic() - self._last_write >= self.interval:
+                self._write()
+
+    def _write(self):
+        if self._pending:
+            self._file.write("".join(f"{idx}\n" for idx in self._pending))
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self.saved.update(self._pending)
+            self._pending.clear()
+            self.writes += 1
+        self._last_write = time.monotonic()
+
+    def flush(self):
+        """Write committed indices now."""
+        with self._lock:
+            self._write()
+
+    def close(self):
+        with self._lock:
+            self._write()
+            self._file.close()
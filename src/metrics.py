@@ -0,0 +1,236 @@
+import threading
+import json
+import math
+import sys
+import time
+
+BUCKETS_PER_OCTAVE = 4 # resolution of histograms, about 19% per bucket
+MIN_LATENCY = 1e-6 # seconds, smaller values go to the first bucket
+
+
+class Histogram:
+    def __init__(self):
+        """Histogram of latencies with logarithmic buckets. It uses constant memory,
+        and quantiles are accurate to the width of a bucket.
+        """
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        return
+
+    def record(self, seconds: float):
+        bucket = int(BUCKETS_PER_OCTAVE * math.log2(max(seconds, MIN_LATENCY) / MIN_LATENCY))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of bucket that holds quantile q.
+
+        Args:
+            q (float): Quantile, from 0 to 1.
+
+        Returns:
+            float: Latency in seconds, 0 if histogram is empty.
+        """
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(MIN_LATENCY * 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE), self.max)
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class StageMetrics:
+    def __init__(self, name: str):
+        """Counters and latency histograms of one stage of the pipeline.
+        Several threads of the same stage share one object.
+
+        Args:
+            name (str): Name of the stage.
+        """
+        self.name = name
+        self.frames = 0
+        self.histograms = {}
+        self.started = None
+        self._lock = threading.Lock()
+        return
+
+    def record(self, histogram: str, seconds: float):
+        """Add latency to histogram, e.g. "queue", "process", "write" or "latency".
+
+        Args:
+            histogram (str): Name of histogram.
+            seconds (float): Latency.
+        """
+        with self._lock:
+            if histogram not in self.histograms:
+                self.histograms[histogram] = Histogram()
+            self.histograms[histogram].record(seconds)
+
+    def count(self, frames: int = 1):
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+            self.frames += frames
+
+    def fps(self) -> float:
+        if self.started is None:
+            return 0.0
+        return self.frames / max(time.perf_counter() - self.started, 1e-9)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "fps": self.fps(),
+                **{name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+
+class Metrics:
+    def __init__(self):
+        """Metrics of the whole pipeline, shared by all threads. Threads get it as
+        optional argument; without it they do not measure anything.
+        Times of putting frames into queues are kept by id of the frame,
+        so frames do not have to carry them through the pipeline.
+        """
+        self.stages = {}
+        self.queues = {}
+        self._depths = {}
+        self._stamps = {}
+        self._lock = threading.Lock()
+        return
+
+    def stage(self, name: str) -> StageMetrics:
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    def stamp(self, item, born: float = None):
+        """Remember when item is put into queue and when its data were created.
+
+        Args:
+            item: Frame or batch of frames.
+            born (float, optional): Time of creation of data (time.perf_counter).
+            Defaults to now.
+        """
+        now = time.perf_counter()
+        self._stamps[id(item)] = (now, born if born is not None else now)
+
+    def unstamp(self, item, stage: StageMetrics) -> float:
+        """Record time that item spent in queue.
+
+        Args:
+            item: Frame or batch of frames taken from queue.
+            stage (StageMetrics): Stage that took the item.
+
+        Returns:
+            float: Time of creation of data, or None if item was not stamped.
+        """
+        put, born = self._stamps.pop(id(item), (None, None))
+        if put is not None:
+            stage.record("queue", time.perf_counter() - put)
+        return born
+
+    def forget(self, item):
+        """Remove stamp of item that is dropped from queue."""
+        self._stamps.pop(id(item), None)
+
+    def unstamp_batch(self, items, stage: StageMetrics) -> float:
+        """Record time that items spent in queue.
+
+        Args:
+            items (list): Frames taken from queue.
+            stage (StageMetrics): Stage that took the items.
+
+        Returns:
+            float: Time of creation of the oldest data, or None if no item was stamped.
+        """
+        born = [self.unstamp(item, stage) for item in items]
+        return min((value for value in born if value is not None), default=None)
+
+    def add_queue(self, name: str, queue):
+        """Queue whose depth is sampled by sample_queues."""
+        self.queues[name] = queue
+        self._depths[name] = Histogram()
+
+    def sample_queues(self):
+        for name, queue in self.queues.items():
+            self._depths[name].record(queue.qsize())
+
+    def snapshot(self) -> dict:
+        return {
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+            "queues": {
+                name: {
+                    "samples": depth.count,
+                    "mean": depth.total / depth.count if depth.count else 0.0,
+                    "max": depth.max,
+                    **({"drops": dict(self.queues[name].drops)} if hasattr(self.queues[name], "drops") else {}),
+                }
+                for name, depth in self._depths.items()
+            },
+        }
+
+    def to_json(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+
+class MetricsReporter(threading.Thread):
+    def __init__(self, metrics: Metrics, interval: float = 1.0, file=sys.stderr, name: str = "MetricsReporter"):
+        """Thread that periodically samples depth of queues and prints throughput
+        and p50/p99 latencies of every stage.
+
+        Args:
+            metrics (Metrics): Metrics of the pipeline.
+            interval (float, optional): Seconds between reports. Defaults to 1.0.
+            file (optional): Stream for reports. Defaults to sys.stderr.
+            name (str, optional): Name of the thread. Defaults to "MetricsReporter".
+        """
+        super(MetricsReporter, self).__init__(daemon=True)
+        self.metrics = metrics
+        assert isinstance(self.metrics, Metrics)
+        self.interval = interval
+        self.file = file
+        self.name = name
+        self._stop_event = threading.Event()
+        return
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.metrics.sample_queues()
+            self.report()
+        return
+
+    def report(self):
+        snapshot = self.metrics.snapshot()
+        for name, stage in snapshot["stages"].items():
+            latencies = "  ".join(
+                f"{key} p50 {1000 * value['p50']:.2f} ms p99 {1000 * value['p99']:.2f} ms"
+                for key, value in stage.items()
+                if isinstance(value, dict)
+            )
+            print(f"{name}: {stage['frames']} frames, {stage['fps']:.1f} fps  {latencies}", file=self.file)
+        for name, depth in snapshot["queues"].items():
+            if depth.get("drops"):
+                drops = ", ".join(f"{count} {reason}" for reason, count in depth["drops"].items())
+                print(f"queue {name}: dropped {drops}", file=self.file)
+
+    def stop(self):
+        self._stop_event.set()
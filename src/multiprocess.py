@@ -0,0 +1,315 @@
+import multiprocessing
+import multiprocessing.queues
+import queue
+import logging
+import os
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import cv2
+from .source import Source
+from .processing import FrameProcessor
+from .savepicture import SavePictureThread
+
+
+class FrameRing:
+    def __init__(self, shape: tuple, slots: int = 8, dtype: type = np.uint8):
+        """Fixed number of frame slots placed in shared memory. Processes
+        exchange only indices of slots, so frames are never pickled.
+        Free slots are kept in a queue, so acquire() blocks when all slots
+        are in use, which limits memory used by the pipeline.
+        The process that created the ring should call unlink() when the work is done.
+
+        Args:
+            shape (tuple): Shape of one frame, e.g. (768, 1024, 3).
+            slots (int, optional): Number of frames kept in shared memory. Defaults to 8.
+            dtype (type, optional): Type of frame data. Defaults to np.uint8.
+        """
+        self.shape = tuple(shape)
+        self.slots = slots
+        assert (isinstance(self.slots, int) and self.slots > 0
+        ), "Number of slots must be natural number bigger than 0"
+        self.dtype = np.dtype(dtype)
+        size = self.slots * int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.free = multiprocessing.Queue()
+        for slot in range(self.slots):
+            self.free.put(slot)
+        self._frames = None
+        return
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_frames"] = None # view is created again in the child process
+        return state
+
+    @property
+    def frames(self) -> np.ndarray:
+        """Array of shape (slots, *shape) backed by shared memory."""
+        if self._frames is None:
+            self._frames = np.ndarray(
+                (self.slots, *self.shape), dtype=self.dtype, buffer=self.shm.buf
+            )
+        return self._frames
+
+    def acquire(self, timeout: float = None) -> int:
+        """Take index of free slot.
+
+        Args:
+            timeout (float, optional): How long to wait for free slot. Defaults to None.
+
+        Raises:
+            queue.Empty: No slot was released in timeout.
+
+        Returns:
+            int: Index of slot.
+        """
+        return self.free.get(timeout=timeout)
+
+    def release(self, slot: int):
+        """Give slot back to the ring, so it can be filled again.
+
+        Args:
+            slot (int): Index of slot.
+        """
+        self.free.put(slot)
+
+    def close(self):
+        self._frames = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _wait_slot(ring, sigkill, timeout):
+    """Acquire free slot of the ring. Returns None if other process is interrupted."""
+    while True:
+        try:
+            return ring.acquire(timeout=timeout)
+        except queue.Empty:
+            if not sigkill.empty():
+                return None
+
+
+class ProducerProcess(multiprocessing.Process):
+    def __init__(
+        self,
+        target: multiprocessing.Queue,
+        ring: FrameRing,
+        sigkill: multiprocessing.Queue,
+        name: str = "Producer",
+        frame_count: int = 100,
+        delay_frame: float = 0.05,
+        timeout: float = 0.1,
+    ):
+        """Process counterpart of ProducerThread. Data from Source are written
+        to a free slot of the ring, and index of the slot is passed to queue A.
+        Dimensions of pictures are given by shape of the ring.
+
+        Args:
+            target (multiprocessing.Queue): queue A, shares indices of slots between processes.
+            ring (FrameRing): Shared memory slots for frames from Source.
+            sigkill (multiprocessing.Queue): queue that is shared between all the processes.
+            It keeps track whether any of them is interrupted.
+            In such case, the rest should be stopped.
+            name (str, optional): Name of the process. Defaults to Producer.
+            frame_count (int, optional): How many times data are taken from Source.
+            Defaults to 100.
+            delay_frame (float, optional): Delay between frames in seconds. Defaults to 0.05.
+            timeout (float, optional): How long (in seconds) process waits for free slot
+            before it checks whether other processes are interrupted. Defaults to 0.1.
+        """
+        super(ProducerProcess, self).__init__()
+        self.target = target
+        assert isinstance(self.target, multiprocessing.queues.Queue)
+        self.ring = ring
+        assert isinstance(self.ring, FrameRing)
+        self.sigkill = sigkill
+        assert isinstance(self.sigkill, multiprocessing.queues.Queue)
+        self.name = name
+        self.frame_count = frame_count
+        assert (isinstance(self.frame_count, int) and self.frame_count > 0
+        ), "Number of data must be natural number bigger than 0"
+        self.delay_frame = delay_frame
+        self.timeout = timeout
+        return
+
+    def run(self):
+        source = Source(self.ring.shape)
+        frames = self.ring.frames
+        for i in range(self.frame_count):
+            try:
+                slot = _wait_slot(self.ring, self.sigkill, self.timeout)
+                if slot is None: # stop process if error occur in other processes
+                    return
+                # generator of source is made in this process, unlike global state of np.random,
+                # whose lock can be held by a thread of parent process at fork
+                source.get_data(out=frames[slot])
+                self.target.put(slot)
+                time.sleep(self.delay_frame)
+            except: # send info to other processes that error occur here, and process is stopped.
+                logging.error("process dead!")
+                self.sigkill.put(self.name)
+                return
+        return
+
+
+class ConsumerProcess(FrameProcessor, multiprocessing.Process):
+    def __init__(
+        self,
+        target: (multiprocessing.Queue, multiprocessing.Queue),
+        ring: (FrameRing, FrameRing),
+        sigkill: multiprocessing.Queue,
+        name: str = "Consumer",
+        resize_ratio: float = 2,
+        kernel: int = 5,
+        frame_count: int = 100,
+        timeout: float = 0.1,
+        counter: multiprocessing.Value = None,
+        interpolation: int = cv2.INTER_LINEAR,
+        mode: str = "separate",
+        tile_size: tuple = (256, None),
+        backend: str = "opencv",
+    ):
+        """Process counterpart of ConsumerThread. It takes index of slot from queue A,
+        resizes and filters the frame into a slot of the second ring and passes
+        its index to queue B. Several processes can share queues, rings and counter.
+
+        Args:
+            target (multiprocessing.Queue, multiprocessing.Queue): queues A and B.
+            ring (FrameRing, FrameRing): Rings for frames from Producer and for processed frames.
+            sigkill (multiprocessing.Queue): queue that is shared between all the processes.
+            It keeps track whether any of them is interrupted.
+            In such case, the rest should be stopped.
+            name (str, optional): Name of the process. Defaults to Consumer.
+            resize_ratio (float, optional): Determine how many times picture should be resized. Defaults to 2.
+            kernel (int, optional): Define kernel of median filter. Defaults to 5.
+            frame_count (int, optional): How many times data are taken from Source. Defaults to 100.
+            timeout (float, optional): How long (in seconds) process blocks on empty queue A
+            before it checks whether other processes are interrupted. Defaults to 0.1.
+            counter (multiprocessing.Value, optional): Counter of processed frames shared between
+            consumers that take data from the same queue A. Defaults to counter owned by the process.
+            interpolation (int, optional): Interpolation used by reduce_size. Defaults to cv2.INTER_LINEAR.
+            mode (str, optional): "separate", "fused" or "tiled", see ConsumerThread.
+            Stripes or tiles are processed one by one. Defaults to "separate".
+            tile_size (tuple, optional): Rows and columns of tile in "tiled" mode. Defaults to (256, None).
+            backend (str, optional): "opencv", "numpy" or "auto", see ConsumerThread. Defaults to "opencv".
+        """
+        super(ConsumerProcess, self).__init__()
+        self.target, self.target_B = target
+        assert isinstance(self.target, multiprocessing.queues.Queue)
+        assert isinstance(self.target_B, multiprocessing.queues.Queue)
+        self.ring, self.ring_B = ring
+        assert isinstance(self.ring, FrameRing)
+        assert isinstance(self.ring_B, FrameRing)
+        self.sigkill = sigkill
+        assert isinstance(self.sigkill, multiprocessing.queues.Queue)
+        self.name = name
+        # the same processing as in thread backend, executor can not be shared with other process
+        self.init_processing(resize_ratio, kernel, interpolation, mode, None, tile_size, backend)
+        self.frame_count = frame_count
+        assert (isinstance(self.frame_count, int) and self.frame_count > 0
+        ), "Number of data must be natural number bigger than 0"
+        self.timeout = timeout
+        self.counter = counter if counter is not None else multiprocessing.Value("i", 0)
+        return
+
+    def run(self):
+        frames, frames_B = self.ring.frames, self.ring_B.frames
+        while self.counter.value < self.frame_count: # stop process when all data are processed
+            try: # block until data arrive instead of polling the queue
+                slot = self.target.get(timeout=self.timeout)
+            except queue.Empty:
+                if not self.sigkill.empty(): # stop process if error occur in other processes
+                    return
+                continue
+            try:
+                slot_B = _wait_slot(self.ring_B, self.sigkill, self.timeout)
+                if slot_B is None:
+                    return
+                self.transform(frames[slot], dst=frames_B[slot_B])
+                self.ring.release(slot)
+                self.target_B.put(slot_B)
+                with self.counter.get_lock():
+                    self.counter.value += 1
+            except: # send info to other processes that error occur here, and process is stopped.
+                logging.error("process dead!")
+                self.sigkill.put(self.name)
+                break
+        return
+
+
+class SavePictureProcess(multiprocessing.Process):
+    def __init__(
+        self,
+        target: multiprocessing.Queue,
+        ring: FrameRing,
+        sigkill: multiprocessing.Queue,
+        name: str = "SavePicture",
+        path: str = "./processed/",
+        frame_count: int = 100,
+        timeout: float = 0.1,
+    ):
+        """Process counterpart of SavePictureThread. It takes index of slot from
+        queue B, saves the frame to png file and releases the slot.
+        This process will overwrite files.
+
+        Args:
+            target (multiprocessing.Queue): queue B, shares indices of slots between processes.
+            ring (FrameRing): Shared memory slots for processed frames.
+            sigkill (multiprocessing.Queue): queue that is shared between all the processes.
+            It keeps track whether any of them is interrupted.
+            In such case, the rest should be stopped.
+            name (str, optional): Name of the process. Defaults to "SavePicture".
+            path (str, optional): Place, where files are saved.
+            Defaults to "./processed/".
+            frame_count (int, optional): How many times data are taken from Source.
+            Defaults to 100.
+            timeout (float, optional): How long (in seconds) process blocks on empty queue B
+            before it checks whether other processes are interrupted. Defaults to 0.1.
+        """
+        super(SavePictureProcess, self).__init__()
+        self.target_B = target
+        assert isinstance(self.target_B, multiprocessing.queues.Queue)
+        self.ring_B = ring
+        assert isinstance(self.ring_B, FrameRing)
+        self.sigkill = sigkill
+        assert isinstance(self.sigkill, multiprocessing.queues.Queue)
+        self.name = name
+        self.path = path
+        self.frame_count = frame_count
+        assert (isinstance(self.frame_count, int) and self.frame_count > 0
+        ), "Number of data must be natural number bigger than 0"
+        self.timeout = timeout
+        self.saved = multiprocessing.Value("i", 0) # frames saved, set when process ends
+        try:
+            os.mkdir(self.path) # make a directory for files
+        except:
+            logging.warning("Use existing directory. Files can be overwritten.")
+            pass # if directory already exist, move on
+        return
+
+    # the same output as in thread backend
+    save_png = SavePictureThread.save_png
+
+    def run(self):
+        frames_B = self.ring_B.frames
+        idx = 0
+        while idx < self.frame_count: # stop process when all data are processed
+            try: # block until data arrive instead of polling the queue
+                slot = self.target_B.get(timeout=self.timeout)
+            except queue.Empty:
+                if not self.sigkill.empty(): # stop process if error occur in other processes
+                    break
+                continue
+            try:
+                self.save_png(frames_B[slot], idx)
+                self.ring_B.release(slot)
+                idx += 1
+            except: # send info to other processes that error occur here, and process is stopped.
+                logging.error("process dead!")
+                self.sigkill.put(self.name)
+                break
+        self.saved.value = idx
+        return
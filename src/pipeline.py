@@ -0,0 +1,215 @@
+import threading
+import queue
+import logging
+import time
+from .metrics import Metrics
+
+_END = object() # marks end of data in queues between stages
+
+
+class PipelineError(Exception):
+    """Raised by Pipeline.join when any stage failed."""
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        function,
+        workers: int = 1,
+        maxsize: int = 0,
+        fuse: bool = False,
+        indexed: bool = False,
+    ):
+        """One step of Pipeline.
+
+        Args:
+            name (str): Name of the stage, used for threads and statistics.
+            function (callable): Work of the stage. The first stage of a pipeline is
+            the source: it is called without arguments and returns new item, or None
+            when there are no more data. Other stages are called with item from the
+            previous stage and return item for the next one, or None to drop it.
+            workers (int, optional): Number of threads running the stage. Defaults to 1.
+            maxsize (int, optional): Capacity of queue in front of the stage.
+            Defaults to 0, unbounded.
+            fuse (bool, optional): Run the stage in threads of the previous stage, without
+            queue between them. It is useful for cheap stages. Fused stage has no own
+            threads, so workers must be 1. Defaults to False.
+            indexed (bool, optional): Call function with index of item and item. Indices
+            follow order of items given by the source. Defaults to False.
+        """
+        self.name = name
+        self.function = function
+        assert callable(self.function)
+        self.workers = workers
+        assert (isinstance(self.workers, int) and self.workers > 0
+        ), "Number of workers must be natural number bigger than 0"
+        self.maxsize = maxsize
+        assert isinstance(self.maxsize, int) and self.maxsize >= 0
+        self.fuse = fuse
+        if self.fuse and self.workers > 1:
+            raise ValueError(f"Fused stage {self.name} runs in threads of previous stage, workers must be 1")
+        self.indexed = indexed
+        return
+
+
+class Pipeline:
+    def __init__(self, stages: list, frame_count: int = None, timeout: float = 0.1):
+        """Runs stages connected by queues, each stage in its own threads.
+        Bounded queues give back-pressure, end of data is passed from stage to stage
+        after all items, and error in any stage stops the whole pipeline.
+        Adjacent stages with fuse=True run in the same threads.
+
+        Args:
+            stages (list): Stages, the first one is the source.
+            frame_count (int, optional): How many items are taken from source.
+            Defaults to None, until source returns None.
+            timeout (float, optional): How often (in seconds) blocked threads check
+            whether pipeline is stopped. Defaults to 0.1.
+        """
+        self.stages = list(stages)
+        assert len(self.stages) > 0 and all(isinstance(stage, Stage) for stage in self.stages)
+        assert self.stages[0].workers == 1, "Source must have one worker"
+        assert not self.stages[0].fuse, "Source can not be fused"
+        self.frame_count = frame_count
+        assert (self.frame_count is None or isinstance(self.frame_count, int) and self.frame_count > 0
+        ), "Number of data must be natural number bigger than 0"
+        self.timeout = timeout
+        self.groups = [] # stages running in the same threads
+        for stage in self.stages:
+            if stage.fuse:
+                self.groups[-1].append(stage)
+            else:
+                self.groups.append([stage])
+        # queues[g] is in front of group g, the source has none
+        self.queues = [None] + [queue.Queue(maxsize=group[0].maxsize) for group in self.groups[1:]]
+        self.metrics = Metrics()
+        for g, group in enumerate(self.groups[1:], start=1):
+            self.metrics.add_queue(group[0].name, self.queues[g])
+        self.error = None
+        self.failed_stage = None
+        self._stop = threading.Event()
+        self._finished = [0] * len(self.groups)
+        self._lock = threading.Lock()
+        self.threads = []
+        return
+
+    def start(self):
+        for g, group in enumerate(self.groups):
+            name = "+".join(stage.name for stage in group)
+            for worker in range(group[0].workers):
+                self.threads.append(threading.Thread(
+                    target=self._source if g == 0 else self._work,
+                    args=(g,),
+                    name=f"{name}-{worker}",
+                ))
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        """Wait for all threads.
+
+        Raises:
+            PipelineError: Any stage failed.
+        """
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise PipelineError(f"stage {self.failed_stage} failed") from self.error
+
+    def run(self) -> dict:
+        """Start pipeline and wait until it is done.
+
+        Returns:
+            dict: Statistics of stages.
+        """
+        self.start()
+        self.join()
+        return self.stats()
+
+    def stop(self):
+        """Stop all stages. Items that are still in queues are dropped."""
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return self.metrics.snapshot()
+
+    def _apply(self, stages, idx, item):
+        for stage in stages:
+            start = time.perf_counter()
+            try:
+                item = stage.function(idx, item) if stage.indexed else stage.function(item)
+            except Exception as error:
+                self._fail(stage, error)
+                return None
+            stats = self.metrics.stage(stage.name)
+            stats.record("process", time.perf_counter() - start)
+            stats.count()
+            if item is None: # dropped by the stage
+                return None
+        return item
+
+    def _source(self, g):
+        source, stages = self.groups[0][0], self.groups[0][1:]
+        idx = 0
+        while not self._stop.is_set() and (self.frame_count is None or idx < self.frame_count):
+            start = time.perf_counter()
+            try:
+                item = source.function()
+            except Exception as error:
+                self._fail(source, error)
+                break
+            if item is None: # end of data
+                break
+            stats = self.metrics.stage(source.name)
+            stats.record("process", time.perf_counter() - start)
+            stats.count()
+            item = self._apply(stages, idx, item)
+            if item is not None and not self._put(g, (idx, item)):
+                break
+            idx += 1
+        self._finish(g)
+
+    def _work(self, g):
+        while not self._stop.is_set():
+            try:
+                item = self.queues[g].get(timeout=self.timeout)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
+            idx, item = item
+            item = self._apply(self.groups[g], idx, item)
+            if item is not None and not self._put(g, (idx, item)):
+                break
+        self._finish(g)
+
+    def _put(self, g, item) -> bool:
+        """Put item to queue of the next group. Returns False if pipeline is stopped."""
+        if g + 1 == len(self.groups):
+            return True # last group, result is not passed further
+        while not self._stop.is_set():
+            try:
+                self.queues[g + 1].put(item, timeout=self.timeout)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _finish(self, g):
+        """Worker of group g is done. The last one passes end of data to the next group."""
+        with self._lock:
+            self._finished[g] += 1
+            last = self._finished[g] == self.groups[g][0].workers
+        if last and g + 1 < len(self.groups):
+            for _ in range(self.groups[g + 1][0].workers):
+                self._put(g, _END)
+
+    def _fail(self, stage, error):
+        with self._lock:
+            if self.error is None:
+                self.error = error
+                self.failed_stage = stage.name
+        logging.error(f"stage {stage.name} failed: {error!r}")
+        self._stop.set()
+
@@ -0,0 +1,129 @@
+import concurrent.futures
+import numpy as np
+import cv2
+from .fused import resize_median
+from .tiled import median_tiled
+from .backends import BACKENDS, select, supports, resize_numpy, median_numpy
+
+MODES = ("separate", "fused", "tiled")
+
+
+class FrameProcessor:
+    """Resize and median filter of one frame, shared by ConsumerThread and ConsumerProcess.
+    Subclasses call init_processing in their constructor.
+    """
+
+    def init_processing(
+        self,
+        resize_ratio: float = 2,
+        kernel: int = 5,
+        interpolation: int = cv2.INTER_LINEAR,
+        mode: str = "separate",
+        executor: concurrent.futures.Executor = None,
+        tile_size: tuple = (256, None),
+        backend: str = "opencv",
+    ):
+        """Set parameters of processing, see ConsumerThread."""
+        self.resize_ratio = resize_ratio
+        self.kernel = kernel
+        self.interpolation = interpolation
+        self.mode = mode
+        assert self.mode in MODES, "Mode must be separate, fused or tiled"
+        self.executor = executor
+        self.tile_size = tile_size
+        self.backend = backend
+        assert self.backend in (*BACKENDS, "auto"), f"Backend must be one of {BACKENDS} or auto"
+        self._resized = None # intermediate picture, reused between frames
+
+    def transform(self, picture, dst=None):
+        """Reduce size of picture and apply median filter on it in the mode set
+        by init_processing. If dst is given, the intermediate resized picture
+        is kept and reused for the next frames of the same shape.
+
+        Args:
+            picture (np.ndarray): Picture.
+            dst (np.ndarray, optional): Array for the result. Defaults to new array.
+
+        Returns:
+            np.ndarray: Processed picture.
+        """
+        if self.mode == "fused":
+            return resize_median(picture, self.resize_ratio, self.kernel, executor=self.executor, dst=dst)
+        if dst is None:
+            return self.apply_filter(self.reduce_size(picture))
+        shape = self.resized_shape(picture.shape)
+        if self._resized is None or self._resized.shape != shape:
+            self._resized = np.empty(shape, dtype=picture.dtype)
+        self.reduce_size(picture, dst=self._resized)
+        return self.apply_filter(self._resized, dst=dst)
+
+    def apply_filter(self, picture, dst=None):
+        """Apply median filter on picture. It uses opencv implementation.
+        Kernel size is defined in constructor of the class, defaults to 5.
+        In "tiled" mode, picture is filtered tile by tile.
+
+        Args:
+            picture (np.ndarray): Picture.
+            dst (np.ndarray, optional): Array for the result. Defaults to None.
+
+        Returns:
+            np.ndarray: Picture.
+        """
+        if self.mode == "tiled":
+            return median_tiled(picture, self.kernel, self.tile_size, self.executor, dst)
+        if self.step_backend("median", picture) == "numpy":
+            return median_numpy(picture, self.kernel, dst)
+        return cv2.medianBlur(picture, ksize=self.kernel, dst=dst)
+
+    def step_backend(self, step, picture):
+        """Backend that does step of processing of picture.
+
+        Args:
+            step (str): "resize" or "median".
+            picture (np.ndarray): Input picture of the step.
+
+        Returns:
+            str: Name of backend.
+        """
+        if self.backend == "auto":
+            return select(
+                step, picture.shape, picture.dtype, self.resize_ratio, self.kernel, self.interpolation
+            )
+        if supports(
+            self.backend, step, picture.shape, self.resize_ratio, self.kernel, picture.dtype, self.interpolation
+        ):
+            return self.backend
+        return "opencv" if step == "resize" else "numpy"
+
+    def resized_shape(self, shape, resize_ratio=None):
+        """Shape of picture after reduce_size.
+
+        Args:
+            shape (tuple): Shape of picture.
+            resize_ratio (float, optional): Defaults to resize_ratio set in class constructor.
+
+        Returns:
+            tuple: Shape of resized picture.
+        """
+        resize_ratio = resize_ratio if resize_ratio is not None else self.resize_ratio
+        height = int(shape[0] / resize_ratio)
+        width = int(shape[1] / resize_ratio)
+        return (height, width, *shape[2:])
+
+    def reduce_size(self, picture, dst=None):
+        """Reduce size of picture. Interpolation is set in class constructor,
+        defaults to bilinear. Dimensions are changed accordingly to resize_ratio
+        set in class constructor. It preserves aspect ratio.
+
+        Args:
+            picture (np.ndarray): _description_
+            dst (np.ndarray, optional): Array for the result. Defaults to None.
+
+        Returns:
+            np.ndarray: Resized picture.
+        """
+        height, width = self.resized_shape(picture.shape)[:2]
+        if self.backend != "opencv" and self.step_backend("resize", picture) == "numpy":
+            return resize_numpy(picture, (height, width), self.resize_ratio, dst)
+        new_dim = (width, height)
+        return cv2.resize(picture, new_dim, dst=dst, interpolation=self.interpolation)
@@ -3,8 +3,15 @@ import queue
 import logging
 import sys
 import time
+import itertools
 import numpy as np
-from src.source import Source
+from .source import Source, FrameSource
+from .framepool import FramePool, acquire_or_stop
+from .metrics import Metrics
+from .stream import EOS
+from .delta import DeltaDetector
+from .sequence import Sequence
+from .deadline import DeadlineQueue, put_or_stop
 
 
 class ProducerThread(threading.Thread):
@@ -15,7 +22,13 @@ class ProducerThread(threading.Thread):
         name: str = "Producer",
         frame_count: int = 100,
         picture_shape: (int, int) = (768, 1024),
-        delay_frame: float = 0.05
+        delay_frame: float = 0.05,
+        pool: FramePool = None,
+        metrics: Metrics = None,
+        source: FrameSource = None,
+        delta: DeltaDetector = None,
+        start_index: int = 0,
+        sequence: Sequence = None,
     ):
         """A thread that is responsible for retriving data from Source
         and pass them to queue that is shared with Consumer.
@@ -27,9 +40,28 @@ class ProducerThread(threading.Thread):
             In such case, the rest should be stopped.
             name (str, optional): Name of the thread. Defaults to Producer.
             frame_count (int, optional): How many times data are taken from Source.
-            Defaults to 100.
+            None means streaming mode: data are taken until source is exhausted or
+            stop is called, and EOS is put to queue A at the end. Defaults to 100.
             picture_shape (tuple, optional): Dimensions of pictures. Defaults to (768, 1024).
-
+            delay_frame (float, optional): Delay between frames in seconds. It can be changed
+            while thread runs. Defaults to 0.05.
+            pool (FramePool, optional): Pool of buffers that are filled with data
+            instead of allocating new array for every frame. Defaults to None.
+            metrics (Metrics, optional): Metrics of the pipeline. Defaults to None, nothing is measured.
+            source (FrameSource, optional): Source of pictures, e.g. VideoSource, DirectorySource
+            or RawSource. If pool is set, frames are written to buffers of shape attribute of
+            the source; frames of sources without it, e.g. DirectorySource whose files can
+            differ in size, are new arrays. Defaults to Source of random pictures of picture_shape.
+            delta (DeltaDetector, optional): Detector of unchanged pictures. If set, FrameRef
+            to the last changed picture is put to queue A instead of unchanged picture.
+            Defaults to None, all pictures are put to queue A.
+            start_index (int, optional): Number of frames saved by earlier run, e.g.
+            Journal.resume_index. They are skipped in source and not put to queue A,
+            frame_count includes them. Defaults to 0.
+            sequence (Sequence, optional): Sequence in which every frame is tagged with its index,
+            so sinks know it also when several Consumers change order of frames. If queue A is
+            DeadlineQueue, frame is tagged also with its deadline, which Consumer carries
+            to queue B. Defaults to None.
         """
         super(ProducerThread, self).__init__()
         self.target = target
@@ -38,7 +70,7 @@ class ProducerThread(threading.Thread):
         assert isinstance(self.sigkill, queue.Queue)
         self.name = name
         self.frame_count = frame_count
-        assert (isinstance(self.frame_count, int) and self.frame_count > 0
+        assert (self.frame_count is None or isinstance(self.frame_count, int) and self.frame_count > 0
         ), "Number of data must be natural number bigger than 0"
         self.picture_shape = picture_shape
         assert (
@@ -47,19 +79,89 @@ class ProducerThread(threading.Thread):
             and isinstance(self.picture_shape[0], int)
             and isinstance(self.picture_shape[1], int)
         ), "Dimensions of picture must be natural numer bigger than 0"
-        self.source = Source((*picture_shape, 3))
+        self.source = source if source is not None else Source((*picture_shape, 3))
         self.delay_frame = delay_frame
+        self.pool = pool
+        self.metrics = metrics
+        self.stats = metrics.stage("Producer") if metrics is not None else None
+        self.delta = delta
+        self.start_index = start_index
+        assert (isinstance(self.start_index, int) and self.start_index >= 0
+        ), "Start index must be natural number or 0"
+        self.sequence = sequence
+        self.produced = 0 # frames put to queue A
+        self._stop_requested = threading.Event()
         return
 
+    def stop(self):
+        """Ask thread to stop after the current picture. EOS is put to queue A,
+        so the rest of the pipeline finishes the pictures that are already taken."""
+        self._stop_requested.set()
+
+    def skip(self, count: int):
+        """Skip count frames of source, with its skip method if it has one."""
+        if hasattr(self.source, "skip"):
+            self.source.skip(count)
+            return
+        for _ in range(count): # frames must be read, e.g. from video
+            if self.source.get_data() is None:
+                return
+
     def run(self):
-        for i in range(self.frame_count):
+        try:
+            self.skip(self.start_index)
+        except: # send info to other threads that error occur here, and thread is stopped.
+            logging.error("thread dead!")
+            self.sigkill.put(self.name)
+            return
+        shape = getattr(self.source, "shape", None) # shape of buffers from the pool
+        if self.frame_count is not None:
+            frames = range(self.start_index, self.frame_count)
+        else:
+            frames = itertools.count(self.start_index)
+        for i in frames:
+            if self._stop_requested.is_set():
+                break
             try:
-                item = self.source.get_data()
-                self.target.put(item)
+                if self.metrics is not None:
+                    start = time.perf_counter()
+                if self.pool is None or shape is None:
+                    item = self.source.get_data()
+                else:
+                    buffer = acquire_or_stop(self.pool, shape, self.sigkill)
+                    if buffer is None: # stop thread if error occur in other threads
+                        return
+                    item = self.source.get_data(out=buffer)
+                    if item is None:
+                        self.pool.release(buffer)
+                if item is None: # source is exhausted
+                    break
+                ref = self.delta.check(item, i) if self.delta is not None else None
+                if ref is not None: # picture is not needed anymore
+                    if self.pool is not None:
+                        self.pool.release(item)
+                    item = ref
+                if self.metrics is not None:
+                    self.stats.record("process", time.perf_counter() - start)
+                    self.stats.count()
+                    self.metrics.stamp(item)
+                # deadline is set once, when frame is read
+                deadline = self.target.expiry() if isinstance(self.target, DeadlineQueue) else None
+                if self.sequence is not None:
+                    self.sequence.tag(item, i, deadline)
+                if not put_or_stop(self.target, item, self.sigkill, deadline):
+                    return # stop thread if error occur in other threads
+                self.produced += 1
                 time.sleep(self.delay_frame)
-                logging.debug(str(self.target.qsize()) + " items in queue a")
+                if logging.root.isEnabledFor(logging.DEBUG): # qsize takes lock of queue
+                    logging.debug(f"{self.target.qsize()} items in queue a")
             except: # send info to other threads that error occur here, and thread is stopped.
                 logging.error("thread dead!")
                 self.sigkill.put(self.name)
                 return
+        # consumers stop by themselves after frame_count - start_index frames,
+        # otherwise they wait for EOS, e.g. when queue can drop frames
+        expected = len(frames) if self.frame_count is not None else None
+        if self.produced != expected or getattr(self.target, "lossy", False):
+            put_or_stop(self.target, EOS, self.sigkill)
         return
@@ -0,0 +1,157 @@
+import collections
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from .deadline import DeadlineQueue
+from .framepool import FramePool
+from .multiprocess import FrameRing
+
+STAGES = ("Producer", "Consumer", "SavePicture", "SaveArchive")
+# frames of these functions mean that thread waits for queue or for free buffer,
+# i.e. back-pressure of the pipeline
+BLOCKING = {
+    queue.Queue.get.__code__,
+    queue.Queue.put.__code__,
+    DeadlineQueue.put.__code__,
+    FramePool.acquire.__code__,
+    FrameRing.acquire.__code__,
+}
+
+
+class ThreadProfile:
+    def __init__(self, name: str, ident: int):
+        """Samples of one thread: counts of stacks and times from the first to the last sample.
+
+        Args:
+            name (str): Name of the thread.
+            ident (int): Identifier of the thread, threading.get_ident of it.
+        """
+        self.name = name
+        self.stacks = collections.Counter() # collapsed stack -> samples
+        self.samples = 0
+        self.blocked = 0 # samples waiting in queue.get or put, or for buffer of pool
+        self.first = self.last = time.perf_counter()
+        try: # CPU clock of thread, not available on every platform
+            self._clock = time.pthread_getcpuclockid(ident)
+            self.cpu_first = self.cpu_last = time.clock_gettime(self._clock)
+        except (AttributeError, OSError):
+            self._clock = None
+        return
+
+    def sample(self, frame):
+        stack = []
+        blocked = False
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            blocked = blocked or code in BLOCKING
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+        self.blocked += blocked
+        self.last = time.perf_counter()
+        if self._clock is not None:
+            try:
+                self.cpu_last = time.clock_gettime(self._clock)
+            except OSError: # thread ended after stacks were taken
+                pass
+
+    def to_dict(self) -> dict:
+        wall = self.last - self.first
+        return {
+            "samples": self.samples,
+            "wall": wall,
+            "cpu": self.cpu_last - self.cpu_first if self._clock is not None else None,
+            # time in queues is estimated from share of samples
+            "blocked": wall * self.blocked / self.samples if self.samples else 0.0,
+        }
+
+
+class SamplingProfiler(threading.Thread):
+    def __init__(
+        self,
+        path: str = "./profile/",
+        interval: float = 0.01,
+        stages: tuple = STAGES,
+        name: str = "Profiler",
+    ):
+        """Thread that periodically takes stacks of threads of the pipeline (sys._current_frames),
+        with no changes to the threads. Thread belongs to the stage whose name its name starts with,
+        e.g. Consumer-0 and Consumer-1 to Consumer. Functions of OpenCV and numpy are not Python
+        functions, so time spent in them is shown in the line of Python function that calls them.
+
+        save writes to path:
+
+        - {thread}.collapsed: collapsed stacks of every thread, lines "f1;f2;f3 samples",
+          input of flamegraph.pl or speedscope;
+        - summary.json: wall time, CPU time and time blocked on queue.get or put, or on acquire
+          of FramePool, of every stage. The rest of wall time is spent waiting for the GIL,
+          sleeping or in I/O.
+
+        Args:
+            path (str, optional): Directory for files. Defaults to "./profile/".
+            interval (float, optional): Seconds between samples. Defaults to 0.01.
+            stages (tuple, optional): Stages whose threads are sampled.
+            Defaults to ("Producer", "Consumer", "SavePicture", "SaveArchive").
+            name (str, optional): Name of the thread. Defaults to "Profiler".
+        """
+        super(SamplingProfiler, self).__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        assert self.interval > 0, "Interval must be bigger than 0"
+        self.stages = stages
+        self.name = name
+        self.threads = {} # (ident, name) -> ThreadProfile, identifiers of ended threads are reused
+        self._stop_event = threading.Event()
+        return
+
+    def stage(self, thread_name: str) -> str:
+        """Stage of thread, or None if thread is not sampled."""
+        return next((stage for stage in self.stages if thread_name.startswith(stage)), None)
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident)
+            if name is None or self.stage(name) is None:
+                continue
+            if (ident, name) not in self.threads:
+                self.threads[(ident, name)] = ThreadProfile(name, ident)
+            self.threads[(ident, name)].sample(frame)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+        return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def summary(self) -> dict:
+        """Wall, CPU and blocked time in seconds, summed over threads of every stage."""
+        stages = {}
+        for profile in self.threads.values():
+            total = stages.setdefault(
+                self.stage(profile.name), {"threads": 0, "samples": 0, "wall": 0.0, "cpu": 0.0, "blocked": 0.0}
+            )
+            times = profile.to_dict()
+            total["threads"] += 1
+            for key, value in times.items():
+                total[key] = None if value is None or total[key] is None else total[key] + value
+        return stages
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        stacks = collections.defaultdict(collections.Counter) # threads of the same name are merged
+        for profile in self.threads.values():
+            stacks[profile.name].update(profile.stacks)
+        for name, counts in stacks.items():
+            with open(os.path.join(self.path, f"{name}.collapsed"), "w") as file:
+                for stack, samples in counts.most_common():
+                    file.write(f"{stack} {samples}\n")
+        with open(os.path.join(self.path, "summary.json"), "w") as file:
+            json.dump(self.summary(), file, indent=2)
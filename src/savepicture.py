@@ -4,7 +4,17 @@ import time
 import queue
 import cv2
 import os
+import collections
+import concurrent.futures
 import numpy as np
+from .framepool import FramePool
+from .metrics import Metrics
+from .stream import EOS
+from .delta import FrameRef, References
+from .journal import Journal
+from .sequence import Sequence
+
+FORMATS = ("png", "webp", "tiff", "npy") # webp is lossless, tiff is uncompressed
 
 
 class SavePictureThread(threading.Thread):
@@ -15,9 +25,18 @@ class SavePictureThread(threading.Thread):
         name: str = "SavePicture",
         path: str = "./processed/",
         frame_count: int = 100,
+        timeout: float = 0.1,
+        pool: FramePool = None,
+        writers: int = 0,
+        fmt: str = "png",
+        compression: int = None,
+        metrics: Metrics = None,
+        start_index: int = 0,
+        journal: Journal = None,
+        sequence: Sequence = None,
     ):
         """Thread responsible for saving data in png format.
-        It recieve data from Consumer.
+        It recieve data from Consumer, single pictures or batches of them.
         This thread will overwrite files. 
 
         Args:
@@ -29,7 +48,27 @@ class SavePictureThread(threading.Thread):
             path (str, optional): Place, where files are saved.
             Defaults to "./processed/".
             frame_count (int, optional): How many times data are taken from Source.
-            Defaults to 100.
+            None means streaming mode, thread stops on EOS. Defaults to 100.
+            timeout (float, optional): How long (in seconds) thread blocks on empty queue B
+            before it checks whether other threads are interrupted. Defaults to 0.1.
+            pool (FramePool, optional): Pool to which pictures are returned after saving.
+            Defaults to None.
+            writers (int, optional): Number of threads that encode and write files in parallel.
+            Index of file does not depend on which writer writes it. Defaults to 0, files are
+            written by this thread one by one.
+            fmt (str, optional): Format of files, one of "png", "webp" (lossless), "tiff"
+            (uncompressed) or "npy" (raw numpy array). Defaults to "png".
+            compression (int, optional): PNG compression level from 0 (fastest) to 9.
+            Defaults to None, OpenCV default.
+            metrics (Metrics, optional): Metrics of the pipeline. Defaults to None, nothing is measured.
+            start_index (int, optional): Index of the first picture, the same as start_index
+            of Producer when earlier run is resumed. Defaults to 0.
+            journal (Journal, optional): Journal to which indices of saved pictures are committed.
+            Defaults to None.
+            sequence (Sequence, optional): Sequence of the pipeline, from which indices of frames
+            in order of Producer are taken. Files and journal use them, and references are
+            resolved to their own keyframes. Defaults to None, pictures are indexed in order
+            of queue B, which is the order of Producer only with one Consumer.
         """
         super(SavePictureThread, self).__init__()
         self.target_B = target
@@ -39,8 +78,31 @@ class SavePictureThread(threading.Thread):
         self.name = name
         self.path = path
         self.frame_count = frame_count
-        assert (isinstance(self.frame_count, int) and self.frame_count > 0
+        assert (self.frame_count is None or isinstance(self.frame_count, int) and self.frame_count > 0
         ), "Number of data must be natural number bigger than 0"
+        self.timeout = timeout
+        self.pool = pool
+        self.writers = writers
+        assert (isinstance(self.writers, int) and self.writers >= 0
+        ), "Number of writers must be natural number or 0"
+        self.fmt = fmt
+        assert self.fmt in FORMATS, f"Format must be one of {FORMATS}"
+        self.params = {
+            "png": [] if compression is None else [cv2.IMWRITE_PNG_COMPRESSION, compression],
+            "webp": [cv2.IMWRITE_WEBP_QUALITY, 101], # quality above 100 means lossless
+            "tiff": [cv2.IMWRITE_TIFF_COMPRESSION, 1], # 1 means no compression
+            "npy": [],
+        }[self.fmt]
+        self.start_index = start_index
+        self.journal = journal
+        self.sequence = sequence
+        self.saved = 0 # frames written by run, unchanged frames included
+        self.dropped = 0 # unchanged frames dropped with their keyframes
+        self.references = References() # saved pictures referenced by unchanged pictures
+        self._references_file = None
+        self._variant_paths = set() # subdirectories already made for variants
+        self.metrics = metrics
+        self.stats = metrics.stage("SavePicture") if metrics is not None else None
         try:
             os.mkdir(self.path) # make a directory for files
         except:
@@ -49,30 +111,172 @@ class SavePictureThread(threading.Thread):
         return
 
     def run(self):
-        idx = 0
-        while True:
-            if not self.target_B.empty():
-                try:
-                    item = self.target_B.get()
-                    self.save_png(item, idx)
-                    logging.debug(str(self.target_B.qsize()) + " items in queue b")
-                    idx += 1
-                except: # send info to other threads that error occur here, and thread is stopped.
-                    logging.error("thread dead!")
-                    self.sigkill.put(self.name)
+        idx = self.start_index # index of the next frame in order of arrival
+        executor = None
+        if self.writers > 0:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                self.writers, thread_name_prefix=self.name
+            )
+        pending = collections.deque() # files written by executor, with their number of frames
+        # stop thread when all data are processed
+        while self.frame_count is None or idx < self.frame_count:
+            try: # block until data arrive instead of polling the queue
+                item = self.target_B.get(timeout=self.timeout)
+            except queue.Empty:
+                if not self.sigkill.empty(): # stop thread if error occur in other threads
                     break
-            elif not self.sigkill.empty(): # stop thread if error occur in other threads
+                continue
+            if item is EOS: # no more data, e.g. source is exhausted
                 break
-            if idx == self.frame_count: # stop thread when all data are processed
+            try:
+                born = self.metrics.unstamp(item, self.stats) if self.metrics is not None else None
+                # batch of pictures from Consumer, variants of one picture count once
+                count = len(item) if isinstance(item, np.ndarray) and item.ndim == 4 else 1
+                # files are named by index of frame in order of Producer
+                indices = self.sequence.take(item) if self.sequence is not None else None
+                if indices is None: # frames arrive in order of Producer
+                    indices = list(range(idx, idx + count))
+                idx += count
+                if self.sequence is not None and self.sequence.dropped: # keyframes dropped by queues
+                    self.dropped += self.references.drop(self.sequence.dropped)
+                if isinstance(item, FrameRef): # unchanged picture is not saved again
+                    self.write_references(self.references.reference(item, indices[0]))
+                    continue
+                if executor is None:
+                    self.write(item, indices, born)
+                    self.saved += count
+                else:
+                    pending.append((executor.submit(self.write, item, indices, born), count))
+                    while len(pending) > 2 * self.writers: # limit pictures waiting for writers
+                        self.complete(pending.popleft())
+                for i in indices:
+                    self.write_references(self.references.keyframe(i, i))
+                if logging.root.isEnabledFor(logging.DEBUG): # qsize takes lock of queue
+                    logging.debug(f"{self.target_B.qsize()} items in queue b")
+            except: # send info to other threads that error occur here, and thread is stopped.
+                logging.error("thread dead!")
+                self.sigkill.put(self.name)
                 break
+        if executor is not None:
+            failed = False
+            while pending: # writes that succeed are counted also after one of them fails
+                try:
+                    self.complete(pending.popleft())
+                except:
+                    failed = True
+            if failed: # send info to other threads that error occur here, and thread is stopped.
+                logging.error("thread dead!")
+                self.sigkill.put(self.name)
+            executor.shutdown()
+        if self._references_file is not None:
+            self._references_file.close()
+        if self.journal is not None:
+            self.journal.flush()
+        if self.sequence is not None:
+            self.dropped += self.references.drop(self.sequence.dropped)
         return
 
-    def save_png(self, arr, idx):
+    def complete(self, write):
+        """Wait for write submitted to writers and count its frames as saved.
+
+        Args:
+            write (tuple): Future of write and number of its frames.
+
+        Raises:
+            Exception: Error of write.
+        """
+        future, count = write
+        future.result()
+        self.saved += count
+
+    def write_references(self, pairs):
+        """Append references to unchanged pictures to references.csv in path.
+
+        Args:
+            pairs (list): Pairs (index of picture, index of saved picture it refers to).
+        """
+        if not pairs:
+            return
+        if self._references_file is None: # file is made only if there are references
+            # references of earlier run are kept when it is resumed
+            self._references_file = open(
+                os.path.join(self.path, "references.csv"), "a" if self.start_index else "w"
+            )
+            if self._references_file.tell() == 0:
+                self._references_file.write("index,reference\n")
+        for idx, reference in pairs:
+            self._references_file.write(f"{idx},{reference}\n")
+        self.saved += len(pairs)
+        if self.journal is not None:
+            self._references_file.flush()
+            for idx, _ in pairs:
+                self.journal.commit(idx)
+
+    def write(self, item, indices, born=None):
+        """Save picture or batch of pictures, and return it to the pool.
+        Variants of picture, given as dict {(resize_ratio, kernel): picture},
+        are saved to subdirectories r{resize_ratio}_k{kernel} of path.
+
+        Args:
+            item (np.ndarray or dict): Picture, batch of pictures or variants of picture.
+            indices (list): Indices of pictures of batch, one index for picture or its variants.
+            born (float, optional): Time of creation of data, for end-to-end latency.
+            Defaults to None.
+        """
+        if self.metrics is not None:
+            start = time.perf_counter()
+        if isinstance(item, dict):
+            for (resize_ratio, kernel), picture in item.items():
+                path = os.path.join(self.path, f"r{resize_ratio:g}_k{kernel}", "")
+                if path not in self._variant_paths:
+                    os.makedirs(path, exist_ok=True)
+                    self._variant_paths.add(path)
+                self.save(picture, indices[0], path)
+            pictures = (item,)
+        else:
+            pictures = item if item.ndim == 4 else (item,)
+            for picture, idx in zip(pictures, indices):
+                self.save(picture, idx)
+        if self.journal is not None:
+            for idx in indices:
+                self.journal.commit(idx)
+        if self.pool is not None:
+            for picture in (item.values() if isinstance(item, dict) else (item,)):
+                self.pool.release(picture)
+        if self.metrics is not None:
+            end = time.perf_counter()
+            self.stats.record("write", end - start)
+            self.stats.count(len(pictures))
+            if born is not None:
+                self.stats.record("latency", end - born)
+
+    def save(self, arr, idx, path=None):
+        """Save picture to file in format set in class constructor.
+
+        Args:
+            arr (np.ndarray): Picture.
+            idx (int): Index of picture.
+            path (str, optional): Directory of file. Defaults to path set in class constructor.
+        """
+        if self.fmt == "png" and not self.params:
+            return self.save_png(arr, idx, path)
+        path = f"{path or self.path}{idx}.{self.fmt}"
+        if self.fmt == "npy":
+            np.save(path, arr)
+        else:
+            encoded, data = cv2.imencode(f".{self.fmt}", arr, self.params)
+            assert encoded, f"Picture can not be encoded to {self.fmt}"
+            data.tofile(path)
+        logging.debug("%s saved", path)
+
+    def save_png(self, arr, idx, path=None):
         """Save picture to png file. 
 
         Args:
             arr (np.ndarray): Picture.
             idx (int): Index of picture. 
+            path (str, optional): Directory of file. Defaults to path set in class constructor.
         """
-        logging.debug(f"{self.path}{idx}.png saved")
-        cv2.imwrite(f"{self.path}{idx}.png", arr)
+        path = path or self.path
+        logging.debug("%s%d.png saved", path, idx)
+        cv2.imwrite(f"{path}{idx}.png", arr)
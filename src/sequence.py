@@ -0,0 +1,75 @@
+import threading
+from .delta import FrameRef
+
+
+class Sequence:
+    def __init__(self):
+        """Indices of frames in order of Producer and their deadlines, shared by all stages
+        of the pipeline. Several Consumers change order of frames, so sinks can not count them.
+        Tags are kept by id of item, like stamps of Metrics, so frames do not have to carry them:
+        Producer tags every frame, Consumer moves tags of its input to its output,
+        and sink takes them.
+
+        Indices of pictures dropped by queues are remembered, so sinks drop references
+        to them, which can not be resolved, see References.drop.
+        """
+        self._indices = {}
+        self._deadlines = {}
+        self.dropped = set() # indices of dropped pictures
+        self._lock = threading.Lock()
+        return
+
+    def tag(self, item, indices, deadline: float = None):
+        """Remember indices of item.
+
+        Args:
+            item: Frame, batch of frames, variants of frame or FrameRef.
+            indices (int or list): Index of frame, or indices of frames of batch.
+            deadline (float, optional): Deadline of item in queues, see DeadlineQueue.put.
+            Defaults to None, no deadline.
+        """
+        with self._lock:
+            self._indices[id(item)] = [indices] if isinstance(indices, int) else list(indices)
+            if deadline is not None:
+                self._deadlines[id(item)] = deadline
+
+    def deadline(self, *items) -> float:
+        """The earliest deadline of items, or None if they have no deadline."""
+        with self._lock:
+            deadlines = [self._deadlines[id(item)] for item in items if id(item) in self._deadlines]
+        return min(deadlines, default=None)
+
+    def take(self, item) -> list:
+        """Remove and return indices of item.
+
+        Args:
+            item: Item taken from queue.
+
+        Returns:
+            list: Indices of frames of item, or None if item is not tagged.
+        """
+        with self._lock:
+            self._deadlines.pop(id(item), None)
+            return self._indices.pop(id(item), None)
+
+    def take_batch(self, items) -> list:
+        """Remove and return indices of items, e.g. pictures of batch.
+
+        Args:
+            items (list): Items taken from queue.
+
+        Returns:
+            list: Indices of all items, or None if some item is not tagged.
+        """
+        indices = [self.take(item) for item in items]
+        if any(index is None for index in indices):
+            return None
+        return [idx for index in indices for idx in index]
+
+    def drop(self, item):
+        """Forget item dropped from queue, e.g. in on_drop of DeadlineQueue.
+        Indices of dropped pictures are remembered."""
+        indices = self.take(item)
+        if indices is not None and not isinstance(item, FrameRef):
+            with self._lock:
+                self.dropped.update(indices)
@@ -1,13 +1,266 @@
+import threading
+import queue
+import glob
+import os
+import collections
+import concurrent.futures
+import typing
+import time
 import numpy as np
+import cv2
+from .stream import EOS
+
+
+class FrameSource(typing.Protocol):
+    """Protocol of sources used by ProducerThread. get_data returns the next frame,
+    written to out if it is given, or None when the source is exhausted.
+    Sources can also have skip(count) method, which is used on resume instead of
+    reading frames that are skipped, and shape attribute, shape of all frames,
+    without which frames are not written to buffers of FramePool."""
+
+    def get_data(self, out: np.ndarray = None) -> np.ndarray:
+        ...
+
+
+SOURCE_MODES = ("random", "generator", "ring", "bytes")
+FILL_CHUNK = 1 << 16 # bytes of random bits generated at once, so buffers are filled without big temporaries
 
 
 class Source:
-    def __init__(self, source_shape: tuple):
+    def __init__(self, source_shape: tuple, mode: str = "random", seed: int = None, ring_size: int = 8):
+        """Synthetic pictures of random noise. Besides default mode, there are modes for
+        load testing, in which the source is much faster than the rest of the pipeline:
+
+        - "generator" fills pictures with raw bits of a seeded np.random.Generator;
+        - "ring" serves ring_size pictures generated in advance, round-robin;
+        - "bytes" does not generate data at all, pictures keep what was in the buffer.
+
+        Args:
+            source_shape (tuple): Shape of pictures, (rows, cols, channels).
+            mode (str, optional): "random", "generator", "ring" or "bytes". Defaults to "random".
+            seed (int, optional): Seed of generator, used by "generator" and "ring" modes.
+            Defaults to None, random seed.
+            ring_size (int, optional): Number of pictures in "ring" mode. Defaults to 8.
+        """
         self._source_shape: tuple = source_shape
+        self.mode = mode
+        assert self.mode in SOURCE_MODES, f"Mode must be one of {SOURCE_MODES}"
+        self._rng = np.random.default_rng(seed)
+        self._served = 0
+        if self.mode == "ring":
+            self._ring = np.empty((ring_size, *source_shape), dtype=np.uint8)
+            for picture in self._ring:
+                self._fill(picture)
+        elif self.mode == "bytes":
+            self._ring = np.zeros((1, *source_shape), dtype=np.uint8)
+
+    @property
+    def shape(self) -> tuple:
+        """Shape of pictures, (rows, cols, channels)."""
+        return self._source_shape
+
+    def _fill(self, out: np.ndarray):
+        # 64 random bits per call of bit generator are much cheaper than randint per byte
+        if not out.flags.c_contiguous: # e.g. view of bigger array
+            picture = np.empty(out.shape, dtype=np.uint8)
+            self._fill(picture)
+            np.copyto(out, picture)
+            return
+        flat = out.reshape(-1)
+        for start in range(0, flat.size, FILL_CHUNK):
+            chunk = flat[start:start + FILL_CHUNK]
+            bits = self._rng.bit_generator.random_raw(-(-chunk.size // 8))
+            chunk[:] = bits.view(np.uint8)[:chunk.size]
 
-    def get_data(self) -> np.ndarray:
+    def get_data(self, out: np.ndarray = None) -> np.ndarray:
         rows, cols, channels = self._source_shape
+        if self.mode == "generator":
+            if out is None:
+                out = np.empty(self._source_shape, dtype=np.uint8)
+            self._fill(out)
+            return out
+        if self.mode in ("ring", "bytes"):
+            picture = self._ring[self._served % len(self._ring)] # new view, so items are distinct
+            self._served += 1
+            if out is None:
+                return picture
+            if self.mode == "ring":
+                np.copyto(out, picture)
+            return out
+        if out is not None: # fill given buffer in place
+            self._fill(out)
+            return out
 
         return np.random.randint(
             256, size=rows * cols * channels, dtype=np.uint8
-        ).reshape(self._source_shape)
\ No newline at end of file
+        ).reshape(self._source_shape)
+
+    def skip(self, count: int):
+        """Skip count pictures. Generator is advanced as if they were generated,
+        so seeded source gives the same pictures after them."""
+        if self.mode == "generator":
+            self._rng.bit_generator.advance(count * -(-int(np.prod(self._source_shape)) // 8))
+        self._served += count
+
+    def measure_fps(self, frames: int = 100, out: bool = True) -> float:
+        """Measure how many pictures per second the source can produce.
+
+        Args:
+            frames (int, optional): Number of pictures taken. Defaults to 100.
+            out (bool, optional): Write pictures to preallocated buffer, as with FramePool.
+            Defaults to True.
+
+        Returns:
+            float: Pictures per second.
+        """
+        buffer = np.empty(self._source_shape, dtype=np.uint8) if out else None
+        start = time.perf_counter()
+        for _ in range(frames):
+            self.get_data(out=buffer)
+        return frames / (time.perf_counter() - start)
+
+
+def _output(frame: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    if frame is None or out is None:
+        return frame
+    np.copyto(out, frame)
+    return out
+
+
+class VideoSource:
+    def __init__(self, path: str, prefetch: int = 8):
+        """Frames of video file. They are decoded by cv2.VideoCapture in a separate
+        thread, which keeps up to prefetch frames ready, so decoding overlaps
+        with processing of previous frames.
+
+        Args:
+            path (str): Path of video file.
+            prefetch (int, optional): Maximal number of decoded frames waiting. Defaults to 8.
+        """
+        self.path = path
+        self._capture = cv2.VideoCapture(path)
+        assert self._capture.isOpened(), f"{path} can not be opened"
+        self.shape = (
+            int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            3,
+        )
+        self._frames = queue.Queue(maxsize=prefetch)
+        self._stop_requested = threading.Event()
+        self._reader = threading.Thread(target=self._read, name="VideoSource", daemon=True)
+        self._reader.start()
+        return
+
+    def _read(self):
+        try:
+            while not self._stop_requested.is_set():
+                ok, frame = self._capture.read()
+                if not ok:
+                    break
+                self._frames.put(frame)
+        finally:
+            self._frames.put(EOS)
+
+    def get_data(self, out: np.ndarray = None) -> np.ndarray:
+        frame = self._frames.get()
+        if frame is EOS:
+            self._frames.put(EOS) # source stays exhausted
+            return None
+        return _output(frame, out)
+
+    def close(self):
+        """Stop decoding and release the file."""
+        self._stop_requested.set()
+        while self._reader.is_alive(): # reader may wait on full queue
+            try:
+                self._frames.get_nowait()
+            except queue.Empty:
+                pass
+            self._reader.join(timeout=0.01)
+        self._capture.release()
+
+
+class DirectorySource:
+    def __init__(self, path: str, pattern: str = "*.png", workers: int = 4, prefetch: int = 8):
+        """Pictures from files in directory, in order of their names. Files are read
+        by a pool of threads, up to prefetch files ahead of the consumer of frames.
+
+        Args:
+            path (str): Directory with pictures.
+            pattern (str, optional): Pattern of names of files. Defaults to "*.png".
+            workers (int, optional): Number of threads reading files. Defaults to 4.
+            prefetch (int, optional): Maximal number of files read ahead. Defaults to 8.
+        """
+        self.path = path
+        self.files = sorted(glob.glob(os.path.join(path, pattern)))
+        self.prefetch = prefetch
+        assert (isinstance(self.prefetch, int) and self.prefetch > 0
+        ), "Prefetch must be natural number bigger than 0"
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="DirectorySource")
+        self._next = iter(self.files)
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._fill()
+        return
+
+    def _fill(self):
+        while len(self._pending) < self.prefetch:
+            filename = next(self._next, None)
+            if filename is None:
+                return
+            self._pending.append(self._executor.submit(cv2.imread, filename))
+
+    def get_data(self, out: np.ndarray = None) -> np.ndarray:
+        with self._lock:
+            if not self._pending:
+                return None
+            future = self._pending.popleft()
+            self._fill()
+        frame = future.result()
+        assert frame is not None, "File can not be read as a picture"
+        return _output(frame, out)
+
+    def close(self):
+        """Stop reading files."""
+        for future in self._pending:
+            future.cancel()
+        self._executor.shutdown()
+
+
+class RawSource:
+    def __init__(self, path: str, shape: tuple, dtype: type = np.uint8, offset: int = 0):
+        """Frames of headerless file of raw data, frame after frame. The file is
+        memory-mapped and get_data returns views of it, so frames are not copied
+        unless out is given. Incomplete frame at the end of the file is ignored.
+
+        Args:
+            path (str): Path of raw file.
+            shape (tuple): Shape of one frame, e.g. (768, 1024, 3).
+            dtype (type, optional): Type of data. Defaults to np.uint8.
+            offset (int, optional): Bytes skipped at the start of the file. Defaults to 0.
+        """
+        self.path = path
+        self.shape = tuple(shape)
+        frame_size = int(np.prod(self.shape)) * np.dtype(dtype).itemsize
+        self.frame_count = (os.path.getsize(path) - offset) // frame_size
+        self.frames = np.memmap(
+            path, dtype=dtype, mode="r", offset=offset, shape=(self.frame_count, *self.shape)
+        )
+        self._idx = 0
+        self._lock = threading.Lock()
+        return
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def skip(self, count: int):
+        with self._lock:
+            self._idx = min(self._idx + count, self.frame_count)
+
+    def get_data(self, out: np.ndarray = None) -> np.ndarray:
+        with self._lock:
+            if self._idx >= self.frame_count:
+                return None
+            frame = self.frames[self._idx]
+            self._idx += 1
+        return _output(frame, out)
@@ -0,0 +1,11 @@
+class EndOfStream:
+    """Type of EOS marker. Producer puts EOS to queue A after the last frame when the
+    number of frames is not known up front, and every stage passes it on after all of
+    its frames, so threads can drain their queues and stop in order.
+    """
+
+    def __repr__(self):
+        return "EOS"
+
+
+EOS = EndOfStream()
@@ -0,0 +1,70 @@
+import concurrent.futures
+import numpy as np
+import cv2
+
+
+def tiles(shape: tuple, tile_size: tuple) -> list:
+    """Split picture into tiles.
+
+    Args:
+        shape (tuple): Shape of picture.
+        tile_size (tuple): Rows and columns of one tile. None means whole height or width.
+
+    Returns:
+        list: Tiles as (first row, last row, first column, last column), last ones excluded.
+    """
+    rows, cols = (size or extent for size, extent in zip(tile_size, shape))
+    assert rows > 0 and cols > 0, "Size of tile must be natural number bigger than 0"
+    return [
+        (top, min(top + rows, shape[0]), left, min(left + cols, shape[1]))
+        for top in range(0, shape[0], rows)
+        for left in range(0, shape[1], cols)
+    ]
+
+
+def _median_tile(picture, dst, tile, kernel):
+    top, bottom, left, right = tile
+    half = kernel // 2
+    # tile is extended by half of kernel, so median is exact at its borders;
+    # at borders of picture, medianBlur replicates pixels like for the whole picture
+    first_row, first_col = max(0, top - half), max(0, left - half)
+    region = picture[first_row:min(picture.shape[0], bottom + half), first_col:min(picture.shape[1], right + half)]
+    filtered = cv2.medianBlur(np.ascontiguousarray(region), ksize=kernel)
+    dst[top:bottom, left:right] = filtered[top - first_row:bottom - first_row, left - first_col:right - first_col]
+
+
+def median_tiled(
+    picture: np.ndarray,
+    kernel: int = 5,
+    tile_size: tuple = (256, None),
+    executor: concurrent.futures.Executor = None,
+    dst: np.ndarray = None,
+) -> np.ndarray:
+    """Median filter applied tile by tile. Result is exactly the same as of
+    cv2.medianBlur on the whole picture, but tiles can be filtered in parallel,
+    and memory used by the filter is bounded by size of tile.
+
+    Args:
+        picture (np.ndarray): Picture.
+        kernel (int, optional): Kernel of median filter. Defaults to 5.
+        tile_size (tuple, optional): Rows and columns of one tile, None means whole height
+        or width. Defaults to (256, None): stripes of full rows are filtered as fast as
+        the whole picture, while narrower tiles are about two times slower.
+        executor (concurrent.futures.Executor, optional): Executor filtering tiles in parallel.
+        Defaults to None, tiles are filtered one by one.
+        dst (np.ndarray, optional): Array for the result. Defaults to new array.
+
+    Returns:
+        np.ndarray: Filtered picture.
+    """
+    if dst is None:
+        dst = np.empty_like(picture)
+    parts = tiles(picture.shape, tile_size)
+    if executor is None:
+        for tile in parts:
+            _median_tile(picture, dst, tile, kernel)
+    else:
+        futures = [executor.submit(_median_tile, picture, dst, tile, kernel) for tile in parts]
+        for future in futures:
+            future.result()
+    return dst
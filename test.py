@@ -1,13 +1,47 @@
 import unittest
 import queue
+import multiprocessing
+import concurrent.futures
+import io
+import time
+import threading
+import asyncio
+import itertools
+import collections
+import json
 import shutil
+import subprocess
+import sys
+import contextlib
+import tracemalloc
 import os
 import cv2
 import numpy as np
-from src.source import Source
+from src.cache import ResultCache
+from src.delta import DeltaDetector, FrameRef
+from src.sequence import Sequence
+from src.deadline import DeadlineQueue
+from src.journal import Journal
+from src.profiler import SamplingProfiler
+from src.source import Source, VideoSource, DirectorySource, RawSource
 from src.producer import ProducerThread
 from src.consumer import ConsumerThread
+from src.consumerpool import ConsumerPool
+from src.counter import FrameCounter
+from src.framepool import FramePool
+from src.fused import resize_median
+from src.tiled import median_tiled
+from src.backends import resize_numpy, median_numpy, select
+from src.archive import FrameArchive, SaveArchiveThread
+from src.metrics import Histogram, Metrics, MetricsReporter
+from benchmarks.suite import compare
+from src.cli import cli, parse_args, runner_options
+from src.pipeline import Pipeline, Stage, PipelineError
+from src.controller import AdaptiveController, set_maxsize
 from src.savepicture import SavePictureThread
+from src.stream import EOS
+from src.aio import AsyncPipeline, source_frames, process_picture
+from src.multiprocess import FrameRing, ProducerProcess, ConsumerProcess, SavePictureProcess
 
 
 class TestProducerThread(unittest.TestCase):
@@ -59,6 +93,21 @@ class TestProducerThread(unittest.TestCase):
                 sigkill=self.queue_errors,
             )
 
+    def test_production_5(self):
+        """ Test if thread waiting for full queue A is stopped when other thread is interrupted.
+        """
+        target = queue.Queue(maxsize=1)
+        producer = ProducerThread(
+            target=target, frame_count=10, picture_shape=(20, 30), delay_frame=0, sigkill=self.queue_errors
+        )
+        producer.start()
+        time.sleep(0.2)
+        self.assertTrue(producer.is_alive()) # blocked on full queue, no pool
+        self.queue_errors.put("Consumer")
+        producer.join(timeout=1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(producer.produced, 1)
+
     def test_production_4(self):
         with self.assertRaises(AssertionError):
             ProducerThread(
@@ -168,6 +217,40 @@ class TestConsumerThread(unittest.TestCase):
             consumer.join()
 
 
+    def test_consumption_5(self):
+        """ Test if thread waiting for data is stopped when other thread is interrupted.
+        """
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b),
+            sigkill=self.queue_errors,
+            timeout=0.01,
+        )
+        consumer.start()
+        self.queue_errors.put("Producer")
+        consumer.join(timeout=1)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(self.q_b.qsize(), 0)
+
+    def test_consumption_6(self):
+        """ Test if thread waiting for full queue B is stopped when other thread is interrupted.
+        """
+        q_b = queue.Queue(maxsize=1)
+        for _ in range(3):
+            self.q_a.put(np.zeros((20, 30, 3), dtype=np.uint8))
+        consumer = ConsumerThread(
+            target=(self.q_a, q_b),
+            sigkill=self.queue_errors,
+            frame_count=3,
+            timeout=0.01,
+        )
+        consumer.start()
+        time.sleep(0.2)
+        self.assertTrue(consumer.is_alive()) # blocked on full queue B
+        self.queue_errors.put("SavePicture")
+        consumer.join(timeout=1)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(q_b.qsize(), 1)
+
     def test_apply_filter(self):
         """ Test if filter method return picture with correct dimensions.
         """
@@ -179,6 +262,52 @@ class TestConsumerThread(unittest.TestCase):
         picture_2 = consumer.apply_filter(picture_1)
         self.assertEqual(picture_1.shape, picture_2.shape)
 
+class TestConsumerPool(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue()
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+
+    def test_pool_1(self):
+        producer = ProducerThread(
+            target=self.q_a,
+            frame_count=20,
+            picture_shape=(100, 50),
+            sigkill=self.queue_errors,
+            delay_frame=0,
+        )
+        producer.start()
+        pool = ConsumerPool(
+            target=(self.q_a, self.q_b),
+            frame_count=20,
+            sigkill=self.queue_errors,
+            workers=3,
+        )
+        pool.start()
+        producer.join()
+        pool.join()
+
+        self.assertFalse(pool.is_alive())
+        self.assertEqual(pool.counter.count, 20)
+        self.assertEqual(self.q_b.qsize(), 20)
+        self.assertEqual(self.q_a.qsize(), 0)
+
+    def test_pool_2(self):
+        with self.assertRaises(AssertionError):
+            ConsumerPool(
+                target=(self.q_a, self.q_b),
+                sigkill=self.queue_errors,
+                workers=0,
+            )
+
+    def test_counter(self):
+        counter = FrameCounter(frame_count=3)
+        self.assertEqual(counter.increment(2), 2)
+        self.assertFalse(counter.finished())
+        counter.increment()
+        self.assertTrue(counter.finished())
+
+
 class TestResize(unittest.TestCase):
     """Test resize. Resize shouldn't affect the picture, so here 
     are compared histogram of orginal and modified pictures to dermine if 
@@ -266,6 +395,1483 @@ class TestSavePictureThread(unittest.TestCase):
         self.assertEqual(len(os.listdir("./test_processed/")), 55)
 
 
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue()
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+        for _ in range(20):
+            self.q_a.put(Source((100, 50, 3)).get_data())
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_batch_1(self):
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b),
+            sigkill=self.queue_errors,
+            frame_count=20,
+            batch_size=8,
+        )
+        consumer.start()
+        consumer.join()
+        batches = [self.q_b.get() for _ in range(self.q_b.qsize())]
+        self.assertEqual([len(batch) for batch in batches], [8, 8, 4])
+        self.assertEqual(batches[0].shape, (8, 50, 25, 3))
+
+    def test_batch_2(self):
+        pool = FramePool(size=4)
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b),
+            sigkill=self.queue_errors,
+            frame_count=20,
+            batch_size=6,
+            pool=pool,
+        )
+        save_pic = SavePictureThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=20,
+            sigkill=self.queue_errors,
+            pool=pool,
+        )
+        consumer.start()
+        save_pic.start()
+        consumer.join()
+        save_pic.join()
+        self.assertEqual(len(os.listdir("./test_processed/")), 20)
+
+    def test_batch_3(self):
+        """ Test if picture of other shape starts new batch.
+        """
+        self.q_a.put(Source((60, 40, 3)).get_data())
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b),
+            sigkill=self.queue_errors,
+            frame_count=21,
+            batch_size=32,
+        )
+        consumer.start()
+        consumer.join()
+        self.assertEqual(self.q_b.get().shape, (20, 50, 25, 3))
+        self.assertEqual(self.q_b.get().shape, (1, 30, 20, 3))
+
+    def test_batch_4(self):
+        """ Test if picture taken for the next batch is returned to queue A when worker is stopped.
+        """
+        self.q_a.put(Source((60, 40, 3)).get_data())
+        counter = FrameCounter(frame_count=21)
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b), sigkill=self.queue_errors, counter=counter, batch_size=32
+        )
+        process_batch = consumer.process_batch
+        def stop_in_batch(pictures): # stop is requested while the first batch is processed
+            consumer.stop()
+            return process_batch(pictures)
+        consumer.process_batch = stop_in_batch
+        consumer.start()
+        consumer.join()
+        self.assertEqual(counter.count, 20)
+        self.assertEqual(self.q_a.qsize(), 1)
+        rest = ConsumerThread(target=(self.q_a, self.q_b), sigkill=self.queue_errors, counter=counter)
+        rest.start()
+        rest.join()
+        self.assertEqual(counter.count, 21)
+        self.assertEqual([self.q_b.get().shape for _ in range(2)], [(20, 50, 25, 3), (30, 20, 3)])
+
+
+class TestTiled(unittest.TestCase):
+    def test_median_tiled(self):
+        picture = Source((301, 257, 3)).get_data()
+        with concurrent.futures.ThreadPoolExecutor(3) as executor:
+            for kernel, tile_size in ((3, (64, 64)), (5, (100, 1)), (7, (1, None)), (5, (256, None))):
+                expected = cv2.medianBlur(picture, kernel)
+                self.assertTrue(np.array_equal(median_tiled(picture, kernel, tile_size), expected))
+                self.assertTrue(np.array_equal(median_tiled(picture, kernel, tile_size, executor), expected))
+
+    def test_consumer_tiled(self):
+        q_a, q_b, queue_errors = queue.Queue(), queue.Queue(), queue.Queue()
+        picture = cv2.imread('./test_pictures/test_2.png')
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            consumer = ConsumerThread(
+                target=(q_a, q_b),
+                sigkill=queue_errors,
+                mode="tiled",
+                tile_size=(100, 128),
+                executor=executor,
+                pool=FramePool(2),
+            )
+            result = consumer.process(picture.copy())
+        expected = ConsumerThread(target=(q_a, q_b), sigkill=queue_errors).process(picture)
+        self.assertTrue(np.array_equal(result, expected))
+
+
+class TestBackends(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_numpy_kernels(self):
+        picture = Source((102, 78, 3)).get_data()
+        for ratio in (2, 3):
+            shape = (102 // ratio, 78 // ratio)
+            resized = resize_numpy(picture, shape, ratio)
+            self.assertTrue(np.shares_memory(resized, picture))
+            expected = cv2.resize(picture, shape[::-1], interpolation=cv2.INTER_NEAREST)
+            self.assertTrue(np.array_equal(resized, expected))
+        for kernel in (3, 5, 7):
+            self.assertTrue(np.array_equal(median_numpy(picture, kernel), cv2.medianBlur(picture, kernel)))
+        floats = picture.astype(np.float32) / 7
+        self.assertTrue(np.array_equal(median_numpy(floats, 5), cv2.medianBlur(floats, 5)))
+
+    def test_consumer_backends(self):
+        q_a, q_b, queue_errors = queue.Queue(), queue.Queue(), queue.Queue()
+        picture = cv2.imread('./test_pictures/test_1.png')
+        consumers = [
+            ConsumerThread(target=(q_a, q_b), sigkill=queue_errors, interpolation=cv2.INTER_NEAREST, backend=backend)
+            for backend in ("opencv", "numpy")
+        ]
+        self.assertTrue(np.array_equal(*(consumer.process(picture) for consumer in consumers)))
+        floats = ConsumerThread( # OpenCV has no median with such kernel for float32
+            target=(q_a, q_b), sigkill=queue_errors, kernel=7
+        ).process(picture.astype(np.float32))
+        self.assertEqual(floats.dtype, np.float32)
+
+    def test_select(self):
+        path = "./test_processed/backends.json"
+        args = ("resize", (768, 1024, 3), np.uint8, 2, 5, cv2.INTER_NEAREST)
+        choice = select(*args, path=path)
+        self.assertIn(choice, ("opencv", "numpy"))
+        with open(path) as file:
+            stored = json.load(file)
+        self.assertEqual(list(stored["choices"].values()), [choice])
+        self.assertEqual(select("resize", (768, 1024, 3), np.uint8, 2, 5, cv2.INTER_LINEAR, path=path), "opencv")
+
+
+class TestVariants(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_variants(self):
+        q_a, q_b, queue_errors = queue.Queue(), queue.Queue(), queue.Queue()
+        picture = cv2.imread('./test_pictures/test_0.png')
+        for _ in range(3):
+            q_a.put(picture)
+        consumer = ConsumerThread(
+            target=(q_a, q_b),
+            sigkill=queue_errors,
+            frame_count=3,
+            variants=[(4, 3), (2, 5), (2, 3), (4, 3)],
+        )
+        consumer.start()
+        consumer.join()
+        item = q_b.queue[0]
+        self.assertEqual(sorted(item), [(2, 3), (2, 5), (4, 3)])
+        self.assertEqual(item[(4, 3)].shape, (192, 256, 3))
+        for (resize_ratio, kernel), result in item.items():
+            self.assertTrue(np.array_equal(result, ConsumerThread(
+                target=(q_a, q_b), sigkill=queue_errors, resize_ratio=resize_ratio, kernel=kernel
+            ).process(picture)))
+        save_pic = SavePictureThread(
+            target=q_b, path="./test_processed/", frame_count=3, sigkill=queue_errors
+        )
+        save_pic.start()
+        save_pic.join()
+        self.assertEqual(sorted(os.listdir("./test_processed/")), ["r2_k3", "r2_k5", "r4_k3"])
+        self.assertTrue(np.all(cv2.imread("./test_processed/r4_k3/2.png") == item[(4, 3)]))
+        with self.assertRaises(AssertionError):
+            ConsumerThread(target=(q_a, q_b), sigkill=queue_errors, variants=[(2, 5)], batch_size=2)
+
+    def test_variants_pyramid(self):
+        """ Test if every variant equals standalone processing, also when smaller size
+        is computed from the bigger one.
+        """
+        q_a, q_b, queue_errors = queue.Queue(), queue.Queue(), queue.Queue()
+        variants = [(2, 3), (3, 3), (4, 5), (8, 3)]
+        for picture in (cv2.imread('./test_pictures/test_0.png'), Source((102, 78, 3)).get_data()):
+            for interpolation in (cv2.INTER_NEAREST, cv2.INTER_LINEAR, cv2.INTER_AREA):
+                results = ConsumerThread(
+                    target=(q_a, q_b), sigkill=queue_errors, interpolation=interpolation, variants=variants
+                ).process_variants(picture)
+                for resize_ratio, kernel in variants:
+                    expected = ConsumerThread(
+                        target=(q_a, q_b),
+                        sigkill=queue_errors,
+                        resize_ratio=resize_ratio,
+                        kernel=kernel,
+                        interpolation=interpolation,
+                    ).process(picture)
+                    self.assertTrue(np.array_equal(results[(resize_ratio, kernel)], expected))
+
+
+class TestCache(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def run_consumer(self, pictures, cache, pool=None):
+        q_a, q_b = queue.Queue(), queue.Queue()
+        for picture in pictures:
+            q_a.put(picture)
+        consumer = ConsumerThread(
+            target=(q_a, q_b),
+            sigkill=queue.Queue(),
+            frame_count=len(pictures),
+            cache=cache,
+            pool=pool,
+        )
+        consumer.start()
+        consumer.join()
+        return list(q_b.queue)
+
+    def test_cache_1(self):
+        pictures = [cv2.imread(f'./test_pictures/test_{i}.png') for i in (0, 1, 0, 0)]
+        frame_bytes = 384 * 512 * 3
+        cache = ResultCache(max_bytes=2 * frame_bytes)
+        results = self.run_consumer(pictures, cache, pool=FramePool(2))
+        expected = ConsumerThread(target=(queue.Queue(), queue.Queue()), sigkill=queue.Queue()).process(pictures[0])
+        self.assertTrue(all(np.all(results[i] == expected) for i in (0, 2, 3)))
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (2, 2, 0))
+        self.assertIsNone(cache.get(ResultCache.key(pictures[0], 3, 5)))
+        self.run_consumer([cv2.imread('./test_pictures/test_2.png')], cache)
+        self.assertEqual((cache.evictions, cache.bytes), (1, 2 * frame_bytes))
+
+    def test_cache_2(self):
+        """ Test if results are found on disk by other cache, e.g. in next run.
+        """
+        picture = cv2.imread('./test_pictures/test_1.png')
+        first = self.run_consumer([picture], ResultCache(path="./test_processed/"))
+        cache = ResultCache(path="./test_processed/")
+        second = self.run_consumer([picture], cache)
+        self.assertEqual((cache.disk_hits, cache.misses), (1, 0))
+        self.assertIsInstance(second[0], np.memmap)
+        self.assertTrue(np.all(first[0] == second[0]))
+
+
+class ListSource:
+    def __init__(self, pictures):
+        self.pictures = list(pictures)
+
+    def get_data(self, out=None):
+        return self.pictures.pop(0) if self.pictures else None
+
+
+class TestDelta(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue()
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+        first, second = (cv2.imread(f'./test_pictures/test_{i}.png') for i in (0, 1))
+        noisy = first.copy()
+        noisy[::50, ::50] += 1 # small change is ignored
+        self.pictures = [first, noisy, first, second, second, first]
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def run_pipeline(self, sink):
+        producer = ProducerThread(
+            target=self.q_a,
+            sigkill=self.queue_errors,
+            frame_count=None,
+            delay_frame=0,
+            source=ListSource(self.pictures),
+            delta=DeltaDetector(),
+        )
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b), sigkill=self.queue_errors, frame_count=None, batch_size=2
+        )
+        for thread in (producer, consumer, sink):
+            thread.start()
+        for thread in (producer, consumer, sink):
+            thread.join()
+        self.assertEqual(producer.delta.skipped, 3)
+
+    def test_delta_1(self):
+        self.run_pipeline(SavePictureThread(
+            target=self.q_b, path="./test_processed/", frame_count=None, sigkill=self.queue_errors
+        ))
+        self.assertEqual(sorted(os.listdir("./test_processed/")), ["0.png", "3.png", "5.png", "references.csv"])
+        with open("./test_processed/references.csv") as file:
+            self.assertEqual(file.read(), "index,reference\n1,0\n2,0\n4,3\n")
+
+    def test_delta_2(self):
+        self.run_pipeline(SaveArchiveThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=None,
+            sigkill=self.queue_errors,
+            capacity=6,
+        ))
+        archive = FrameArchive("./test_processed/frames.archive")
+        self.assertEqual(archive.count, 3)
+        self.assertEqual(list(archive.index), [0, 0, 0, 1, 1, 2])
+        self.assertTrue(np.all(archive[4] == archive[3]))
+
+    def test_delta_3(self):
+        """ Test if reference waits for its keyframe.
+        """
+        sequence = Sequence()
+        save_pic = SavePictureThread(
+            target=self.q_b, path="./test_processed/", frame_count=3, sigkill=self.queue_errors, sequence=sequence
+        )
+        # keyframe 0 arrives after its references 1 and 2
+        for idx, item in ((1, FrameRef(0)), (2, FrameRef(0)), (0, np.zeros((5, 5, 3), dtype=np.uint8))):
+            sequence.tag(item, idx)
+            self.q_b.put(item)
+        save_pic.start()
+        save_pic.join()
+        with open("./test_processed/references.csv") as file:
+            self.assertEqual(file.read(), "index,reference\n1,0\n2,0\n")
+        self.assertEqual(sorted(os.listdir("./test_processed/")), ["0.png", "references.csv"])
+
+    def test_delta_4(self):
+        """ Test if references resolve to their own keyframes when several Consumers
+        change order of keyframes.
+        """
+        pictures = []
+        for k in range(8): # big and small keyframes, each followed by unchanged pictures
+            shape = (600, 800, 3) if k % 2 == 0 else (60, 80, 3)
+            pictures += [np.full(shape, 20 * k + 10, dtype=np.uint8) for _ in range(3)]
+        sequence = Sequence()
+        producer = ProducerThread(
+            target=self.q_a,
+            sigkill=self.queue_errors,
+            frame_count=None,
+            delay_frame=0,
+            source=ListSource(pictures),
+            delta=DeltaDetector(),
+            sequence=sequence,
+        )
+        consumers = ConsumerPool(
+            target=(self.q_a, self.q_b), sigkill=self.queue_errors, frame_count=None, workers=4, sequence=sequence
+        )
+        save_pic = SavePictureThread(
+            target=self.q_b, path="./test_processed/", frame_count=None, sigkill=self.queue_errors, sequence=sequence
+        )
+        for thread in (producer, consumers, save_pic):
+            thread.start()
+        for thread in (producer, consumers, save_pic):
+            thread.join()
+        with open("./test_processed/references.csv") as file:
+            references = dict(tuple(map(int, line.split(","))) for line in file.readlines()[1:])
+        colors = collections.Counter()
+        for idx in range(len(pictures)):
+            saved = cv2.imread(f"./test_processed/{references.get(idx, idx)}.png")
+            colors[int(saved[0, 0, 0])] += 1
+        self.assertEqual(colors, collections.Counter(int(picture[0, 0, 0]) for picture in pictures))
+
+
+class TestFused(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue()
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+
+    def test_fused_1(self):
+        """ Test if fused kernel gives exactly the same result as reduce_size and apply_filter.
+        """
+        for resize_ratio, kernel in ((2, 5), (1.5, 3), (3, 7)):
+            consumer = ConsumerThread(
+                target=(self.q_a, self.q_b),
+                sigkill=self.queue_errors,
+                resize_ratio=resize_ratio,
+                kernel=kernel,
+                interpolation=cv2.INTER_NEAREST,
+            )
+            for picture in (Source((768, 1024, 3)).get_data(), cv2.imread('./test_pictures/test_0.png')):
+                expected = consumer.apply_filter(consumer.reduce_size(picture))
+                self.assertTrue(np.array_equal(resize_median(picture, resize_ratio, kernel), expected))
+                self.assertTrue(np.array_equal(resize_median(picture, resize_ratio, kernel, rows=7), expected))
+
+    def test_fused_2(self):
+        picture = Source((101, 53, 3)).get_data()
+        with concurrent.futures.ThreadPoolExecutor(3) as executor:
+            result = resize_median(picture, 2, 5, rows=4, executor=executor)
+        expected = cv2.medianBlur(cv2.resize(picture, (26, 50), interpolation=cv2.INTER_NEAREST), 5)
+        self.assertTrue(np.array_equal(result, expected))
+
+    def test_consumption_fused(self):
+        for _ in range(5):
+            self.q_a.put(Source((100, 50, 3)).get_data())
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b),
+            sigkill=self.queue_errors,
+            frame_count=5,
+            mode="fused",
+        )
+        consumer.start()
+        consumer.join()
+        self.assertEqual(self.q_b.qsize(), 5)
+        self.assertEqual(self.q_b.get().shape, (50, 25, 3))
+
+
+class TestFramePool(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue()
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+        self.pool = FramePool(size=4)
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_pool_1(self):
+        buffer = self.pool.acquire((10, 10, 3))
+        self.pool.release(buffer)
+        self.assertIs(self.pool.acquire((10, 10, 3)), buffer)
+        self.pool.release(np.empty((10, 10, 3), dtype=np.uint8)) # ignored, not from pool
+        self.assertEqual(self.pool.allocations, 1)
+
+    def test_pool_2(self):
+        for _ in range(4):
+            self.pool.acquire((10, 10, 3))
+        with self.assertRaises(queue.Empty):
+            self.pool.acquire((10, 10, 3), timeout=0.01)
+        self.pool.acquire((10, 10), dtype=np.float32)
+
+    def test_source_out(self):
+        buffer = np.zeros((100, 50, 3), dtype=np.uint8)
+        self.assertIs(Source((100, 50, 3)).get_data(out=buffer), buffer)
+        self.assertGreater(buffer.std(), 0)
+
+    def test_source_memory(self):
+        """ Test if Source fills buffer without temporary array of the size of frame.
+        """
+        buffer = np.empty((768, 1024, 3), dtype=np.uint8)
+        source = Source((768, 1024, 3))
+        source.get_data(out=buffer)
+        tracemalloc.start()
+        try:
+            for _ in range(3):
+                source.get_data(out=buffer)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, buffer.nbytes // 8)
+
+    def test_pipeline(self):
+        producer = ProducerThread(
+            target=self.q_a,
+            frame_count=30,
+            picture_shape=(100, 50),
+            sigkill=self.queue_errors,
+            delay_frame=0,
+            pool=self.pool,
+        )
+        consumer = ConsumerThread(
+            target=(self.q_a, self.q_b),
+            frame_count=30,
+            sigkill=self.queue_errors,
+            pool=self.pool,
+        )
+        save_pic = SavePictureThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=30,
+            sigkill=self.queue_errors,
+            pool=self.pool,
+        )
+        for thread in (producer, consumer, save_pic):
+            thread.start()
+        for thread in (producer, consumer, save_pic):
+            thread.join()
+        self.assertEqual(len(os.listdir("./test_processed/")), 30)
+        self.assertLessEqual(self.pool.allocations, 8) # at most size buffers of each shape
+
+
+class TestProcessBackend(unittest.TestCase):
+    def setUp(self):
+        self.q_a = multiprocessing.Queue()
+        self.q_b = multiprocessing.Queue()
+        self.queue_errors = multiprocessing.Queue()
+        self.ring_a = FrameRing((100, 50, 3), slots=4)
+        self.ring_b = FrameRing((50, 25, 3), slots=4)
+
+    def tearDown(self):
+        for ring in (self.ring_a, self.ring_b):
+            ring.close()
+            ring.unlink()
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_ring(self):
+        slot = self.ring_a.acquire()
+        self.ring_a.frames[slot] = 7
+        self.assertEqual(self.ring_a.frames.shape, (4, 100, 50, 3))
+        self.assertTrue(np.all(self.ring_a.frames[slot] == 7))
+        self.ring_a.release(slot)
+
+    def test_processes_1(self):
+        counter = multiprocessing.Value("i", 0)
+        processes = [
+            ProducerProcess(
+                target=self.q_a,
+                ring=self.ring_a,
+                frame_count=12,
+                sigkill=self.queue_errors,
+                delay_frame=0,
+            ),
+            *[
+                ConsumerProcess(
+                    target=(self.q_a, self.q_b),
+                    ring=(self.ring_a, self.ring_b),
+                    frame_count=12,
+                    sigkill=self.queue_errors,
+                    counter=counter,
+                )
+                for _ in range(2)
+            ],
+            SavePictureProcess(
+                target=self.q_b,
+                ring=self.ring_b,
+                path="./test_processed/",
+                frame_count=12,
+                sigkill=self.queue_errors,
+            ),
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(counter.value, 12)
+        self.assertEqual(len(os.listdir("./test_processed/")), 12)
+        self.assertEqual(cv2.imread("./test_processed/0.png").shape, (50, 25, 3))
+
+    def test_processes_2(self):
+        with self.assertRaises(AssertionError):
+            ConsumerProcess(
+                target=(self.q_a, queue.Queue()),
+                ring=(self.ring_a, self.ring_b),
+                sigkill=self.queue_errors,
+            )
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+        for i in range(12):
+            self.q_b.put(np.full((50, 25, 3), i, dtype=np.uint8))
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_writers_1(self):
+        """ Test if index of file follows order of pictures in queue.
+        """
+        save_pic = SavePictureThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=12,
+            sigkill=self.queue_errors,
+            writers=3,
+            compression=1,
+        )
+        save_pic.start()
+        save_pic.join()
+        for i in range(12):
+            self.assertTrue(np.all(cv2.imread(f"./test_processed/{i}.png") == i))
+
+    def test_writers_2(self):
+        for fmt in ("webp", "tiff", "npy"):
+            save_pic = SavePictureThread(
+                target=self.q_b,
+                path="./test_processed/",
+                frame_count=4,
+                sigkill=self.queue_errors,
+                writers=2,
+                fmt=fmt,
+            )
+            save_pic.start()
+            save_pic.join()
+        self.assertTrue(np.all(cv2.imread("./test_processed/3.webp") == 3))
+        self.assertTrue(np.all(cv2.imread("./test_processed/3.tiff") == 7))
+        self.assertTrue(np.all(np.load("./test_processed/3.npy") == 11))
+
+    def test_writers_4(self):
+        """ Test if picture that failed to write is not counted as saved.
+        """
+        pictures = [self.q_b.get() for _ in range(12)]
+        pictures[5] = np.zeros((50, 25, 7), dtype=np.uint8) # png can not hold 7 channels
+        for picture in pictures:
+            self.q_b.put(picture)
+        save_pic = SavePictureThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=12,
+            sigkill=self.queue_errors,
+            writers=2,
+        )
+        save_pic.start()
+        save_pic.join()
+        self.assertEqual(self.queue_errors.get_nowait(), save_pic.name)
+        self.assertLess(save_pic.saved, 12)
+        self.assertEqual(save_pic.saved, len(os.listdir("./test_processed/")))
+
+    def test_writers_3(self):
+        with self.assertRaises(AssertionError):
+            SavePictureThread(
+                target=self.q_b,
+                path="./test_processed/",
+                sigkill=self.queue_errors,
+                fmt="jpg",
+            )
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+        for i in range(10):
+            self.q_b.put(np.full((50, 25, 3), i, dtype=np.uint8))
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_archive_1(self):
+        save_archive = SaveArchiveThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=10,
+            sigkill=self.queue_errors,
+        )
+        save_archive.start()
+        save_archive.join()
+        archive = FrameArchive("./test_processed/frames.archive")
+        self.assertEqual(len(archive), 10)
+        self.assertIsInstance(archive[3], np.memmap)
+        for i in range(10):
+            self.assertTrue(np.all(archive[i] == i))
+        archive.to_png("./test_processed/png/")
+        self.assertEqual(len(os.listdir("./test_processed/png/")), 10)
+        self.assertTrue(np.all(cv2.imread("./test_processed/png/7.png") == 7))
+
+    def test_archive_3(self):
+        """ Test if only frames that fit in the archive are counted as saved.
+        """
+        save_archive = SaveArchiveThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=10,
+            sigkill=self.queue_errors,
+            capacity=4,
+        )
+        save_archive.start()
+        save_archive.join()
+        self.assertEqual(self.queue_errors.get_nowait(), save_archive.name)
+        self.assertEqual(save_archive.saved, 4)
+        self.assertEqual(len(FrameArchive("./test_processed/frames.archive")), 4)
+
+    def test_archive_2(self):
+        os.mkdir("./test_processed")
+        archive = FrameArchive.create("./test_processed/test.archive", 4, (5, 5, 3))
+        archive.append(np.ones((5, 5, 3), dtype=np.uint8), 2)
+        self.assertEqual(archive.count, 1)
+        with self.assertRaises(KeyError):
+            archive[0]
+        self.assertTrue(np.all(archive[2] == 1))
+        for idx in (3, 0, 1): # out of order, record of frame 3 is freed by truncate
+            archive.append(np.full((5, 5, 3), idx, dtype=np.uint8), idx)
+        archive.truncate(3)
+        self.assertEqual(archive.append(np.full((5, 5, 3), 3, dtype=np.uint8), 3), 1)
+        self.assertEqual(list(archive.index), [2, 3, 0, 1])
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue()
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for ms in range(1, 101):
+            histogram.record(ms / 1000)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.05, delta=0.01)
+        self.assertAlmostEqual(histogram.quantile(0.99), 0.099, delta=0.02)
+        self.assertEqual(histogram.quantile(1), 0.1)
+
+    def test_metrics_pipeline(self):
+        metrics = Metrics()
+        metrics.add_queue("a", self.q_a)
+        threads = [
+            ProducerThread(
+                target=self.q_a,
+                frame_count=20,
+                picture_shape=(100, 50),
+                sigkill=self.queue_errors,
+                delay_frame=0,
+                metrics=metrics,
+            ),
+            ConsumerThread(
+                target=(self.q_a, self.q_b),
+                frame_count=20,
+                sigkill=self.queue_errors,
+                batch_size=4,
+                metrics=metrics,
+            ),
+            SavePictureThread(
+                target=self.q_b,
+                path="./test_processed/",
+                frame_count=20,
+                sigkill=self.queue_errors,
+                metrics=metrics,
+            ),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics.sample_queues()
+        snapshot = json.loads(json.dumps(metrics.snapshot()))
+        for stage in ("Producer", "Consumer", "SavePicture"):
+            self.assertEqual(snapshot["stages"][stage]["frames"], 20)
+        self.assertEqual(snapshot["stages"]["Consumer"]["queue"]["count"], 20)
+        self.assertGreater(snapshot["stages"]["SavePicture"]["latency"]["p50"], 0)
+        self.assertEqual(snapshot["queues"]["a"]["samples"], 1)
+        output = io.StringIO()
+        MetricsReporter(metrics, file=output).report()
+        self.assertIn("SavePicture: 20 frames", output.getvalue())
+
+
+class TestPipeline(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_pipeline_1(self):
+        counter = itertools.count()
+        results = {}
+        pipeline = Pipeline(
+            [
+                Stage("source", lambda: next(counter)),
+                Stage("add", lambda x: x + 1, workers=3, maxsize=4),
+                Stage("double", lambda x: 2 * x, fuse=True),
+                Stage("odd", lambda x: x if x % 4 else None), # drops every second item
+                Stage("sink", results.__setitem__, workers=2, indexed=True),
+            ],
+            frame_count=40,
+        )
+        stats = pipeline.run()
+        self.assertEqual(results, {i: 2 * i + 2 for i in range(0, 40, 2)})
+        self.assertEqual(len(pipeline.queues), 4) # double is fused with add
+        self.assertEqual(stats["stages"]["double"]["frames"], 40)
+        self.assertEqual(stats["stages"]["sink"]["frames"], 20)
+        with self.assertRaises(ValueError): # fused stage has no own workers
+            Stage("double", lambda x: 2 * x, workers=2, fuse=True)
+
+    def test_pipeline_2(self):
+        """ Test if error in one stage stops the pipeline with endless source.
+        """
+        def fail(x):
+            if x == 10:
+                raise ValueError(x)
+            return x
+
+        counter = itertools.count()
+        pipeline = Pipeline([
+            Stage("source", lambda: next(counter)),
+            Stage("fail", fail, workers=2, maxsize=2),
+            Stage("sink", lambda x: x),
+        ])
+        with self.assertRaises(PipelineError):
+            pipeline.run()
+        self.assertEqual(pipeline.failed_stage, "fail")
+
+    def test_pipeline_3(self):
+        """ Test if source returning None ends the pipeline.
+        """
+        pictures = iter([Source((100, 50, 3)).get_data() for _ in range(6)])
+        os.mkdir("./test_processed")
+        Pipeline([
+            Stage("source", lambda: next(pictures, None)),
+            Stage("resize", lambda picture: cv2.resize(picture, (25, 50)), workers=2),
+            Stage("median", lambda picture: cv2.medianBlur(picture, 5), fuse=True),
+            Stage("save", lambda idx, picture: cv2.imwrite(f"./test_processed/{idx}.png", picture), indexed=True),
+        ]).run()
+        self.assertEqual(len(os.listdir("./test_processed/")), 6)
+
+
+class TestAdaptive(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue(maxsize=10)
+        self.q_b = queue.Queue(maxsize=10)
+        self.queue_errors = queue.Queue()
+
+    def test_set_maxsize(self):
+        for i in range(10):
+            self.q_a.put(i)
+        set_maxsize(self.q_a, 11)
+        self.q_a.put(10, timeout=0.1)
+        self.assertEqual(self.q_a.qsize(), 11)
+
+    def test_resize_pool(self):
+        q_a, q_b = queue.Queue(), queue.Queue()
+        for _ in range(10):
+            q_a.put(Source((100, 50, 3)).get_data())
+        pool = ConsumerPool(
+            target=(q_a, q_b),
+            sigkill=self.queue_errors,
+            frame_count=30,
+            workers=1,
+        )
+        pool.start()
+        pool.resize(3)
+        self.assertEqual(len(pool.active), 3)
+        for _ in range(20):
+            q_a.put(Source((100, 50, 3)).get_data())
+        pool.resize(1)
+        pool.join()
+        self.assertEqual(pool.counter.count, 30)
+        self.assertEqual(q_b.qsize(), 30)
+        self.assertEqual(len(pool.threads), 3)
+
+    def test_controller(self):
+        producer = ProducerThread(
+            target=self.q_a,
+            picture_shape=(100, 50),
+            sigkill=self.queue_errors,
+            delay_frame=0,
+        )
+        pool = ConsumerPool(
+            target=(self.q_a, self.q_b),
+            sigkill=self.queue_errors,
+            workers=1,
+        )
+        controller = AdaptiveController(
+            producer=producer,
+            consumers=pool,
+            queues=(self.q_a, self.q_b),
+            memory_budget=100 * (100 * 50 * 3 + 50 * 25 * 3),
+            max_workers=4,
+        )
+        controller.step(0.2)
+        self.assertEqual(self.q_a.maxsize, 99) # 100 frames fit in budget, one is in Consumer
+        for _ in range(60): # Consumer is not running, queue A fills up
+            self.q_a.put(Source((100, 50, 3)).get_data())
+        producer.produced = 60
+        controller.step(0.2)
+        self.assertGreater(producer.delay_frame, 0)
+        self.assertEqual(pool.workers, 2)
+        self.assertEqual(self.q_a.maxsize, 98)
+
+
+class FiniteSource(Source):
+    def __init__(self, source_shape, frames):
+        super().__init__(source_shape)
+        self.frames = frames
+
+    def get_data(self, out=None):
+        if self.frames == 0:
+            return None
+        self.frames -= 1
+        return super().get_data(out=out)
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.q_a = queue.Queue()
+        self.q_b = queue.Queue()
+        self.queue_errors = queue.Queue()
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def run_stream(self, producer, sink, **kwargs):
+        pool = ConsumerPool(
+            target=(self.q_a, self.q_b),
+            sigkill=self.queue_errors,
+            frame_count=None,
+            workers=3,
+            **kwargs,
+        )
+        for thread in (producer, pool, sink):
+            thread.start()
+        return pool
+
+    def test_streaming_1(self):
+        """ Test if all frames of finite source are saved and EOS stops all threads.
+        """
+        producer = ProducerThread(
+            target=self.q_a,
+            sigkill=self.queue_errors,
+            frame_count=None,
+            delay_frame=0,
+            source=FiniteSource((100, 50, 3), 17),
+        )
+        save_pic = SavePictureThread(
+            target=self.q_b, path="./test_processed/", frame_count=None, sigkill=self.queue_errors
+        )
+        pool = self.run_stream(producer, save_pic, batch_size=4)
+        for thread in (producer, pool, save_pic):
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(pool.counter.count, 17)
+        self.assertEqual(len(os.listdir("./test_processed/")), 17)
+        self.assertTrue(self.q_a.empty() and self.q_b.empty())
+        self.assertTrue(self.queue_errors.empty())
+
+    def test_streaming_2(self):
+        """ Test if frames taken before stop are saved to archive.
+        """
+        producer = ProducerThread(
+            target=self.q_a,
+            sigkill=self.queue_errors,
+            frame_count=None,
+            picture_shape=(100, 50),
+            delay_frame=0.01,
+            pool=FramePool(size=4),
+        )
+        save_archive = SaveArchiveThread(
+            target=self.q_b,
+            path="./test_processed/",
+            frame_count=None,
+            sigkill=self.queue_errors,
+            capacity=1000,
+            pool=producer.pool,
+        )
+        pool = self.run_stream(producer, save_archive, pool=producer.pool)
+        producer.join(timeout=0.2)
+        producer.stop()
+        for thread in (producer, pool, save_archive):
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+        archive = FrameArchive("./test_processed/frames.archive")
+        self.assertGreater(producer.produced, 0)
+        self.assertEqual(archive.count, producer.produced)
+
+    def test_streaming_3(self):
+        """ Test if producer puts EOS when it stops before frame_count frames.
+        """
+        producer = ProducerThread(
+            target=self.q_a,
+            sigkill=self.queue_errors,
+            frame_count=10,
+            delay_frame=0,
+            source=FiniteSource((100, 50, 3), 3),
+        )
+        producer.start()
+        producer.join()
+        self.assertEqual(self.q_a.qsize(), 4)
+        self.assertTrue(list(self.q_a.queue)[-1] is EOS)
+        with self.assertRaises(AssertionError):
+            SaveArchiveThread(target=self.q_b, frame_count=None, sigkill=self.queue_errors)
+
+
+class TestAsyncio(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def run_pipelines(self, executor, count, **kwargs):
+        pipelines = [
+            AsyncPipeline(
+                source_frames(Source((100, 50, 3)), frame_count=7),
+                path=f"./test_processed/{i}/",
+                executor=executor,
+                maxsize=2,
+                **kwargs,
+            )
+            for i in range(count)
+        ]
+
+        async def run_all():
+            return await asyncio.gather(*[pipeline.run() for pipeline in pipelines])
+
+        return asyncio.run(run_all())
+
+    def test_asyncio_1(self):
+        """ Test if pipelines sharing one loop and one executor save all pictures.
+        """
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            self.assertEqual(self.run_pipelines(executor, 3, workers=3), [7, 7, 7])
+        for i in range(3):
+            self.assertEqual(len(os.listdir(f"./test_processed/{i}/")), 7)
+        self.assertEqual(cv2.imread("./test_processed/2/6.png").shape, (50, 25, 3))
+
+    def test_asyncio_4(self):
+        """ Test if files are named by index of picture in source when several Consumers
+        finish pictures out of order.
+        """
+        rng = np.random.default_rng(0)
+        shapes = [(600, 800, 3) if i % 3 == 0 else (20, 30, 3) for i in range(12)]
+        pictures = [rng.integers(0, 256, shape, dtype=np.uint8) for shape in shapes]
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            pipeline = AsyncPipeline(
+                source_frames(ListSource(pictures)), path="./test_processed/", workers=4, executor=executor
+            )
+            self.assertEqual(asyncio.run(pipeline.run()), 12)
+        for idx, picture in enumerate(pictures):
+            self.assertTrue(np.array_equal(cv2.imread(f"./test_processed/{idx}.png"), process_picture(picture)))
+
+    def test_asyncio_2(self):
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            self.assertEqual(self.run_pipelines(executor, 2), [7, 7])
+
+    def test_asyncio_3(self):
+        """ Test if error in image kernel stops the pipeline.
+        """
+        with self.assertRaises(cv2.error):
+            self.run_pipelines(None, 1, kernel=4)
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        os.mkdir("./test_processed")
+        self.q_a = queue.Queue()
+        self.queue_errors = queue.Queue()
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def read_all(self, source, shape):
+        producer = ProducerThread(
+            target=self.q_a,
+            sigkill=self.queue_errors,
+            frame_count=None,
+            picture_shape=shape[:2],
+            delay_frame=0,
+            source=source,
+        )
+        producer.start()
+        producer.join()
+        frames = list(self.q_a.queue)
+        self.assertTrue(frames.pop() is EOS)
+        return frames
+
+    def test_video(self):
+        writer = cv2.VideoWriter(
+            "./test_processed/test.avi", cv2.VideoWriter_fourcc(*"MJPG"), 10, (50, 100)
+        )
+        for i in range(5):
+            writer.write(np.full((100, 50, 3), 40 * i, dtype=np.uint8))
+        writer.release()
+        source = VideoSource("./test_processed/test.avi", prefetch=2)
+        self.assertEqual(source.shape, (100, 50, 3))
+        frames = self.read_all(source, source.shape)
+        self.assertEqual(len(frames), 5)
+        self.assertAlmostEqual(frames[3].mean(), 120, delta=2)
+        self.assertIsNone(source.get_data())
+        source.close()
+
+    def test_directory(self):
+        source = DirectorySource("./test_pictures/", workers=2, prefetch=2)
+        frames = self.read_all(source, (768, 1024, 3))
+        self.assertEqual(len(frames), 3)
+        for i, frame in enumerate(frames):
+            self.assertTrue(np.all(frame == cv2.imread(f"./test_pictures/test_{i}.png")))
+        source.close()
+
+    def test_synthetic(self):
+        out = np.empty((10, 5, 3), dtype=np.uint8)
+        first, second = Source((10, 5, 3), mode="generator", seed=1), Source((10, 5, 3), mode="generator", seed=1)
+        self.assertTrue(np.all(first.get_data(out=out) == second.get_data()))
+        ring = Source((10, 5, 3), mode="ring", ring_size=2)
+        frames = [ring.get_data() for _ in range(3)]
+        self.assertTrue(np.all(frames[0] == frames[2]) and frames[0] is not frames[2])
+        self.assertFalse(np.all(frames[0] == frames[1]))
+        self.assertIs(Source((10, 5, 3), mode="bytes").get_data(out=out), out)
+        self.assertGreater(ring.measure_fps(frames=10), 0)
+        with self.assertRaises(AssertionError):
+            Source((10, 5, 3), mode="noise")
+
+    def test_raw(self):
+        data = np.arange(4 * 10 * 5 * 3, dtype=np.uint8).reshape(4, 10, 5, 3)
+        with open("./test_processed/test.raw", "wb") as file:
+            file.write(data.tobytes() + b"\0" * 7) # incomplete frame is ignored
+        source = RawSource("./test_processed/test.raw", (10, 5, 3))
+        self.assertEqual(len(source), 4)
+        out = np.empty((10, 5, 3), dtype=np.uint8)
+        self.assertIs(source.get_data(out=out), out)
+        self.assertTrue(np.all(out == data[0]))
+        frames = self.read_all(source, (10, 5, 3))
+        self.assertEqual(len(frames), 3)
+        self.assertIsInstance(frames[0], np.memmap)
+        self.assertTrue(np.all(frames[2] == data[3]))
+
+
+class TestDeadlineQueue(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_priority(self):
+        q = DeadlineQueue()
+        q.put("a")
+        q.put("b", priority=1)
+        q.put(EOS)
+        q.put("c")
+        self.assertEqual([q.get() for _ in range(4)], ["b", "a", "c", EOS])
+
+    def test_drop_oldest(self):
+        dropped = []
+        q = DeadlineQueue(maxsize=2, policy="drop-oldest", on_drop=dropped.append)
+        for item in ("a", "b", "c"):
+            q.put(item, timeout=0.1)
+        self.assertEqual((dropped, q.drops["oldest"]), (["a"], 1))
+        self.assertEqual([q.get(), q.get()], ["b", "c"])
+        q.put(EOS)
+        q.put(EOS)
+        with self.assertRaises(queue.Full): # EOS is never dropped
+            q.put("d", block=False)
+
+    def test_drop_late(self):
+        q = DeadlineQueue(maxsize=2, policy="drop-late", lifetime=0.01)
+        q.put("a")
+        q.put("b", deadline=float("inf"))
+        q.put("c", timeout=1, deadline=float("inf")) # waits until "a" is late
+        self.assertEqual((q.drops["late"], q.get(), q.get()), (1, "b", "c"))
+        with self.assertRaises(queue.Empty):
+            q.get(timeout=0.05)
+        q.put("d")
+        time.sleep(0.02)
+        self.assertTrue(q.empty())
+        self.assertEqual(q.drops["late"], 2)
+
+    def test_pipeline(self):
+        """ Test if counted pipeline finishes when frames are dropped.
+        """
+        q_a = DeadlineQueue(maxsize=2, policy="drop-oldest")
+        q_b, queue_errors = queue.Queue(), queue.Queue()
+        threads = [
+            ProducerThread(
+                target=q_a,
+                sigkill=queue_errors,
+                frame_count=30,
+                delay_frame=0,
+                source=Source((768, 1024, 3), mode="ring"), # faster than Consumer
+            ),
+            ConsumerThread(target=(q_a, q_b), sigkill=queue_errors, frame_count=30),
+            SavePictureThread(target=q_b, sigkill=queue_errors, frame_count=30, path="./test_processed/"),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=20)
+            self.assertFalse(thread.is_alive())
+        self.assertGreater(q_a.drops["oldest"], 0)
+        self.assertEqual(len(os.listdir("./test_processed/")) + q_a.drops["oldest"], 30)
+
+    def test_deadline_carried(self):
+        """ Test if deadline is set by Producer and carried by Consumer to queue B.
+        """
+        q_a = DeadlineQueue(policy="drop-late", lifetime=10)
+        q_b = DeadlineQueue(policy="drop-late", lifetime=1000)
+        queue_errors, sequence = queue.Queue(), Sequence()
+        start = time.monotonic()
+        for thread in (
+            ProducerThread(
+                target=q_a, sigkill=queue_errors, frame_count=3, picture_shape=(20, 30), delay_frame=0, sequence=sequence
+            ),
+            ConsumerThread(target=(q_a, q_b), sigkill=queue_errors, frame_count=3, sequence=sequence),
+        ):
+            thread.start()
+            thread.join()
+        deadlines = [deadline for _, _, deadline, item in q_b.queue if item is not EOS]
+        self.assertEqual(len(deadlines), 3)
+        self.assertTrue(all(start + 10 < deadline < time.monotonic() + 10 for deadline in deadlines))
+
+    def test_dropped_keyframe(self):
+        """ Test if references to dropped keyframe are dropped with it.
+        """
+        q_b, queue_errors, sequence = queue.Queue(), queue.Queue(), Sequence()
+        keyframe = np.zeros((5, 5, 3), dtype=np.uint8)
+        sequence.tag(keyframe, 0)
+        sequence.drop(keyframe) # e.g. late in queue A
+        items = [FrameRef(0), np.ones((5, 5, 3), dtype=np.uint8), FrameRef(2), FrameRef(0), EOS]
+        for idx, item in zip((1, 2, 3, 4), items):
+            sequence.tag(item, idx)
+        for item in items:
+            q_b.put(item)
+        save_pic = SavePictureThread(
+            target=q_b, path="./test_processed/", frame_count=None, sigkill=queue_errors, sequence=sequence
+        )
+        save_pic.start()
+        save_pic.join()
+        self.assertEqual((save_pic.saved, save_pic.dropped), (2, 2))
+        with open("./test_processed/references.csv") as file:
+            self.assertEqual(file.read(), "index,reference\n3,2\n")
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        os.makedirs("./test_processed/", exist_ok=True)
+        self.frames = np.random.randint(256, size=(8, 20, 30, 3), dtype=np.uint8)
+        self.frames.tofile("./test_processed/frames.raw")
+        self.queue_errors = queue.Queue()
+
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_journal(self):
+        journal = Journal("./test_processed/journal.txt", batch=3, interval=60)
+        journal.commit(0, 2)
+        self.assertEqual(journal.writes, 0)
+        journal.commit(3) # batch is full
+        self.assertEqual(journal.writes, 1)
+        journal.commit(2)
+        journal.close()
+        with open("./test_processed/journal.txt", "a") as file:
+            file.write("5") # incomplete line of crashed run
+        journal = Journal("./test_processed/journal.txt")
+        self.assertEqual(journal.saved, {0, 1, 2, 3})
+        self.assertEqual(journal.resume_index(), 4)
+        journal.close()
+
+    def run_pipeline(self, sink, frame_count, journal, source=None, workers=1):
+        q_a, q_b = queue.Queue(), queue.Queue()
+        start_index = journal.resume_index()
+        sequence = Sequence()
+        producer = ProducerThread(
+            target=q_a,
+            sigkill=self.queue_errors,
+            frame_count=frame_count,
+            picture_shape=(20, 30),
+            delay_frame=0,
+            source=source or RawSource("./test_processed/frames.raw", (20, 30, 3)),
+            start_index=start_index,
+            sequence=sequence,
+        )
+        consumer = ConsumerPool(
+            target=(q_a, q_b),
+            sigkill=self.queue_errors,
+            frame_count=frame_count - start_index,
+            workers=workers,
+            sequence=sequence,
+        )
+        sink = sink(
+            target=q_b,
+            path="./test_processed/out/",
+            sigkill=self.queue_errors,
+            frame_count=frame_count,
+            start_index=start_index,
+            journal=journal,
+            sequence=sequence,
+        )
+        for thread in (producer, consumer, sink):
+            thread.start()
+        for thread in (producer, consumer, sink):
+            thread.join()
+        journal.close()
+        return producer.produced
+
+    def test_resume_1(self):
+        journal = Journal("./test_processed/out/journal.txt")
+        self.assertEqual(self.run_pipeline(SavePictureThread, 5, journal), 5)
+        journal = Journal("./test_processed/out/journal.txt")
+        self.assertEqual(journal.resume_index(), 5)
+        self.assertEqual(self.run_pipeline(SavePictureThread, 8, journal), 3)
+        self.assertEqual(Journal.load("./test_processed/out/journal.txt"), set(range(8)))
+        for idx in (0, 5, 7):
+            expected = cv2.medianBlur(cv2.resize(self.frames[idx], (15, 10)), 5)
+            self.assertTrue(np.array_equal(cv2.imread(f"./test_processed/out/{idx}.png"), expected))
+
+    def test_resume_2(self):
+        journal = Journal("./test_processed/out/journal.txt")
+        self.run_pipeline(SaveArchiveThread, 5, journal)
+        journal = Journal("./test_processed/out/journal.txt")
+        journal.saved.discard(3) # frames from 3 on are saved again
+        self.assertEqual(self.run_pipeline(SaveArchiveThread, 5, journal), 2)
+        archive = FrameArchive("./test_processed/out/frames.archive")
+        self.assertEqual(archive.count, 5)
+        self.assertEqual(list(archive.index), [0, 1, 2, 3, 4])
+        self.assertTrue(np.array_equal(archive[4], cv2.medianBlur(cv2.resize(self.frames[4], (15, 10)), 5)))
+
+    def test_resume_3(self):
+        """ Test if files and journal use indices of frames in order of Producer,
+        when several Consumers change order of frames.
+        """
+        pictures = [ # big pictures are finished after the next small ones
+            np.random.randint(256, size=(400, 600, 3) if i % 2 == 0 else (20, 30, 3), dtype=np.uint8)
+            for i in range(12)
+        ]
+        journal = Journal("./test_processed/out/journal.txt")
+        self.run_pipeline(SavePictureThread, 8, journal, ListSource(pictures), workers=4)
+        journal = Journal("./test_processed/out/journal.txt")
+        self.assertEqual(journal.saved, set(range(8)))
+        journal.saved.discard(5) # frames from 5 on are saved again
+        self.assertEqual(self.run_pipeline(SavePictureThread, 12, journal, ListSource(pictures), workers=4), 7)
+        self.assertEqual(Journal.load("./test_processed/out/journal.txt"), set(range(12)))
+        consumer = ConsumerThread(target=(queue.Queue(), queue.Queue()), sigkill=self.queue_errors)
+        for idx, picture in enumerate(pictures):
+            saved = cv2.imread(f"./test_processed/out/{idx}.png")
+            self.assertTrue(np.array_equal(saved, consumer.process(picture)))
+
+
+class TestProfiler(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_profiler_1(self):
+        q_a, q_b, queue_errors = queue.Queue(maxsize=2), queue.Queue(), queue.Queue()
+        profiler = SamplingProfiler(path="./test_processed/profile/", interval=0.001)
+        profiler.start()
+        threads = [
+            ProducerThread(target=q_a, sigkill=queue_errors, frame_count=10, picture_shape=(100, 50), delay_frame=0),
+            ConsumerPool(target=(q_a, q_b), sigkill=queue_errors, frame_count=10, workers=2),
+            SavePictureThread(target=q_b, path="./test_processed/", frame_count=10, sigkill=queue_errors),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        profiler.stop()
+        profiler.save()
+        summary = profiler.summary()
+        self.assertEqual(set(summary), {"Producer", "Consumer", "SavePicture"})
+        self.assertEqual(summary["Consumer"]["threads"], 2)
+        files = os.listdir("./test_processed/profile/")
+        self.assertIn("Consumer-1.collapsed", files)
+        with open("./test_processed/profile/SavePicture.collapsed") as file:
+            for line in file:
+                stack, samples = line.rsplit(" ", 1)
+                self.assertTrue(stack.startswith("_bootstrap (threading.py"))
+                self.assertGreater(int(samples), 0)
+
+    def test_profiler_2(self):
+        """ Test if waiting for queue is blocked time, and sleeping is not.
+        """
+        q = queue.Queue()
+        waiting = threading.Thread(target=q.get, name="Consumer")
+        sleeping = threading.Thread(target=time.sleep, args=(0.2,), name="Producer")
+        profiler = SamplingProfiler(interval=0.005)
+        for thread in (waiting, sleeping):
+            thread.start()
+        profiler.start()
+        time.sleep(0.2)
+        q.put(None)
+        for thread in (waiting, sleeping):
+            thread.join()
+        profiler.stop()
+        summary = profiler.summary()
+        self.assertGreater(summary["Consumer"]["blocked"], 0.5 * summary["Consumer"]["wall"])
+        self.assertEqual(summary["Producer"]["blocked"], 0.0)
+        self.assertLess(summary["Producer"]["cpu"], 0.05)
+
+
+    def test_profiler_3(self):
+        """ Test if waiting for buffer of the pool is blocked time.
+        """
+        pool = FramePool(1)
+        buffer = pool.acquire((10, 10, 3))
+        waiting = threading.Thread(target=pool.acquire, args=((10, 10, 3),), name="Producer")
+        profiler = SamplingProfiler(interval=0.005)
+        waiting.start()
+        profiler.start()
+        time.sleep(0.2)
+        pool.release(buffer)
+        waiting.join()
+        profiler.stop()
+        summary = profiler.summary()
+        self.assertGreater(summary["Producer"]["blocked"], 0.5 * summary["Producer"]["wall"])
+
+class TestCli(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree("./test_processed", ignore_errors=True)
+
+    def test_options(self):
+        os.makedirs("./test_processed/", exist_ok=True)
+        with open("./test_processed/config.json", "w") as file:
+            json.dump({"frame_count": 7, "resize_ratio": 3}, file)
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            parse_args(["--config", "./test_processed/config.json"]) # unknown option
+        with open("./test_processed/config.json", "w") as file:
+            json.dump({"frame_count": 7, "resize": 3}, file)
+        options = parse_args(["--config", "./test_processed/config.json", "--resize", "4", "--shape", "20x30"])
+        self.assertEqual((options["frame_count"], options["resize"]), (7, 4)) # command line wins
+        arguments = runner_options({**options, "variants": ["2:5"], "delta": 2.0, "cache_size": 1})
+        self.assertEqual(arguments["picture_shape"], (20, 30))
+        self.assertEqual(arguments["variants"], [(2.0, 5)])
+        self.assertIsInstance(arguments["source"], Source)
+        self.assertIsInstance(arguments["delta"], DeltaDetector)
+        self.assertEqual(arguments["cache"].max_bytes, 2**20)
+        self.assertEqual(arguments["tile_size"], (256, None))
+        self.assertEqual(runner_options(parse_args(["--tile-size", "64x32"]))["tile_size"], (64, 32))
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            parse_args(["--backend", "process", "--sink", "archive"]) # thread backend only
+        for argv in (
+            ["--frames", "0", "--sink", "archive"],
+            ["--sink", "archive", "--capacity", "0"],
+            ["--sink", "archive", "--variants", "2:5", "4:3"],
+        ):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                parse_args(argv) # archive has no capacity or can not hold variants
+        self.assertEqual(parse_args(["--frames", "0", "--sink", "archive", "--capacity", "9"])["capacity"], 9)
+
+    def test_cli(self):
+        os.makedirs("./test_processed/")
+        for backend in ("thread", "process"):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                status = cli(["--backend", backend, "--frames", "6", "--delay", "0", "--shape", "40x60",
+                              "--workers", "2", "--path", f"./test_processed/{backend}/"])
+            self.assertEqual(status, 0)
+            self.assertEqual(len(os.listdir(f"./test_processed/{backend}/")), 6)
+            self.assertTrue(output.getvalue().startswith("6 frames in "))
+
+    def test_cli_interpolation(self):
+        """ Test if nearest-neighbor resize of numpy backend and tiles are used from command line.
+        """
+        os.makedirs("./test_processed/")
+        argv = ["--frames", "2", "--delay", "0", "--shape", "40x60", "--workers", "1", "--interpolation", "nearest",
+                "--tile-size", "8x0", "--kernels", "numpy", "--path", "./test_processed/"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(cli(argv), 0)
+            self.assertEqual(cli([*argv, "--mode", "tiled", "--path", "./test_processed/tiled/"]), 0)
+        self.assertEqual(cv2.imread("./test_processed/1.png").shape, (20, 30, 3))
+        self.assertEqual(len(os.listdir("./test_processed/tiled/")), 2)
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            parse_args(["--interpolation", "bilinear"])
+
+    def test_cli_drops(self):
+        """ Test if frames dropped by queues are reported without metrics.
+        """
+        argv = ["--frames", "5", "--delay", "0", "--shape", "40x60", "--workers", "1", "--path", "./test_processed/",
+                "--queue-policy", "drop-late", "--lifetime", "1e-9"] # every frame is late
+        with contextlib.redirect_stdout(io.StringIO()) as output, self.assertLogs(level="WARNING") as logs:
+            self.assertEqual(cli(argv), 0)
+        self.assertTrue(output.getvalue().startswith("0 frames in "))
+        self.assertIn("queue a: dropped 5 late", logs.output[-1])
+
+    def test_cli_files(self):
+        """ Test if frames of file source are read when --shape differs from them.
+        """
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            status = cli(["--source", "./test_pictures", "--shape", "100x100", "--frames", "3", "--delay", "0",
+                          "--workers", "2", "--path", "./test_processed/"])
+        self.assertEqual(status, 0)
+        self.assertTrue(output.getvalue().startswith("3 frames in "))
+        self.assertEqual(cv2.imread("./test_processed/2.png").shape, (384, 512, 3))
+
+    def test_cli_error(self):
+        """ Test if failed stage gives non-zero exit status.
+        """
+        for backend in ("thread", "process"):
+            argv = ["--backend", backend, "--frames", "4", "--delay", "0", "--shape", "40x60",
+                    "--workers", "2", "--kernel", "4", "--path", "./test_processed/"] # even kernel
+            with contextlib.redirect_stdout(io.StringIO()) as output, self.assertLogs(level="ERROR") as logs:
+                self.assertEqual(cli(argv), 1)
+            self.assertEqual(output.getvalue(), "")
+            self.assertIn("failed, 0 frames saved", logs.output[-1])
+
+    def test_startup(self):
+        """ Test if --help does not import OpenCV.
+        """
+        code = "import sys, main, src.cli; src.cli.make_parser().format_help(); print('cv2' in sys.modules)"
+        imported = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(imported.stdout.strip(), "False")
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_compare(self):
+        config = {"shape": [100, 50], "workers": 1}
+        results = lambda fps: {name: {"fps": fps} for name in ("source", "consumer", "save", "pipeline")}
+        baseline = [{"config": config, "results": results(100)}]
+        self.assertEqual(compare([{"config": config, "results": results(95)}], baseline, 0.1), [])
+        self.assertEqual(len(compare([{"config": config, "results": results(80)}], baseline, 0.1)), 4)
+        other = {"shape": [768, 1024], "workers": 1}
+        self.assertEqual(compare([{"config": other, "results": results(1)}], baseline, 0.1), [])
+
+
 class TestConstructAllThread(unittest.TestCase):
     def setUp(self):
         self.q_a = queue.Queue()